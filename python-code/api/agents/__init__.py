@@ -4,3 +4,4 @@ from .details_agent import DetailsAgent
 from .recommendation_agent import RecommendationAgent
 from .agent_protocol import AgentProtocol
 from .order_taking_agent import OrderTakingAgent
+from .message_history import MessageHistory
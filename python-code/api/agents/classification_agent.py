@@ -1,13 +1,16 @@
 from openai import OpenAI
 import json
 import re
-from copy import deepcopy   # deepcopy copies by value and not by reference
 import os
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory
 from .utils import get_chatbot_response
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("classification")
+
 class ClassificationAgent():
     def __init__(self):
         self.client = OpenAI(
@@ -17,7 +20,7 @@ class ClassificationAgent():
         self.model_name = "phi3"
 
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
         system_prompt = """
         You are a strict JSON-only classification agent for a coffee shop chatbot. 
@@ -68,13 +71,13 @@ class ClassificationAgent():
 
         input_messages.insert(0, {"role": "system", "content": 'CRITICAL: Your response will be parsed by json.loads(). If it is not valid JSON, the program will crash.'})
 
-        print('input_messages(classification agent):', input_messages)
+        logger.debug("Input messages: %s", payload(input_messages), extra=SAMPLED)
 
         chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
-        print('chatbot_output(classification agent):', chatbot_output)
+        logger.debug("Chatbot output: %s", payload(chatbot_output), extra=SAMPLED)
 
         output = self.postprocess(chatbot_output)
-        print('processed output(classification agent):', output)
+        logger.debug("Processed output: %s", output)
 
         return output
 
@@ -112,7 +115,7 @@ class ClassificationAgent():
                         continue
 
         if json_obj is None:
-            print("⚠ No valid JSON found. Using fallback.")
+            logger.warning("No valid JSON found. Using fallback. Output: %s", payload(output))
             return {
                 "role": "assistant",
                 "content": "Sorry I am not sure about it. Please try again.",
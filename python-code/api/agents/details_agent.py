@@ -1,4 +1,3 @@
-from copy import deepcopy
 import os
 
 from dotenv import load_dotenv
@@ -6,10 +5,14 @@ from openai import OpenAI
 from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
 
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory, replace_last_content
 from .utils import get_chatbot_response
 
 load_dotenv()
 
+logger = get_logger("details")
+
 class DetailsAgent:
     def __init__(self):
         # Local LLM client
@@ -41,24 +44,23 @@ class DetailsAgent:
 
     def get_response(self, messages):
         """Generate a chatbot response using retrieved Pinecone knowledge and the local Ollama LLM."""
-        print("Geneting a response using retrieved Pinecone knowledge...")
+        logger.debug("Generating a response using retrieved Pinecone knowledge...")
 
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
         user_message = messages[-1]["content"]
 
         # Create embeddings
         embeddings = self.embedding_model.encode(user_message).tolist()
-        print('embeddings:', embeddings)
 
         # Retrieve similar docs
         result = self.get_closest_results(embeddings)
-        print('result (details_agent):', result)
+        logger.debug("Retrieved: %s", payload(result), extra=SAMPLED)
 
         source_knowledge = "\n".join(
             [doc['metadata']['text'].strip() for doc in result['matches']]
         )
 
-        print('source_knowledge (details_agent):', source_knowledge)
+        logger.debug("Source knowledge: %s", payload(source_knowledge), extra=SAMPLED)
 
         # Construct RAG prompt
         prompt = f"""
@@ -89,18 +91,16 @@ class DetailsAgent:
         - DO NOT use irrelevant words like "endlist", `end of list` or undesirable signs like [] etc.
         """
 
-        # Inject new content into conversation
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        # Inject new content into the last message (as a new message, the transcript stays untouched)
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
         # print('input_messages (details_agent):', input_messages)
 
         # Generate output
         chatbot_output = get_chatbot_response(self.client, self.model_name, input_messages)
-        print('chatbot_output (details_agent):', chatbot_output)
+        logger.debug("Chatbot output: %s", payload(chatbot_output), extra=SAMPLED)
 
         output = self.postprocess(chatbot_output)
-        print('processed output (details_agent):', output)
 
         return output
 
@@ -1,13 +1,16 @@
 from openai import OpenAI
 import json
 import re
-from copy import deepcopy   # deepcopy copies by value and not by reference
 import os
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory
 from .utils import get_chatbot_response
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("guard")
+
 class GuardAgent():
     def __init__(self):
         self.client = OpenAI(
@@ -17,9 +20,9 @@ class GuardAgent():
         self.model_name = "phi3"
 
     def get_response(self, message):
-        print('Calling Guard agent to validate query...')
+        logger.debug("Calling Guard agent to validate query...")
         
-        message = deepcopy(message)
+        message = MessageHistory.coerce(message)
 
         system_prompt = """
         You are an JSON-only agent 
@@ -65,7 +68,7 @@ class GuardAgent():
         - Decision rules must be applied strictly.
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}] + message[-3:]
+        input_messages = [{"role": "system", "content": system_prompt}, *message[-3:]]
 
         # for message in message:
         #     input_messages.append({"role": message["role"], "content": message["content"]})
@@ -92,15 +95,15 @@ class GuardAgent():
             input_messages = [{"role": "system", "content": system_prompt_with_retry}]
 
             chatbot_output = get_chatbot_response(self.client, self.model_name, input_messages)
-            print("Chatbot output (Guard):", chatbot_output)
+            logger.debug("Chatbot output: %s", payload(chatbot_output), extra=SAMPLED)
 
             output = self.postprocess(chatbot_output)
-            print("Processed Output (Guard):", output)
+            logger.debug("Processed output: %s", output)
 
             if output["memory"]["guard_decision"] in ("allowed", "not allowed"):
                 return output
             
-            print(f"⚠ Attempt {turn}/{max_turns}: Guard agent did not produce valid JSON. Retrying...")
+            logger.warning("Attempt %d/%d: Guard agent did not produce valid JSON. Retrying...", turn, max_turns)
 
         # Final fallback: 
         # If the agent fails to produce valid JSON after max_turns, return a default response
@@ -131,13 +134,13 @@ class GuardAgent():
                 if brace_count == 0 and start_idx is not None:
                     try:
                         json_obj = json.loads(output[start_idx:i+1])
-                        print("Expected JSON (Guard):", json_obj)
+                        logger.debug("Extracted JSON: %s", json_obj)
                         break
                     except json.JSONDecodeError:
                         continue
 
         if json_obj is None:
-            print("⚠ No valid JSON found. Returning default response.")
+            logger.warning("No valid JSON found. Returning default response. Output: %s", payload(output))
 
             return {
                 "role": "assistant", 
@@ -0,0 +1,145 @@
+"""Leveled logging for the agents, with the actual I/O done on a background thread.
+
+    logger = get_logger("details")
+    logger.debug("retrieved %s", payload(result), extra=SAMPLED)
+
+Levels are set per component with LOG_LEVEL (default INFO) and LOG_LEVELS,
+e.g. LOG_LEVELS="details=DEBUG,guard=WARNING". Prompts, model outputs,
+embeddings and DataFrames are logged at DEBUG, so at the default level the
+hot path only pays for a level check.
+
+    LOG_FORMAT           text (default) or json, one object per line
+    LOG_PAYLOAD_SAMPLE   fraction of SAMPLED records that are kept (default 1.0)
+    LOG_MAX_FIELD_CHARS  longer payloads are cut down to this size (default 500)
+    LOG_QUEUE_SIZE       records waiting for the writer thread; more are dropped (default 10000)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+ROOT_LOGGER = "agents"
+
+# Pass as extra= to mark a verbose payload record that can be sampled away
+SAMPLED = {"sampled": True}
+
+_listener = None
+
+
+def get_logger(component) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{component}")
+
+
+class payload:
+    """Defers rendering of a big object until a record passes the level check, then trims it.
+
+    Float vectors are reduced to their length, DataFrames to their shape and long
+    strings/containers to LOG_MAX_FIELD_CHARS characters.
+    """
+    __slots__ = ("value",)
+
+    max_chars = 500
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        value = self.value
+        if hasattr(value, "shape") and hasattr(value, "dtype"):
+            return f"<array shape={tuple(value.shape)} dtype={value.dtype}>"
+        if hasattr(value, "shape") and hasattr(value, "columns"):
+            return f"<DataFrame shape={tuple(value.shape)} columns={list(value.columns)}>"
+        if isinstance(value, (list, tuple)) and len(value) > 16 and all(isinstance(v, float) for v in value[:16]):
+            return f"<{len(value)} floats>"
+
+        text = value if isinstance(value, str) else repr(value)
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... <{len(text) - self.max_chars} more chars>"
+        return text
+
+    __repr__ = __str__
+
+
+class _SampleFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1.0 or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the request thread: when the writer falls behind records are dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        return json.dumps(entry, default=str)
+
+
+def _parse_levels(spec):
+    levels = {}
+    for part in spec.split(","):
+        if "=" in part:
+            component, level = part.split("=", 1)
+            levels[component.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, levels=None, fmt=None, stream=None):
+    """Install the queue handler on the 'agents' logger. Safe to call more than once."""
+    global _listener
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    for component, component_level in (levels or _parse_levels(os.getenv("LOG_LEVELS", ""))).items():
+        get_logger(component).setLevel(component_level)
+
+    payload.max_chars = int(os.getenv("LOG_MAX_FIELD_CHARS", str(payload.max_chars)))
+
+    if _listener is not None:
+        return root
+
+    fmt = fmt or os.getenv("LOG_FORMAT", "text")
+    writer = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        writer.setFormatter(JsonFormatter())
+    else:
+        writer.setFormatter(logging.Formatter(
+            "%(asctime)s.%(msecs)03d %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S"
+        ))
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = _DroppingQueueHandler(log_queue)
+    handler.addFilter(_SampleFilter(float(os.getenv("LOG_PAYLOAD_SAMPLE", "1.0"))))
+
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, writer)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return root
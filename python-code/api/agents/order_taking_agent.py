@@ -1,10 +1,13 @@
 import os
 import json 
+from .log import SAMPLED, get_logger, payload
 from .utils import get_chatbot_response, double_check_json_output
 from openai import OpenAI
-from copy import deepcopy
+from .message_history import MessageHistory, thaw
 from dotenv import load_dotenv
 
+logger = get_logger("order_taking")
+
 class OrderTakingAgent:
     def __init__(self, recommendation_agent):
         self.client = OpenAI(
@@ -16,7 +19,7 @@ class OrderTakingAgent:
         self.recommendation_agent = recommendation_agent
 
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
         system_prompt = """
             You are an Order taking agent for a coffee shop called "Merry's way".
@@ -108,15 +111,13 @@ class OrderTakingAgent:
             message = messages[message_index]
             
             agent_name = message.get("memory", {}).get("agent", "")
-            print('agent name: ', agent_name)
             if message.get("role") == "assistant" and agent_name == "order_taking_agent":
                 step_number = message['memory']['step number']
-                order = message['memory']['order']
+                order = thaw(message['memory']['order'])
                 asked_recommendation_before = message['memory']['asked_recommendation_before']
 
-                print('step number: ', step_number)
-                print('order: ', order)
-                print('asked recommendation before: ', asked_recommendation_before)
+                logger.debug("Previous state: step %s, order %s, asked recommendation before: %s",
+                             step_number, order, asked_recommendation_before)
 
                 last_order_taking_status = f"""
                 step number: {step_number}
@@ -140,31 +141,30 @@ class OrderTakingAgent:
         # Add latest user message
         input_messages.append(messages[-1])
 
-        print('input_messages (order taking): ', input_messages)
+        logger.debug("Input messages: %s", payload(input_messages), extra=SAMPLED)
 
         chatbot_response = get_chatbot_response(self.client, self.model_name, input_messages)
-        print('chatbot_response (before double check): ', chatbot_response)
+        logger.debug("Chatbot response (before double check): %s", payload(chatbot_response), extra=SAMPLED)
         
         chatbot_response = double_check_json_output(self.client, self.model_name, chatbot_response)
-        print('chatbot_response (after double check): ', chatbot_response)
+        logger.debug("Chatbot response (after double check): %s", payload(chatbot_response), extra=SAMPLED)
 
         output = self.postprocess(chatbot_response, messages, asked_recommendation_before)
-        print('processed output JSON (order taking): ', output)
+        logger.debug("Processed output: %s", output)
 
         return output
     
     def postprocess(self, output, messages, asked_recommendation_before):
         # output = json.loads(output)
-        print('output (chatbot_response fed to postprocess from get_response): ', output)
 
         output_json = self.safe_json_load(output)
-        print('output_json (in postprocess): ', output_json)
+        logger.debug("Output JSON: %s", output_json)
 
         output_json = self.safe_json_load(output)
 
         # Final fallback
         if not output_json:
-            print("Invalid JSON received. Skipping response.")
+            logger.warning("Invalid JSON received. Skipping response.")
             return {
                 "role": "assistant",
                 "content": "Sorry, I couldn't process that order. Could you repeat it?",
@@ -191,9 +191,7 @@ class OrderTakingAgent:
         response = output_json.get("response", "").strip()
         order_list = output_json.get("order", [])
 
-        print("In postprocess:")
-        print('response: ', response)
-        print('order list: ', order_list)
+        logger.debug("Response: %s, order list: %s", payload(response), order_list)
 
         # if not asked_recommendation_before and len(output['order']) > 0:
         #     recommendation_output = self.recommendation_agent.get_recommendations_from_order(messages, output['order'])
@@ -219,11 +217,10 @@ class OrderTakingAgent:
 
         if not asked_recommendation_before and order_list:
             rec_output = self.recommendation_agent.get_recommendations_from_order(messages, order_list)
-            print('rec_output: ', rec_output)
+            logger.debug("Recommendation output: %s", rec_output)
 
             if isinstance(rec_output, dict) and "content" in rec_output:
                 rec_text = rec_output["content"].strip()
-                print('rec_text: ', rec_text)
 
                 # Simple sanity check to avoid "apocalypse" repeats
                 if rec_text and len(rec_text.split()) > 3 and rec_text.lower() != response.lower():
@@ -244,7 +241,6 @@ class OrderTakingAgent:
     def safe_json_load(self, output: str):
         """Extract the first valid JSON object from a string."""
 
-        print("output (fed to safe_json_load from postprocess):", output)
 
         json_obj = None
         brace_count = 0
@@ -259,7 +255,6 @@ class OrderTakingAgent:
                 if brace_count == 0 and start_idx is not None:
                     try:
                         json_obj = json.loads(output[start_idx:i+1])
-                        print("json_obj (in safe_json_load):", json_obj)
                         return json_obj
                     except json.JSONDecodeError:
                         continue
@@ -281,5 +276,5 @@ class OrderTakingAgent:
         try:
             return json.loads(repaired)
         except json.JSONDecodeError:
-            print("safe_json_load: Model failed to repair JSON")
+            logger.warning("safe_json_load: Model failed to repair JSON")
             return None
@@ -2,13 +2,16 @@ from openai import OpenAI
 import pandas as pd
 import json
 import re
-from copy import deepcopy   # deepcopy copies by value and not by reference
 import os
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory, replace_last_content
 from .utils import get_chatbot_response, double_check_json_output
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("recommendation")
+
 class RecommendationAgent:
     def __init__(self, apriori_recommendation_path, popularity_recomendation_path):
         self.client = OpenAI(
@@ -41,15 +44,13 @@ class RecommendationAgent:
         for product in products:
             if product in self.apriori_recommendations:
                 # recommendation_list.extend(self.apriori_recommendations[product][:top_k])
-                print('ordered product one:', product)
+                logger.debug("Ordered product: %s", product)
 
                 recommendation_list += self.apriori_recommendations[product]
-                print('apriori recommendations list:', self.apriori_recommendations[product])
-                print('recommendation list:', recommendation_list)
 
         # Sort recommendation list based on "confidence" in descending order
         recommendation_list = sorted(recommendation_list, key=lambda x: x['confidence'], reverse=True)
-        print('sorted recommendation list:', recommendation_list)
+        logger.debug("Sorted recommendation list: %s", payload(recommendation_list), extra=SAMPLED)
 
         recommendations = []
         recommendations_per_category = {}
@@ -79,8 +80,7 @@ class RecommendationAgent:
     def get_popular_recommendations(self, product_categories=None, top_k=5):
         recommendation_df = self.popularity_recommendations
 
-        print('product_categories:', product_categories)
-        print('type(product_categories):', type(product_categories))
+        logger.debug("Product categories: %r", product_categories)
 
         if type(product_categories) == str:
             product_categories = [product_categories]
@@ -88,11 +88,10 @@ class RecommendationAgent:
         if product_categories is not None:
             recommendation_df = self.popularity_recommendations[self.popularity_recommendations['product_category'].isin(product_categories)]
 
-        print('recommendation_df:', recommendation_df)
 
         # sort by number of transactions (most popular at the top)
         recommendation_df = recommendation_df.sort_values('number_of_transactions', ascending=False)
-        print('sorted recommendation_df:', recommendation_df)
+        logger.debug("Sorted recommendations: %s", payload(recommendation_df), extra=SAMPLED)
 
         if recommendation_df.shape[0] == 0:
             return []
@@ -137,17 +136,17 @@ class RecommendationAgent:
 
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}] + message
+        input_messages = [{"role": "system", "content": system_prompt}, *message]
         # print('input messages (rec classification):', input_messages)
 
         chatbot_response = get_chatbot_response(self.client,self.model_name,input_messages)
-        print('chatbot response (rec classification):', chatbot_response)
+        logger.debug("Chatbot response (classification): %s", payload(chatbot_response), extra=SAMPLED)
 
         chatbot_response = double_check_json_output(self.client,self.model_name,chatbot_response)
-        print('chatbot response after double check (rec classification):', chatbot_response)
+        logger.debug("Chatbot response after double check (classification): %s", payload(chatbot_response), extra=SAMPLED)
 
         output = self.postprocess_classfication(chatbot_response)
-        print('final output (classification):', output)
+        logger.debug("Final output (classification): %s", output)
 
         return output
     
@@ -157,7 +156,7 @@ class RecommendationAgent:
         try:
             output = json.loads(output)
         except json.JSONDecodeError:
-            print("Invalid JSON from model:", output)
+            logger.warning("Invalid JSON from model: %s", payload(output))
             return {
                 "recommendation_type": "popular",   # fallback   
                 "parameters": []
@@ -179,7 +178,7 @@ class RecommendationAgent:
         chain_of_thought = output.get('chain_of_thought', None)
 
         if recommendation_type not in ["apriori", "popular", "popular by category"]:
-            print("Unexpected or missing recommendation_type:", output)
+            logger.warning("Unexpected or missing recommendation_type: %s", output)
             return {
                 "chain_of_thought": chain_of_thought,
                 "recommendation_type": "popular",   # fallback
@@ -193,17 +192,16 @@ class RecommendationAgent:
         }
     
     def get_recommendations_from_order(self, messages, order): 
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
         products = []
         for item in order:
             products.append(item.get('product') or item.get('item'))
 
         recommendations = self.get_apriori_recommendations(products)
-        print('recommendations (from order):', recommendations)
+        logger.debug("Recommendations (from order): %s", recommendations)
 
         recommendations_str = ", ".join(recommendations)
-        print('recommendations_str (from order):', recommendations_str)
 
         system_prompt = f"""
         You are a helpful AI assistant for a coffee shop application.
@@ -225,8 +223,7 @@ class RecommendationAgent:
 
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
         chatbot_response = get_chatbot_response(self.client,self.model_name,input_messages)
         
@@ -235,16 +232,14 @@ class RecommendationAgent:
         return output
     
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
-        print('Calling Recommendation Classifier to understand user intent...')
+        logger.debug("Calling Recommendation Classifier to understand user intent...")
         recommendation_classification = self.recommendation_classification(messages)
         recommendation_type = recommendation_classification['recommendation_type']
         # parameters = recommendation_classification['parameters']
 
-        print('recommendation_classification:', recommendation_classification)
-        print('recommendation_type:', recommendation_type)
-        print('parameters:', recommendation_classification['parameters'])
+        logger.debug("Recommendation classification: %s", recommendation_classification)
 
         recommendations = []
 
@@ -258,11 +253,10 @@ class RecommendationAgent:
         if recommendations == []:
             return {"role": "assistant", "content": "I'm sorry, I can't help with that recommendation. Can I help you with something else?"}
         
-        print('recommendations (get_response):', recommendations)
+        logger.debug("Recommendations: %s", recommendations)
 
         # Respond to user
         recommendation_str = ", ".join(recommendations)
-        print('recommendation_str (get_response):', recommendation_str)
 
         system_prompt = f"""
         You are a helpful AI assistant for a coffee shop.
@@ -278,16 +272,14 @@ class RecommendationAgent:
         Please recommend these items exactly: {recommendation_str}        
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
-        print('input_messages (recommendation get_response):', input_messages)
+        logger.debug("Input messages: %s", payload(input_messages), extra=SAMPLED)
 
         chatbot_response = get_chatbot_response(self.client,self.model_name,input_messages)
-        print('chatbot_response (recommendation):', chatbot_response)
+        logger.debug("Chatbot response: %s", payload(chatbot_response), extra=SAMPLED)
 
         output = self.postprocess(chatbot_response)
-        print('post-processed output (recommendation):', output)
 
         # return chatbot_response
         return output
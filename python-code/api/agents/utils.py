@@ -1,9 +1,14 @@
+from .log import get_logger
+
+logger = get_logger("llm")
+
+
 def get_chatbot_response(client, model_name, messages, temperature=0.0):
     input_messages = []
     for message in messages: 
         input_messages.append({"role": message["role"], "content": message["content"]})
 
-    print("Attempting to get LM response...")
+    logger.debug("Attempting to get LM response...")
 
     response = client.chat.completions.create(
         model=model_name,
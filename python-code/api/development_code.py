@@ -3,8 +3,10 @@ from agents import (GuardAgent,
                     DetailsAgent,
                     RecommendationAgent,
                     OrderTakingAgent,
-                    AgentProtocol
+                    AgentProtocol,
+                    MessageHistory
                     )
+from agents.log import configure_logging
 import os
 from typing import Dict
 import pathlib
@@ -15,11 +17,14 @@ from rich.markdown import Markdown
 folder_path = pathlib.Path(__file__).parent.resolve()
 console = Console()
 
-def beautify_output(agent: str, text: str):
-    # Cleanup text
+def clean_output_text(text: str):
     text = re.sub(r'\n\s*\n+', '\n\n', text)   # collapse extra newlines
     text = re.sub(r' {2,}', ' ', text)         # collapse extra spaces
-    text = text.strip()                        # remove leading/trailing spaces
+    return text.strip()                        # remove leading/trailing spaces
+
+def beautify_output(agent: str, text: str):
+    # Cleanup text
+    text = clean_output_text(text)
 
     # Render as markdown (so that Italics, Bold etc. work)
     md = Markdown(text)
@@ -38,6 +43,7 @@ def beautify_output(agent: str, text: str):
 
 
 def main():
+    configure_logging()
 
     guard_agent = GuardAgent()
     classification_agent = ClassificationAgent()
@@ -52,7 +58,7 @@ def main():
         "order_taking_agent": OrderTakingAgent(recommendation_agent)
     }
 
-    messages = []
+    messages = MessageHistory()
 
     while True:
         # clear previous inputs
@@ -69,7 +75,7 @@ def main():
             print("\nExiting conversation. Goodbye!")
             break   # exit the while loop
 
-        messages.append({"role": "user", "content": user_prompt})
+        messages = messages.append({"role": "user", "content": user_prompt})
         # beautify_output("User", user_prompt)
 
         # get guard agent's response
@@ -79,14 +85,14 @@ def main():
         # guard_agent_response = beautify_output("Guard", guard_agent_response['content'])
 
         if guard_agent_response["memory"]["guard_decision"] == "not allowed":
-            messages.append(guard_agent_response)
+            messages = messages.append(guard_agent_response)
             continue
 
         # get classification agent's response
         classification_agent_response = classification_agent.get_response(messages)
 
         if classification_agent_response["memory"]["classification_decision"] == "unsure":
-            messages.append(classification_agent_response)
+            messages = messages.append(classification_agent_response)
             continue
 
         chosen_agent = classification_agent_response["memory"]["classification_decision"]
@@ -98,7 +104,7 @@ def main():
         # beautify_output(chosen_agent, agent_response["content"])
         print("\nAgent's Response: ", agent_response)
 
-        messages.append(agent_response)
+        messages = messages.append(agent_response)
     
 
 
@@ -1,24 +1,50 @@
-from agents import (GuardAgent, 
-                    ClassificationAgent, 
+from agents import (GuardAgent,
+                    ClassificationAgent,
                     DetailsAgent,
                     RecommendationAgent,
                     OrderTakingAgent,
-                    AgentProtocol
+                    AgentProtocol,
+                    MessageHistory
                     )
+from agents.log import configure_logging, get_logger, payload
+from agents.message_history import with_content
+from agents.query_splitter import create_query_splitter, join_parts
+from agents.recommendation_agent import recommendation_context
+from agents.tracing import span
+from agents.usage import track_turn
+from session_store import Session, SessionConflictError, SessionStore, create_session_store
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import os
-from typing import Dict
+from typing import Dict, Optional
 import pathlib
 import re
 
 folder_path = pathlib.Path(__file__).parent.resolve()
 
+logger = get_logger("controller")
+
+# Order of the merged reply when one message went to several agents
+AGENT_REPLY_ORDER = ("order_taking_agent", "details_agent", "recommendation_agent")
+
+
+def submit_with_context(pool, fn, *args):
+    """pool.submit, but `fn` runs in a copy of the caller's context, so the
+    current span and the turn's usage tracking carry over into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
 class AgentController:
-    def __init__(self):
+    def __init__(self, session_store: Optional[SessionStore] = None):
+        configure_logging()
+
         self.guard_agent = GuardAgent()
         self.classification_agent = ClassificationAgent()
         self.recommendation_agent = RecommendationAgent(
                 os.path.join(folder_path, "recommendation_objects/apriori_recommendations.json"),
-                os.path.join(folder_path, "recommendation_objects/popularity_recommendation.csv")
+                os.path.join(folder_path, "recommendation_objects/popularity_recommendation.csv"),
+                os.path.join(folder_path, "recommendation_objects/customer_affinity.npz"),
+                os.path.join(folder_path, "recommendation_objects/popularity_cube.npz")
             )
 
         self.agent_dict: Dict[str, AgentProtocol] = {
@@ -27,11 +53,36 @@ class AgentController:
             "order_taking_agent": OrderTakingAgent(self.recommendation_agent)
         }
 
+        # Only used by session-keyed requests; full-transcript requests stay stateless
+        self.session_store = session_store if session_store is not None else create_session_store()
+
+        # Compound messages ("a latte, also what are your hours?") are routed part by part,
+        # and the agents for the parts run side by side
+        self.query_splitter = create_query_splitter()
+        self.fanout_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AGENT_FANOUT_WORKERS", "16")), thread_name_prefix="agent-fanout"
+        )
+
+    def get_status(self):
+        """What has been loaded, for the readiness probe of the HTTP service."""
+        details_agent = self.agent_dict["details_agent"]
+
+        components = {
+            "llm_client": self.guard_agent.client is not None,
+            "embedding_model": details_agent.embedding_service.ready(),
+            "vector_index": details_agent.vector_store.ready(),
+            "recommendation_objects": bool(self.recommendation_agent.apriori_recommendations)
+                                      and len(self.recommendation_agent.products) > 0,
+            "session_store": self.session_store is not None
+        }
+
+        return {"ready": all(components.values()), "components": components}
+
     def get_response(self, input_body):
         # Extract user input
-        # Format like the one below good for serverless deployment
+        # Two request formats are accepted.
 
-        # Format:
+        # 1. Full transcript (stateless, good for serverless deployment):
         # {
         #     "input": {
         #         "messages": [
@@ -43,26 +94,165 @@ class AgentController:
         #     }
         # }
 
+        # 2. Session delta (history and agent state kept in self.session_store):
+        # {
+        #     "input": {
+        #         "session_id": "...",
+        #         "message": {"role": "user", "content": "..."},
+        #         "version": 3,          # optional, as returned by the previous response
+        #         "etag": "..."          # optional, as returned by the previous response
+        #     }
+        # }
+
+        # Either format may carry "customer_id" (a loyalty customer) for personalized recommendations,
+        # and "outlet_id" (sales_outlet.csv) and "hour" (0-23, default: now) for what sells there and then
+
         job_input = input_body["input"]
-        messages = job_input["messages"]
 
+        with recommendation_context(job_input.get("customer_id"), job_input.get("outlet_id"), job_input.get("hour")):
+            if "session_id" in job_input:
+                return self.get_session_response(job_input)
+
+            messages = MessageHistory(job_input["messages"])
+
+            return self.run_agents(messages)
+
+    def get_session_response(self, job_input):
+        """Handle a session delta request; raises SessionConflictError if the client is out of sync."""
+        session_id = job_input["session_id"]
+        version = job_input.get("version")
+        etag = job_input.get("etag")
+
+        session = self.session_store.load(session_id)
+
+        if session is None:
+            # A client that already had history with us must resync instead of silently starting over
+            if etag is not None or (version is not None and int(version) != 0):
+                raise SessionConflictError(session_id)
+            session = Session(session_id)
+        elif not session.matches(version=version, etag=etag):
+            raise SessionConflictError(session_id, session)
+
+        message = job_input["message"]
+        if isinstance(message, str):
+            message = {"role": "user", "content": message}
+
+        messages = session.history.append(message)
+        response = self.run_agents(messages)
+
+        session = self.session_store.save(session, messages.append(response))
+
+        return {**response, "session": session.describe()}
+
+    def run_agents(self, messages):
+        with span("turn", turn_messages=len(messages)) as turn_span, track_turn(messages) as usage:
+            response = self._run_agents(messages, turn_span)
+
+            turn_span.set_attribute("llm_calls", usage.to_dict()["turn"]["calls"])
+            turn_span.set_attribute("llm_tokens", usage.total_tokens)
+
+            # Token accounting rides along in memory; the next turn reads the session totals back from it
+            memory = {**response.get("memory", {}), "usage": usage.to_dict()}
+            return {**response, "memory": memory}
+
+    def _run_agents(self, messages, turn_span):
         # get guard agent's response
-        guard_agent_response = self.guard_agent.get_response(messages)
-        print("\nGuard Agent's Response: ", guard_agent_response)
+        with span("guard", agent="guard_agent"):
+            guard_agent_response = self.guard_agent.get_response(messages)
+        logger.debug("Guard Agent's response: %s", payload(guard_agent_response))
 
         if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+            turn_span.set_attribute("outcome", "not allowed")
             return guard_agent_response
 
+        if self.query_splitter is not None:
+            parts = self.query_splitter.split(messages[-1]["content"])
+            if len(parts) > 1:
+                return self._run_split(messages, parts, turn_span)
+
         # get classification agent's response
-        classification_agent_response = self.classification_agent.get_response(messages)
+        with span("classification", agent="classification_agent"):
+            classification_agent_response = self.classification_agent.get_response(messages)
 
         if classification_agent_response["memory"]["classification_decision"] == "unsure":
+            turn_span.set_attribute("outcome", "unsure")
             return classification_agent_response
 
         chosen_agent = classification_agent_response["memory"]["classification_decision"]
+        turn_span.set_attribute("outcome", chosen_agent)
 
         # get the chosen agent's response
         agent = self.agent_dict[chosen_agent]
-        response = agent.get_response(messages)
+        with span(chosen_agent, agent=chosen_agent):
+            response = agent.get_response(messages)
+
+        return response
+
+    def _run_split(self, messages, parts, turn_span):
+        """Route every part of a compound message, run the chosen agents concurrently, merge the replies."""
+        def sub_history(text):
+            return messages[:-1].append(with_content(messages[-1], text))
+
+        def classify(index, part):
+            with span("classification", agent="classification_agent", part=index):
+                return self.classification_agent.get_response(sub_history(part))
+
+        with span("split", parts=len(parts)):
+            futures = [submit_with_context(self.fanout_pool, classify, i, part) for i, part in enumerate(parts)]
+            classifications = [future.result() for future in futures]
+
+        # As with a whole message, a part the classifier is unsure about gets its clarifying reply;
+        # anything else it doesn't know goes to the details agent
+        decisions = [classification["memory"]["classification_decision"] for classification in classifications]
+        agents = [decision if decision in self.agent_dict or decision == "unsure" else "details_agent"
+                  for decision in decisions]
+        clarification = next((c for c, agent in zip(classifications, agents) if agent == "unsure"), None)
+
+        runs = self.query_splitter.merge_adjacent(parts, agents)
+        if runs is None:
+            # Too many separate requests to answer each: the whole message goes where most of it was routed
+            chosen_agent = max(agents, key=agents.count)
+            logger.debug("Split into %d parts for %s, routing the message to %s", len(parts), agents, chosen_agent)
+            routed = {chosen_agent: parts}
+        else:
+            # One sub-request per agent: the order agent keeps a single order state per turn
+            routed: Dict[str, list] = {}
+            for agent_name, text in runs:
+                routed.setdefault(agent_name, []).append(text)
+            logger.debug("Split into %d parts: %s", len(parts), routed)
+
+        if len(routed) == 1:
+            # Everything goes to one agent anyway: let it see the message as it was written
+            chosen_agent = next(iter(routed))
+            turn_span.set_attribute("outcome", chosen_agent)
+            if chosen_agent == "unsure":
+                return clarification
+            with span(chosen_agent, agent=chosen_agent):
+                return self.agent_dict[chosen_agent].get_response(messages)
+
+        def run(agent_name, text):
+            if agent_name == "unsure":
+                return clarification
+            with span(agent_name, agent=agent_name):
+                return self.agent_dict[agent_name].get_response(sub_history(text))
+
+        turn_span.set_attribute("outcome", "+".join(sorted(routed)))
+        with span("fanout", agents=len(routed)):
+            futures = {
+                agent_name: submit_with_context(self.fanout_pool, run, agent_name, join_parts(agent_parts))
+                for agent_name, agent_parts in routed.items()
+            }
+            responses = {agent_name: future.result() for agent_name, future in futures.items()}
+
+        return self._merge_responses(responses, routed)
+
+    @staticmethod
+    def _merge_responses(responses, routed):
+        names = sorted(responses, key=lambda name: AGENT_REPLY_ORDER.index(name)
+                       if name in AGENT_REPLY_ORDER else len(AGENT_REPLY_ORDER))
+        content = "\n\n".join(str(responses[name]["content"]).strip() for name in names if responses[name].get("content"))
 
-        return response
\ No newline at end of file
+        # The order agent's memory carries the order state into the next turn, so it leads when present
+        memory = dict(responses[names[0]].get("memory", {}))
+        memory["split"] = [{"agent": name, "request": join_parts(routed[name])} for name in names]
+        return {"role": "assistant", "content": content, "memory": memory}
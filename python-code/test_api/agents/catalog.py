@@ -0,0 +1,113 @@
+"""The product catalog (products.jsonl) with the names, aliases and categories people use for it."""
+import json
+import os
+import pathlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CATALOG_PATH = pathlib.Path(__file__).resolve().parent.parent / "products" / "products.jsonl"
+
+# What customers call things that isn't derivable from the product name
+PRODUCT_ALIASES = {
+    "Latte": ("caffe latte", "cafe latte"),
+    "Espresso shot": ("espresso", "shot of espresso"),
+    "Dark chocolate": ("hot chocolate", "drinking chocolate"),
+    "Carmel syrup": ("caramel syrup", "caramel"),
+    "Sugar Free Vanilla syrup": ("vanilla syrup", "sugar free vanilla"),
+    "Jumbo Savory Scone": ("savory scone", "savoury scone"),
+    "Chocolate Chip Biscotti": ("chocolate biscotti",),
+}
+
+# Recommendation categories (as in the popularity table) and the words that point at them
+CATEGORY_ALIASES = {
+    "Coffee": ("coffee", "coffees", "espresso drinks"),
+    "Bakery": ("bakery", "pastry", "pastries", "baked goods", "scone", "scones", "croissant", "croissants", "biscotti"),
+    "Flavours": ("flavours", "flavors", "flavour", "flavor", "syrup", "syrups"),
+    "Chocolate": ("chocolate", "chocolates", "hot chocolate"),
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Case-folded, NFKC, single-spaced, without surrounding punctuation."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", text).strip().strip("?!.,;:")
+
+
+@dataclass(frozen=True)
+class Product:
+    name: str
+    category: str
+    description: str = ""
+    ingredients: Tuple[str, ...] = ()
+    price: float = 0.0
+    rating: float = 0.0
+    image_path: str = ""
+    aliases: Tuple[str, ...] = field(default=())
+
+
+class Catalog:
+    def __init__(self, products: List[Product]):
+        self.products = products
+        self.by_name: Dict[str, Product] = {normalize_text(p.name): p for p in products}
+
+        self.aliases: Dict[str, Product] = {}
+        for product in products:
+            for alias in (product.name, *product.aliases):
+                self.aliases.setdefault(normalize_text(alias), product)
+
+        self.categories = sorted(set(CATEGORY_ALIASES) | {p.category for p in products})
+
+    def get(self, name) -> Optional[Product]:
+        key = normalize_text(name)
+        return self.by_name.get(key) or self.aliases.get(key)
+
+    def vocabulary(self) -> List[Tuple[str, str, str]]:
+        """(kind, text, target) for every name, alias and category label, for pre-embedding."""
+        entries = []
+        for product in self.products:
+            entries.append(("product", product.name, product.name))
+            entries.extend(("alias", alias, product.name) for alias in product.aliases)
+        for category in self.categories:
+            entries.append(("category", category, category))
+            entries.extend(("category_alias", alias, category) for alias in CATEGORY_ALIASES.get(category, ()))
+        return entries
+
+
+def _derived_aliases(name):
+    aliases = list(PRODUCT_ALIASES.get(name, ()))
+    lowered = name.lower()
+    # "Ginger Scone" -> "ginger scones"
+    if not lowered.endswith("s"):
+        aliases.append(lowered + "s")
+    return tuple(dict.fromkeys(alias for alias in aliases if normalize_text(alias) != normalize_text(name)))
+
+
+def load_catalog_file(path) -> Catalog:
+    products = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            products.append(Product(
+                name=row["name"],
+                category=row["category"],
+                description=row.get("description", ""),
+                ingredients=tuple(row.get("ingredients", ())),
+                price=float(row.get("price", 0.0)),
+                rating=float(row.get("rating", 0.0)),
+                image_path=row.get("image_path", ""),
+                aliases=_derived_aliases(row["name"]),
+            ))
+    return Catalog(products)
+
+
+@lru_cache(maxsize=None)
+def load_catalog() -> Catalog:
+    """The catalog at CATALOG_PATH, loaded once per process."""
+    return load_catalog_file(os.getenv("CATALOG_PATH", str(DEFAULT_CATALOG_PATH)))
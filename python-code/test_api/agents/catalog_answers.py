@@ -0,0 +1,256 @@
+"""Answers to price, ingredient and rating questions straight from the catalog.
+
+"How much is a cappuccino", "what's in the almond croissant" and "what's your
+best-rated pastry" are lookups in products.jsonl; the details agent tries this
+before retrieval and generation. Anything it isn't sure about (no clear intent,
+no confidently matched item, comparisons, dietary questions, long messages, any
+word besides the item and the question) returns None and goes through RAG as
+before.
+
+    CATALOG_FAST_PATH       1 (default) | 0 to always use RAG
+"""
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .catalog import CATEGORY_ALIASES, Catalog, Product, load_catalog, normalize_text
+from .metrics import FAST_PATH_ANSWERS
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+INTENTS = {
+    # "how much is / does / for ...", not "how much sugar is in ..."
+    "price": re.compile(r"\bhow much (?:is|are|does|do|would|will|for|'s|'d)\b|\bprices?\b|\bcosts?\b|\bpriced\b"),
+    "ingredients": re.compile(r"\bwhat'?s in\b|\bwhat is in\b|\bingredients?\b|\bmade (with|of|from)\b|\bcontains?\b"),
+    "rating": re.compile(r"\bratings?\b|\brated\b|\bstars\b|\breviews?\b"),
+}
+BEST = re.compile(r"\b(best|top|highest)[- ]rated\b|\bbest\b|\bfavou?rite\b")
+EXPLICITLY_RATED = re.compile(r"\b(best|top|highest)[- ]rated\b|\bratings?\b")
+
+# Questions that need reasoning over the text, not a lookup
+HAND_OFF = re.compile(
+    r"\b(than|compare|compared|versus|vs|vegan|vegetarian|gluten|dairy|lactose|allerg\w*|nuts?|without|"
+    r"instead|substitut\w*|calories|caffeine|healthy|recommend\w*|suggest\w*|order|buy|add|why|"
+    r"sugar|sugars|milk|protein|fat|fats|carbs?|salt|sodium|caffeinated|many)\b"
+)
+# Everything else a lookup question may say besides product and category names; any other word
+# ("hours", "euros", "size") is something the lookup doesn't answer, so the whole message goes to RAG
+FILLER = frozenset("""
+    a an the your you yours our we us me i my it its this that these those one ones and or s d ll m re ve
+    what whats which how much is are does do did has have can could would will was be please tell know about
+    hi hey hello thanks thank so just again also there here today now
+    price prices priced cost costs for in made with of from ingredient ingredients contain contains inside
+    rating ratings rated stars star reviews review best top highest favorite favourite item items thing menu
+    drink drinks beverage beverages
+""".split())
+MAX_WORDS = 25
+FUZZY_CUTOFF = 0.88
+MAX_ITEMS = 3
+
+# How a category reads in "our best-rated ___"
+CATEGORY_LABELS = {
+    "Bakery": "bakery item",
+    "Coffee": "coffee",
+    "Flavours": "syrup",
+    "Chocolate": "chocolate drink",
+    "Drinking Chocolate": "chocolate drink",
+}
+DRINK_WORDS = {"drink", "drinks", "beverage", "beverages"}
+DRINK_CATEGORIES = ("Coffee", "Drinking Chocolate")
+
+
+@dataclass
+class FastAnswer:
+    text: str
+    intent: str
+    products: Tuple[str, ...] = ()
+
+
+def _words(text):
+    return _WORD.findall(text)
+
+
+def _format_list(items):
+    items = list(items)
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _price(value):
+    return f"${value:.2f}"
+
+
+class CatalogAnswerer:
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        # alias words -> product, longest first so "almond croissant" beats "croissant"
+        self.aliases = {}
+        for alias, product in catalog.aliases.items():
+            self.aliases.setdefault(tuple(_words(alias)), product)
+        self.max_alias_words = max((len(words) for words in self.aliases), default=1)
+        # Fuzzy candidates by first letter (typos rarely hit it), which keeps the fuzzy pass to a few keys
+        self.fuzzy_keys = {}
+        for words, product in self.aliases.items():
+            key = " ".join(words)
+            self.fuzzy_keys.setdefault(key[0], {})[key] = product
+
+        self.category_words = {}
+        for category, aliases in CATEGORY_ALIASES.items():
+            for alias in aliases:
+                self.category_words.setdefault(tuple(_words(alias)), category)
+        self.known_words = FILLER | {word for words in self.category_words for word in words}
+
+    # ---------------------------
+    # Matching
+    # ---------------------------
+    def find_products(self, words) -> Optional[List[Product]]:
+        """Products named in `words`, exact alias first, then close spellings; None if something looked
+        like a product but didn't match confidently."""
+        matched = self.match_products(words)
+        return None if matched is None else matched[0]
+
+    def match_products(self, words) -> Optional[Tuple[List[Product], List[bool]]]:
+        """find_products, plus which of `words` the products were matched on."""
+        found: List[Product] = []
+        covered = [False] * len(words)
+
+        for n in range(min(self.max_alias_words, len(words)), 0, -1):
+            for start in range(len(words) - n + 1):
+                if any(covered[start:start + n]):
+                    continue
+                product = self.aliases.get(tuple(words[start:start + n]))
+                if product is not None:
+                    covered[start:start + n] = [True] * n
+                    if product not in found:
+                        found.append(product)
+
+        # Typos ("capuccino", "almond croisant"): fuzzy-match the words no alias took
+        for n in (2, 1):
+            for start in range(len(words) - n + 1):
+                if any(covered[start:start + n]):
+                    continue
+                phrase = " ".join(words[start:start + n])
+                if len(phrase) < 5:
+                    continue
+                keys = self.fuzzy_keys.get(phrase[0], {})
+                candidates = [key for key in keys if abs(len(key) - len(phrase)) <= 2]
+                close = difflib.get_close_matches(phrase, candidates, n=2, cutoff=FUZZY_CUTOFF)
+                if not close:
+                    continue
+                products = {keys[key] for key in close}
+                if len(products) > 1:
+                    return None
+                covered[start:start + n] = [True] * n
+                product = products.pop()
+                if product not in found:
+                    found.append(product)
+        return found, covered
+
+    def find_categories(self, words):
+        categories = []
+        for n in (2, 1):
+            for start in range(len(words) - n + 1):
+                category = self.category_words.get(tuple(words[start:start + n]))
+                if category and category not in categories:
+                    categories.append(category)
+        if DRINK_WORDS & set(words):
+            categories.extend(category for category in DRINK_CATEGORIES if category not in categories)
+        return categories
+
+    def products_in(self, categories):
+        wanted = {category.lower() for category in categories}
+        return [
+            product for product in self.catalog.products
+            if product.category.lower() in wanted or any(category in product.category.lower() for category in wanted)
+        ]
+
+    # ---------------------------
+    # Answering
+    # ---------------------------
+    def answer(self, message) -> Optional[FastAnswer]:
+        text = normalize_text(message).replace("\u2019", "'")
+        words = _words(text)
+        if not words or len(words) > MAX_WORDS or HAND_OFF.search(text):
+            return self._handoff("none")
+
+        intents = [name for name, pattern in INTENTS.items() if pattern.search(text)]
+        wants_best = bool(BEST.search(text))
+        if not intents and not wants_best:
+            return self._handoff("none")
+
+        matched = self.match_products(words)
+        if matched is None or len(matched[0]) > MAX_ITEMS:
+            return self._handoff(intents[0] if intents else "none")
+        products, covered = matched
+        if any(word not in self.known_words for word, done in zip(words, covered) if not done):
+            # "... and what are your hours", "... in euros": more than the lookup answers
+            return self._handoff(intents[0] if intents else "none")
+
+        if wants_best and not products:
+            return self._best_rated(text, words)
+        if not intents or not products:
+            return self._handoff(intents[0] if intents else "none")
+
+        sentences = []
+        for product in products:
+            for intent in intents:
+                sentences.append(self.render(intent, product))
+        answer = FastAnswer(" ".join(sentences), "+".join(intents), tuple(p.name for p in products))
+        FAST_PATH_ANSWERS.inc(intent=answer.intent, outcome="answered")
+        return answer
+
+    def _best_rated(self, text, words):
+        categories = self.find_categories(words)
+        if not categories and not EXPLICITLY_RATED.search(text):
+            # "what's the best ..." with nothing to rank
+            return self._handoff("best_rated")
+
+        candidates = self.products_in(categories) if categories else list(self.catalog.products)
+        if not candidates:
+            return self._handoff("best_rated")
+
+        top = max(product.rating for product in candidates)
+        best = [product for product in candidates if product.rating == top]
+        if DRINK_WORDS & set(words):
+            label = "drink"
+        elif len(categories) == 1:
+            label = CATEGORY_LABELS.get(categories[0], categories[0].lower())
+        else:
+            label = "item"
+        if len(best) == 1:
+            sentence = f"Our best-rated {label} is the {best[0].name}, rated {top:g} out of 5 by our customers."
+        else:
+            names = _format_list(f"the {product.name}" for product in best)
+            sentence = f"Our best-rated {label}s are {names}, {'both' if len(best) == 2 else 'all'} rated {top:g} out of 5 by our customers."
+
+        FAST_PATH_ANSWERS.inc(intent="best_rated", outcome="answered")
+        return FastAnswer(sentence, "best_rated", tuple(product.name for product in best))
+
+    @staticmethod
+    def render(intent, product: Product):
+        if intent == "price":
+            return f"Our {product.name} is {_price(product.price)}."
+        if intent == "ingredients":
+            ingredients = _format_list(ingredient.lower() for ingredient in product.ingredients)
+            return f"Our {product.name} is made with {ingredients}."
+        if intent == "rating":
+            return f"Our {product.name} is rated {product.rating:g} out of 5 by our customers."
+        raise ValueError(f"Unknown intent '{intent}'")
+
+    @staticmethod
+    def _handoff(intent):
+        FAST_PATH_ANSWERS.inc(intent=intent, outcome="handoff")
+        return None
+
+
+def create_catalog_answerer() -> Optional[CatalogAnswerer]:
+    """The answerer, or None for CATALOG_FAST_PATH=0 or when there's no catalog."""
+    if os.getenv("CATALOG_FAST_PATH", "1") in ("0", "false", "False"):
+        return None
+    try:
+        return CatalogAnswerer(load_catalog())
+    except FileNotFoundError:
+        return None
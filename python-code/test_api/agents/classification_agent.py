@@ -1,25 +1,25 @@
-import boto3
 import json
 import re
-from copy import deepcopy   # deepcopy copies by value and not by reference
 import os
-from .utils import get_chatbot_response
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory
+from .metrics import FALLBACKS, JSON_FAILURES
+from .utils import get_chatbot_response, create_llm_client
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("classification")
+
 class ClassificationAgent():
     def __init__(self):
-        self.client = boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
-        )
+        self.client = create_llm_client()
 
         self.model_id = "meta.llama3-1-8b-instruct-v1:0"
         self.model_inference_profile = 'arn:aws:bedrock:us-east-1:823413233438:inference-profile/us.meta.llama3-1-8b-instruct-v1:0'
 
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
         system_prompt = """
         You are a strict JSON-only classification agent for a coffee shop chatbot. 
@@ -72,7 +72,7 @@ class ClassificationAgent():
             {"role": "system", "content": system_prompt},
         ]
 
-        input_messages += messages[-8:]
+        input_messages.extend(messages[-8:])
 
         # Only pass the last user message, not assistant messages
         # if messages and messages[-1]['role'] == 'user':
@@ -83,10 +83,10 @@ class ClassificationAgent():
         # print('input_messages(classification agent):', input_messages)
 
         chatbot_output =get_chatbot_response(self.client,self.model_inference_profile,input_messages)
-        print('chatbot_output(classification agent):', chatbot_output)
+        logger.debug("Chatbot output: %s", payload(chatbot_output), extra=SAMPLED)
 
         output = self.postprocess(chatbot_output)
-        print('processed output(classification agent):', output)
+        logger.debug("Processed output: %s", output)
 
         return output
 
@@ -113,7 +113,9 @@ class ClassificationAgent():
                         continue
 
         if json_obj is None:
-            print("⚠ No valid JSON found. Using fallback.")
+            logger.warning("No valid JSON found. Using fallback. Output: %s", payload(output))
+            JSON_FAILURES.inc(agent="classification_agent")
+            FALLBACKS.inc(agent="classification_agent", reason="invalid_json")
             return {
                 "role": "assistant",
                 "content": "Sorry I am not sure about it. Please try again.",
@@ -0,0 +1,141 @@
+"""Shrink retrieved documents to the parts that answer the query, within a token budget.
+
+Documents are split into pieces (the " -- " fields of a product record, the
+sentences and lines of free text), every piece is scored by cosine similarity
+to the query embedding, near-duplicates are dropped and the best pieces are
+packed into the budget. Pieces are scored together with their document's title
+("Latte: price: 4.75"), and go back into the prompt under that title once, in
+document order.
+
+    CONTEXT_COMPRESSION         1 (default) | 0 to paste whole documents as before
+    CONTEXT_TOKEN_BUDGET        tokens of context per query (256)
+    CONTEXT_DEDUP_THRESHOLD     cosine above which a piece counts as a duplicate (0.95)
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+from .usage import estimate_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+@dataclass
+class Piece:
+    document: int
+    position: int
+    text: str
+    tokens: int
+
+    def scored_text(self, title):
+        return f"{title}: {self.text}" if title else self.text
+
+
+@dataclass
+class CompressionResult:
+    text: str
+    original_tokens: int
+    packed_tokens: int
+    pieces: int
+    kept: int
+
+    @property
+    def tokens_saved(self):
+        return self.original_tokens - self.packed_tokens
+
+
+def split_document(text) -> Tuple[str, List[str], str]:
+    """(title, pieces, joiner): the fields of a product record ("Name : description -- price: ..."),
+    the sentences and lines of anything else."""
+    text = text.strip()
+    if " -- " in text:
+        head, *fields = text.split(" -- ")
+        title, _, description = head.partition(" : ")
+        return title.strip(), _sentences(description) + [field.strip() for field in fields if field.strip()], " -- "
+
+    title, _, body = text.partition(": ")
+    if not body:
+        return "", _sentences(text), " "
+    return title.strip(), _sentences(body), " "
+
+
+def _sentences(text):
+    return [piece.strip() for piece in _SENTENCE_END.split(text) if piece and piece.strip()]
+
+
+class ContextCompressor:
+    def __init__(self, embedding_service, token_budget=256, dedup_threshold=0.95):
+        self.embedding_service = embedding_service
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+
+    def compress(self, query_embedding, documents: Sequence[str]) -> CompressionResult:
+        original_tokens = sum(estimate_tokens(text.strip()) for text in documents)
+
+        splits = [split_document(text) for text in documents]
+        pieces = [
+            Piece(document, position, text, estimate_tokens(text))
+            for document, (_, texts, _) in enumerate(splits)
+            for position, text in enumerate(texts)
+        ]
+        if not pieces:
+            return CompressionResult("", original_tokens, 0, 0, 0)
+
+        # Scored with their document's title so "price: 4.75" knows it's the latte's price.
+        # Pieces repeat across queries, so these mostly come from the embedding cache
+        vectors = self.embedding_service.encode_many([piece.scored_text(splits[piece.document][0]) for piece in pieces])
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = vectors @ query
+
+        chosen: List[int] = []
+        titled = set()
+        used = 0
+        for i in np.argsort(-scores, kind="stable"):
+            piece = pieces[i]
+            # The title is written once per document, so it's paid for with the document's first piece
+            cost = piece.tokens + (0 if piece.document in titled else estimate_tokens(splits[piece.document][0]))
+            if used + cost > self.token_budget:
+                # Something smaller further down may still fit
+                continue
+            if chosen and float(np.max(vectors[chosen] @ vectors[i])) >= self.dedup_threshold:
+                continue
+            chosen.append(int(i))
+            titled.add(piece.document)
+            used += cost
+
+        if not chosen:
+            # Budget smaller than any piece: the best piece still beats no context at all
+            chosen = [int(np.argmax(scores))]
+
+        by_document = {}
+        for i in sorted(chosen, key=lambda i: (pieces[i].document, pieces[i].position)):
+            by_document.setdefault(pieces[i].document, []).append(pieces[i].text)
+        lines = []
+        for document, texts in by_document.items():
+            title, _, joiner = splits[document]
+            body = joiner.join(texts)
+            lines.append(f"{title}: {body}" if title else body)
+        text = "\n".join(lines)
+
+        result = CompressionResult(text, original_tokens, estimate_tokens(text), len(pieces), len(chosen))
+        CONTEXT_TOKENS.inc(result.original_tokens, kind="retrieved")
+        CONTEXT_TOKENS.inc(result.packed_tokens, kind="packed")
+        CONTEXT_TOKENS_SAVED.observe(max(result.tokens_saved, 0))
+        return result
+
+
+def create_context_compressor(embedding_service):
+    """The compressor, or None for CONTEXT_COMPRESSION=0."""
+    if os.getenv("CONTEXT_COMPRESSION", "1") in ("0", "false", "False"):
+        return None
+    return ContextCompressor(
+        embedding_service,
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "256")),
+        dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95")),
+    )
@@ -1,66 +1,106 @@
-import boto3
-from copy import deepcopy
-import os
-
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
 
-from .utils import get_chatbot_response
+from .catalog_answers import create_catalog_answerer
+from .context_compressor import create_context_compressor
+from .embeddings import get_embedding_service
+from .faq_store import create_faq_store
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory, replace_last_content
+from .retrieval import create_retriever
+from .tracing import span
+from .utils import get_chatbot_response, create_llm_client
+from .vector_store import create_vector_store
 
 load_dotenv()
 
+logger = get_logger("details")
+
 class DetailsAgent:
     def __init__(self):
-        # AWS Bedrock LLM client
-        self.client = boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
-        )
+        # LLM client (AWS Bedrock unless LLM_BACKEND says otherwise)
+        self.client = create_llm_client()
 
         self.model_id = "meta.llama3-1-8b-instruct-v1:0"
         self.model_inference_profile = 'arn:aws:bedrock:us-east-1:823413233438:inference-profile/us.meta.llama3-1-8b-instruct-v1:0'
 
-        # Embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-        # Pinecone setup
-        self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        self.index_name = os.getenv("PINECONE_INDEX_NAME")
-        self.namespace = os.getenv("PINECONE_NAMESPACE", "ns1")
-
-    def get_closest_results(self, input_embeddings, top_k=2):
-        """Query Pinecone index for the closest matching documents."""
-        index = self.pc.Index(self.index_name)
-        results = index.query(
-            namespace=self.namespace,
-            vector=input_embeddings,
-            top_k=top_k,
-            include_values=False,
-            include_metadata=True
-        )
-        return results
+        # Price / ingredient / rating lookups are answered from the catalog, without retrieval or the LLM
+        self.catalog_answerer = create_catalog_answerer()
+
+        # Embedding model (torch or ONNX, see EMBEDDING_BACKEND) behind the shared cache
+        self.embedding_service = get_embedding_service()
+
+        # Knowledge base: Pinecone, or the local memory-mapped store (VECTOR_STORE=local)
+        self.vector_store = create_vector_store()
+
+        # BM25 fused with the vector scores (RETRIEVAL_MODE=vector for plain top-2)
+        self.retriever = create_retriever(self.vector_store)
+
+        # Only the retrieved sentences/fields that answer the query go into the prompt
+        self.context_compressor = create_context_compressor(self.embedding_service)
+
+        # Answers to the frequent questions, generated offline by build_faq.py
+        self.faq_store = create_faq_store(self.embedding_service.model_name)
+
+    def get_closest_results(self, input_embeddings, top_k=2, query_text=None):
+        """The closest matching documents; hybrid when there's a query text to match words against."""
+        if self.retriever is not None and query_text:
+            return self.retriever.query(input_embeddings, query_text)
+        return self.vector_store.query(input_embeddings, top_k=top_k)
 
     def get_response(self, messages):
-        """Generate a chatbot response using retrieved Pinecone knowledge and the local Ollama LLM."""
-        print("Geneting a response using retrieved Pinecone knowledge...")
+        """Generate a chatbot response using knowledge retrieved from the vector store."""
+        logger.debug("Generating a response using retrieved knowledge...")
 
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
         user_message = messages[-1]["content"]
 
+        if self.catalog_answerer is not None:
+            with span("details.fast_path") as fast_span:
+                fast_answer = self.catalog_answerer.answer(user_message)
+                fast_span.set_attribute("answered", fast_answer is not None)
+            if fast_answer is not None:
+                logger.debug("Answered from the catalog (%s): %s", fast_answer.intent, fast_answer.products)
+                return self.postprocess(fast_answer.text, fast_path=fast_answer.intent)
+
         # Create embeddings
-        embeddings = self.embedding_model.encode(user_message).tolist()
-        print('embeddings:', embeddings)
+        with span("details.encode", model=self.embedding_service.model_name):
+            embeddings = self.embedding_service.encode(user_message)
+
+        if self.faq_store is not None:
+            with span("details.faq") as faq_span:
+                match = self.faq_store.match(embeddings)
+                faq_span.set_attribute("answered", match is not None)
+            if match is not None:
+                logger.debug("Answered from the FAQ store (%s, %.3f)", match.entry.id, match.score)
+                return self.postprocess(match.entry.answer, faq=match.entry.id)
+
+        chatbot_output, _ = self.generate_answer(messages, embeddings)
+        return self.postprocess(chatbot_output)
+
+    def generate_answer(self, messages, embeddings):
+        """RAG over the knowledge base: (answer, ids of the retrieved documents).
+        build_faq.py uses this too, so stored FAQ answers come from the same prompt."""
+        user_message = messages[-1]["content"]
 
         # Retrieve similar docs
-        result = self.get_closest_results(embeddings)
-        print('result (details_agent):', result)
-
-        source_knowledge = "\n".join(
-            [doc['metadata']['text'].strip() for doc in result['matches']]
-        )
-
-        print('source_knowledge (details_agent):', source_knowledge)
+        with span("details.retrieve", index=self.vector_store.name, hybrid=self.retriever is not None) as query_span:
+            result = self.get_closest_results(embeddings, query_text=user_message)
+            query_span.set_attribute("matches", len(result['matches']))
+        logger.debug("Retrieved: %s", payload(result), extra=SAMPLED)
+
+        documents = [doc['metadata']['text'] for doc in result['matches']]
+        if self.context_compressor is not None:
+            with span("details.compress_context") as compress_span:
+                compressed = self.context_compressor.compress(embeddings, documents)
+                compress_span.set_attribute("tokens_before", compressed.original_tokens)
+                compress_span.set_attribute("tokens_after", compressed.packed_tokens)
+            logger.debug("Context: %d -> %d tokens (%d of %d pieces)", compressed.original_tokens,
+                         compressed.packed_tokens, compressed.kept, compressed.pieces)
+            source_knowledge = compressed.text
+        else:
+            source_knowledge = "\n".join(text.strip() for text in documents)
+
+        logger.debug("Source knowledge: %s", payload(source_knowledge), extra=SAMPLED)
 
         # Construct RAG prompt
         prompt = f"""
@@ -83,25 +123,26 @@ class DetailsAgent:
         - Answers should be concise but complete.
         """
 
-        # Inject new content into conversation
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        # Inject new content into the last message (as a new message, the transcript stays untouched)
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
         # print('input_messages (details_agent):', input_messages)
 
         # Generate output
         chatbot_output = get_chatbot_response(self.client, self.model_inference_profile, input_messages)
-        print('chatbot_output (details_agent):', chatbot_output)
-
-        output = self.postprocess(chatbot_output)
-        print('processed output (details_agent):', output)
+        logger.debug("Chatbot output: %s", payload(chatbot_output), extra=SAMPLED)
 
-        return output
+        return chatbot_output, [doc['id'] for doc in result['matches']]
 
-    def postprocess(self, output):
+    def postprocess(self, output, fast_path=None, faq=None):
         """Format output in the required structure."""
+        memory = {"agent": "details_agent"}
+        if fast_path:
+            memory["fast_path"] = fast_path
+        if faq:
+            memory["faq"] = faq
         return {
             "role": "assistant",
             "content": output,
-            "memory": {"agent": "details_agent"}
+            "memory": memory
         }
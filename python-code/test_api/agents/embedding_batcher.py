@@ -0,0 +1,131 @@
+"""Micro-batching for the embedding model, shared by every session in the process.
+
+Callers submit one text and get a future back. A single worker thread takes the
+first waiting request, keeps collecting for up to `max_wait_ms` or until
+`max_batch` texts are queued, runs one batched encode and resolves each future
+with its own row. While a batch is running, new requests pile up for the next
+one. The wait only applies once there is concurrency (the previous batch had
+more than one text), so a lone session never pays for it.
+
+    batcher = EmbeddingBatcher(encoder.encode, max_batch=32, max_wait_ms=2)
+    batcher.encode("What's in a latte?")             # from a thread (blocks)
+    await batcher.encode_async("What's in a latte?") # from a coroutine
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from .log import get_logger
+from .metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT
+
+logger = get_logger("embeddings")
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_fn: Callable[[Sequence[str]], np.ndarray], max_batch=32, max_wait_ms=2.0, name="embeddings"):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        # Held while checking _closed and enqueueing, so nothing lands behind _STOP
+        self._lock = threading.Lock()
+        self._last_batch = 1
+        self._worker = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if not self._closed:
+                self._queue.put((text, future, time.perf_counter()))
+                return future
+        future.set_exception(RuntimeError("EmbeddingBatcher is closed"))
+        return future
+
+    def submit_many(self, texts) -> List[Future]:
+        return [self.submit(text) for text in texts]
+
+    def encode(self, text, timeout=None) -> np.ndarray:
+        return self.submit(text).result(timeout)
+
+    def encode_many(self, texts, timeout=None) -> np.ndarray:
+        futures = self.submit_many(texts)
+        return np.stack([future.result(timeout) for future in futures])
+
+    async def encode_async(self, text) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self, timeout=5.0):
+        """Finish what's queued, then stop the worker."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def _collect(self, first):
+        batch = [first]
+        # Take what's already queued; wait for more only when other sessions are active
+        deadline = time.perf_counter() + (self.max_wait if self._last_batch > 1 else 0.0)
+        stop = False
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        self._last_batch = len(batch)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._process(batch)
+            if stop:
+                # _STOP is always the last item (see submit), so everything queued has been processed
+                return
+
+    def _process(self, batch):
+        # Callers that gave up (a cancelled encode_async cancels its future) get nothing; setting a
+        # result on a cancelled future raises and would kill the worker
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            EMBEDDING_BATCH_WAIT.observe(started - submitted, batcher=self.name)
+        EMBEDDING_BATCH_SIZE.observe(len(batch), batcher=self.name)
+
+        # Identical texts from different sessions are encoded once
+        unique = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = self.encode_fn(unique)
+        except Exception as e:
+            logger.warning("Batched encode of %d texts failed: %s", len(unique), e)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        rows = {text: vector for text, vector in zip(unique, vectors)}
+        for text, future, _ in batch:
+            future.set_result(rows[text])
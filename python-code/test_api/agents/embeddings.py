@@ -0,0 +1,442 @@
+"""Sentence embeddings with a cache in front of the model.
+
+    service = get_embedding_service()
+    service.encode("What's in a latte?")      # float32 vector, cached by normalized text
+
+Lookups go to an in-memory LRU (bounded in bytes), then to an optional SQLite
+store shared across restarts and workers, and only then to the model. The
+catalog's product names, aliases and category labels are embedded at startup
+and pinned, so matching them never costs a model call; nearest_vocabulary()
+maps words the catalog matching didn't recognize ("expresso") onto them.
+
+The model runs either in PyTorch (sentence-transformers) or, without torch, as
+an exported ONNX graph in onnxruntime (see export_embedding_model.py):
+
+    EMBEDDING_BACKEND               torch (default) | onnx
+    EMBEDDING_MODEL                 sentence-transformers model (all-MiniLM-L6-v2)
+    EMBEDDING_ONNX_DIR              exported model directory (models/all-MiniLM-L6-v2-onnx)
+    EMBEDDING_ONNX_QUANTIZED        use the int8 model_int8.onnx (0)
+    EMBEDDING_THREADS               intra-op threads for either backend (0 = library default)
+    EMBEDDING_LOAD                  eager (load + warmup at startup) | lazy (on first use)
+    EMBEDDING_BATCH_SIZE            cache misses from concurrent sessions are encoded together,
+    EMBEDDING_BATCH_WAIT_MS         up to this many texts / this long (32 / 2 ms, size 1 = off)
+    EMBEDDING_CACHE_BYTES           in-memory cache budget (16 MB, 0 disables it)
+    EMBEDDING_CACHE_PATH            SQLite file for the persistent cache (unset = off)
+    EMBEDDING_PRECOMPUTE_CATALOG    embed the catalog vocabulary at startup (1)
+"""
+import importlib.util
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .catalog import load_catalog, normalize_text
+from .embedding_batcher import EmbeddingBatcher
+from .log import get_logger
+from .metrics import (
+    EMBEDDING_CACHE_BYTES, EMBEDDING_CACHE_HIT_RATIO, EMBEDDING_CACHE_REQUESTS, EMBEDDING_ENCODE_SECONDS
+)
+from .tracing import span
+
+logger = get_logger("embeddings")
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_CACHE_BYTES = 16 * 1024 * 1024
+DEFAULT_ONNX_DIR = pathlib.Path(__file__).resolve().parent.parent / "models" / "all-MiniLM-L6-v2-onnx"
+WARMUP_TEXTS = ["What's in a latte?", "Do you have any pastries?", "I'd like a cappuccino and a croissant"]
+
+
+class TorchEncoder:
+    """sentence-transformers in PyTorch, loaded on first use."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, threads=0):
+        self.model_name = model_name
+        self.threads = threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def available(self):
+        return importlib.util.find_spec("sentence_transformers") is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if self.threads:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, texts):
+        return self.load().encode(list(texts))
+
+
+class OnnxEncoder:
+    """The same sentence embeddings from an exported ONNX graph in onnxruntime.
+
+    The directory holds model.onnx (and/or model_int8.onnx), tokenizer.json and
+    embedding_config.json, all written by export_embedding_model.py; nothing is
+    downloaded at runtime. Mean pooling and L2 normalization match all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_dir=DEFAULT_ONNX_DIR, quantized=False, threads=0):
+        self.model_dir = pathlib.Path(model_dir)
+        self.model_file = self.model_dir / ("model_int8.onnx" if quantized else "model.onnx")
+        self.model_name = f"{self.model_dir.name}/{self.model_file.name}"
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._session is not None
+
+    def available(self):
+        return self.model_file.exists() and (self.model_dir / "tokenizer.json").exists()
+
+    def load(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._load()
+        return self._session
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        config_path = self.model_dir / "embedding_config.json"
+        config = json.loads(config_path.read_text()) if config_path.exists() else {}
+
+        tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=config.get("max_seq_length", 256))
+        tokenizer.enable_padding(pad_id=config.get("pad_token_id", 0), pad_token=config.get("pad_token", "[PAD]"))
+        self.normalize = config.get("normalize", True)
+
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(str(self.model_file), options, providers=["CPUExecutionProvider"])
+
+        self._input_names = tuple(i.name for i in session.get_inputs())
+        self._tokenizer = tokenizer
+        self._session = session
+
+    def encode(self, texts, batch_size=32):
+        self.load()
+        encodings = self._tokenizer.encode_batch(list(texts))
+        # Like sentence-transformers: batch similar lengths together so short texts aren't padded to long ones
+        order = sorted(range(len(encodings)), key=lambda i: -len(encodings[i].ids))
+        pooled = np.empty((len(encodings), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = self._encode_batch([encodings[i] for i in rows])
+            if pooled.shape[1] == 0:
+                pooled = np.empty((len(encodings), batch.shape[1]), dtype=np.float32)
+            pooled[rows] = batch
+        return pooled
+
+    def _encode_batch(self, encodings):
+        length = max(len(e.ids) for e in encodings)
+        input_ids = np.array([e.ids[:length] for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask[:length] for e in encodings], dtype=np.int64)
+        # The tokenizer padded to the longest text overall; trim to the longest in this batch
+        length = int(attention_mask.sum(axis=1).max())
+        input_ids, attention_mask = input_ids[:, :length], attention_mask[:, :length]
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids[:length] for e in encodings], dtype=np.int64)
+
+        token_embeddings = self._session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+        # Mean over the real (unpadded) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+def create_encoder(backend=None):
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    threads = int(os.getenv("EMBEDDING_THREADS", "0") or 0)
+
+    if backend == "torch":
+        return TorchEncoder(os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL), threads=threads)
+    if backend == "onnx":
+        return OnnxEncoder(
+            os.getenv("EMBEDDING_ONNX_DIR", str(DEFAULT_ONNX_DIR)),
+            quantized=os.getenv("EMBEDDING_ONNX_QUANTIZED", "0") in ("1", "true", "True"),
+            threads=threads
+        )
+
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}' (expected 'torch' or 'onnx')")
+
+
+class PersistentEmbeddingCache:
+    """Embeddings in SQLite, keyed by model and normalized text."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def get_many(self, model, keys) -> Dict[str, np.ndarray]:
+        found = {}
+        keys = list(keys)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._connection().execute(
+                f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({','.join('?' * len(chunk))})",
+                [model, *chunk]
+            )
+            for text, blob in rows:
+                found[text] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model, items):
+        self._connection().executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+            [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        )
+
+
+class EmbeddingService:
+    def __init__(self, encoder=None, cache_bytes=DEFAULT_CACHE_BYTES, cache_path=None, batch_size=1, batch_wait_ms=2.0):
+        self.encoder = encoder if encoder is not None else TorchEncoder()
+        self.model_name = self.encoder.model_name
+        self.batcher = EmbeddingBatcher(self._encode_batch, batch_size, batch_wait_ms) if batch_size > 1 else None
+        self.cache_bytes = cache_bytes
+        self.persistent = PersistentEmbeddingCache(cache_path) if cache_path else None
+
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+        # Pinned catalog vocabulary: never evicted
+        self._pinned: Dict[str, np.ndarray] = {}
+        self.vocabulary: List[Tuple[str, str, str]] = []
+        self._vocabulary_matrix: Optional[np.ndarray] = None
+        self._vocabulary_source = None
+
+    @property
+    def loaded(self):
+        return self.encoder.loaded
+
+    def ready(self):
+        """Loaded, or (when loading lazily) loadable from what's on disk."""
+        return self.encoder.loaded or self.encoder.available()
+
+    def warmup(self):
+        """Load the model and run one small batch, so the first request doesn't pay for it."""
+        start = time.perf_counter()
+        self.encoder.load()
+        self.encoder.encode(WARMUP_TEXTS)
+        logger.info("Embedding model %s ready in %.2fs", self.model_name, time.perf_counter() - start)
+
+    # ---------------------------
+    # Cache
+    # ---------------------------
+    @staticmethod
+    def _entry_size(key, vector):
+        return vector.nbytes + len(key) + 64
+
+    def _cache_get(self, key):
+        with self._lock:
+            vector = self._pinned.get(key)
+            if vector is None:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+            return vector
+
+    def _cache_put(self, key, vector):
+        size = self._entry_size(key, vector)
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cache_size -= self._entry_size(key, old)
+            self._cache[key] = vector
+            self._cache_size += size
+            while self._cache_size > self.cache_bytes:
+                evicted_key, evicted = self._cache.popitem(last=False)
+                self._cache_size -= self._entry_size(evicted_key, evicted)
+            size_now = self._cache_size
+        EMBEDDING_CACHE_BYTES.set(size_now)
+
+    def _count(self, result, n=1):
+        if not n:
+            return
+        EMBEDDING_CACHE_REQUESTS.inc(n, result=result)
+        with self._lock:
+            self._lookups += n
+            if result != "miss":
+                self._hits += n
+            ratio = self._hits / self._lookups
+        EMBEDDING_CACHE_HIT_RATIO.set(ratio)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_ratio": self._hits / self._lookups if self._lookups else 0.0,
+                "cached": len(self._cache),
+                "cache_bytes": self._cache_size,
+                "pinned": len(self._pinned),
+            }
+
+    # ---------------------------
+    # Encoding
+    # ---------------------------
+    def _encode_batch(self, texts):
+        start = time.perf_counter()
+        vectors = np.asarray(self.encoder.encode(list(texts)), dtype=np.float32)
+        EMBEDDING_ENCODE_SECONDS.observe(time.perf_counter() - start, model=self.model_name)
+        return vectors
+
+    def _run_model(self, texts):
+        if self.batcher is not None and len(texts) < self.batcher.max_batch:
+            # Small requests share a batch with other sessions' requests
+            with span("embedding.encode", model=self.model_name, texts=len(texts), batched=True):
+                return self.batcher.encode_many(texts)
+        with span("embedding.encode", model=self.model_name, texts=len(texts), batched=False):
+            return self._encode_batch(texts)
+
+    def encode(self, text) -> np.ndarray:
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts: Sequence[str]) -> np.ndarray:
+        """One row per text; only texts missing from every cache go to the model, in one batch."""
+        keys = [normalize_text(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        for key in keys:
+            if key not in found:
+                vector = self._cache_get(key)
+                if vector is not None:
+                    found[key] = vector
+        self._count("hit", sum(1 for key in keys if key in found))
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.persistent is not None:
+            stored = self.persistent.get_many(self.model_name, missing)
+            for key, vector in stored.items():
+                found[key] = vector
+                self._cache_put(key, vector)
+            self._count("persistent_hit", sum(1 for key in keys if key in stored))
+            missing = [key for key in missing if key not in stored]
+
+        if missing:
+            # Encode the normalized text, so equal keys always map to the same vector
+            vectors = self._run_model(missing)
+            for key, vector in zip(missing, vectors):
+                vector.setflags(write=False)
+                found[key] = vector
+                self._cache_put(key, vector)
+            if self.persistent is not None:
+                self.persistent.put_many(self.model_name, zip(missing, vectors))
+            missed = set(missing)
+            self._count("miss", sum(1 for key in keys if key in missed))
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    # ---------------------------
+    # Catalog vocabulary
+    # ---------------------------
+    def precompute(self, vocabulary: List[Tuple[str, str, str]]):
+        """Embed and pin (kind, text, target) entries, e.g. Catalog.vocabulary()."""
+        if not vocabulary:
+            return
+        start = time.perf_counter()
+        vectors = self.encode_many([text for _, text, _ in vocabulary])
+        with self._lock:
+            for (_, text, _), vector in zip(vocabulary, vectors):
+                self._pinned[normalize_text(text)] = vector
+            self.vocabulary = list(vocabulary)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            self._vocabulary_matrix = vectors / np.where(norms == 0, 1, norms)
+        logger.info("Precomputed %d vocabulary embeddings in %.2fs", len(vocabulary), time.perf_counter() - start)
+
+    def vocabulary_matrix(self) -> Optional[np.ndarray]:
+        """L2-normalized rows aligned with self.vocabulary (computed on first call when loading lazily)."""
+        if self._vocabulary_matrix is None and self._vocabulary_source is not None:
+            source, self._vocabulary_source = self._vocabulary_source, None
+            self.precompute(source())
+        return self._vocabulary_matrix
+
+    def nearest_vocabulary(self, texts: Sequence[str], min_similarity=0.8) -> List[Optional[Tuple[str, str, str]]]:
+        """The closest (kind, text, target) vocabulary entry to each text, or None below `min_similarity`."""
+        matrix = self.vocabulary_matrix()
+        if matrix is None or not len(texts):
+            return [None] * len(texts)
+        vectors = self.encode_many(texts)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = (vectors / np.where(norms == 0, 1, norms)) @ matrix.T
+        best = similarity.argmax(axis=1)
+        return [self.vocabulary[i] if similarity[row, i] >= min_similarity else None for row, i in enumerate(best)]
+
+
+def _catalog_vocabulary():
+    try:
+        return load_catalog().vocabulary()
+    except FileNotFoundError as e:
+        logger.warning("Catalog not found, skipping vocabulary precompute: %s", e)
+        return []
+
+
+@lru_cache(maxsize=None)
+def get_embedding_service() -> EmbeddingService:
+    """The process-wide service; eager loading warms the model up and precomputes the catalog vocabulary."""
+    service = EmbeddingService(
+        encoder=create_encoder(),
+        cache_bytes=int(os.getenv("EMBEDDING_CACHE_BYTES", str(DEFAULT_CACHE_BYTES))),
+        cache_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+        batch_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "2")),
+    )
+    precompute = os.getenv("EMBEDDING_PRECOMPUTE_CATALOG", "1") not in ("0", "false", "False")
+
+    if os.getenv("EMBEDDING_LOAD", "eager").lower() == "lazy":
+        # Nothing touches the model until the first encode or vocabulary lookup
+        if precompute:
+            service._vocabulary_source = _catalog_vocabulary
+        return service
+
+    service.warmup()
+    if precompute:
+        service.precompute(_catalog_vocabulary())
+    return service
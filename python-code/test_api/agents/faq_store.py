@@ -0,0 +1,171 @@
+"""Precomputed answers to the questions everybody asks.
+
+Opening hours, location, delivery areas, "what's on the menu": build_faq.py
+generates these answers once, with the details agent's own retrieval and
+prompt, and stores them with the embeddings of each question and its
+paraphrases. The details agent looks the query embedding up here before
+retrieval; the closest question above the threshold answers without calling
+the LLM.
+
+The artifact is two files in FAQ_STORE_PATH:
+
+    faq_store.json      {"model", "dimension", "source_hash", "documents", "updated_at", "rows",
+                         "entries": [{"id", "question", "paraphrases", "answer", "sources"}]}
+    faq_vectors.npy     float16, one L2-normalised row per question/paraphrase;
+                        rows[i] is the entry that row i belongs to
+
+An entry remembers the content hash of every document its answer was generated
+from. If one of them has changed since, the entry is stale and the query goes
+through RAG until build_faq.py regenerates it. "documents" is every document id
+in the knowledge base at build time: when one has been added (or renamed) since,
+retrieval might pick it for any question, so every entry is stale until the
+rebuild. A store built with another embedding model is not used at all.
+
+    FAQ_STORE               1 (default) | 0 to always use RAG
+    FAQ_STORE_PATH          folder with the artifact (test_api/faq)
+    FAQ_MATCH_THRESHOLD     cosine similarity needed to serve a stored answer (0.9)
+"""
+import json
+import os
+import pathlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .knowledge_base import knowledge_base_documents
+from .log import get_logger
+from .metrics import FAQ_LOOKUPS, FAQ_SIMILARITY
+
+logger = get_logger("faq")
+
+DEFAULT_FAQ_DIR = pathlib.Path(__file__).resolve().parent.parent / "faq"
+STORE_FILE = "faq_store.json"
+VECTORS_FILE = "faq_vectors.npy"
+
+
+@dataclass
+class FaqEntry:
+    id: str
+    question: str
+    answer: str
+    paraphrases: List[str] = field(default_factory=list)
+    # document id -> content hash the answer was generated from
+    sources: Dict[str, str] = field(default_factory=dict)
+
+    def texts(self):
+        return [self.question] + list(self.paraphrases)
+
+    def is_stale(self, document_hashes):
+        return any(document_hashes.get(doc_id) != digest for doc_id, digest in self.sources.items())
+
+
+@dataclass
+class FaqMatch:
+    entry: FaqEntry
+    question: str
+    score: float
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def read_store(path):
+    """(manifest, vectors) of the artifact in `path`; ({}, None) when there is none."""
+    path = pathlib.Path(path)
+    if not (path / STORE_FILE).exists() or not (path / VECTORS_FILE).exists():
+        return {}, None
+    manifest = json.loads((path / STORE_FILE).read_text())
+    vectors = np.load(path / VECTORS_FILE)
+    return manifest, vectors
+
+
+def added_documents(manifest, document_hashes):
+    """Ids in the knowledge base now that the store was built without (all of them for a store
+    that didn't record its documents)."""
+    return set(document_hashes) - set(manifest.get("documents", {}))
+
+
+class FaqStore:
+    def __init__(self, entries: List[FaqEntry], vectors, rows, model=None, threshold=0.9, document_hashes=None,
+                 added=()):
+        if len(rows) != len(vectors):
+            raise ValueError(f"FAQ store has {len(vectors)} vectors but {len(rows)} rows")
+        self.entries = entries
+        self.vectors = normalize_rows(vectors) if len(vectors) else np.zeros((0, 0), dtype=np.float32)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.model = model
+        self.threshold = threshold
+        self.stale = set()
+        if added:
+            self.stale = {entry.id for entry in entries}
+            logger.warning("Documents added to the knowledge base since the FAQ store was built, answered with "
+                           "RAG until build_faq.py runs: %s", ", ".join(sorted(added)))
+        elif document_hashes is not None:
+            self.stale = {entry.id for entry in entries if entry.is_stale(document_hashes)}
+            if self.stale:
+                logger.warning("FAQ entries out of date with the knowledge base, answered with RAG until "
+                               "build_faq.py runs: %s", ", ".join(sorted(self.stale)))
+
+    @classmethod
+    def load(cls, path=DEFAULT_FAQ_DIR, threshold=0.9, document_hashes=None):
+        manifest, vectors = read_store(path)
+        if vectors is None:
+            raise FileNotFoundError(f"No FAQ store in {path}")
+        entries = [
+            FaqEntry(e["id"], e["question"], e["answer"], e.get("paraphrases", []), e.get("sources", {}))
+            for e in manifest["entries"]
+        ]
+        added = added_documents(manifest, document_hashes) if document_hashes is not None else ()
+        return cls(entries, vectors, manifest["rows"], manifest.get("model"), threshold, document_hashes, added)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def match(self, query_embedding) -> Optional[FaqMatch]:
+        """The stored answer for the closest question, if it's close enough and still up to date."""
+        if not len(self.vectors):
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        row = int(np.argmax(scores))
+        score = float(scores[row])
+        FAQ_SIMILARITY.observe(score)
+
+        if score < self.threshold:
+            FAQ_LOOKUPS.inc(outcome="miss")
+            return None
+        entry = self.entries[self.rows[row]]
+        if entry.id in self.stale:
+            # Not the runner-up: that would be an answer to a different question
+            FAQ_LOOKUPS.inc(outcome="stale")
+            return None
+        FAQ_LOOKUPS.inc(outcome="hit")
+        offset = row - int(np.flatnonzero(self.rows == self.rows[row])[0])
+        return FaqMatch(entry, entry.texts()[offset], score)
+
+
+def current_document_hashes(directory=None):
+    return {document.id: document.content_hash for document in knowledge_base_documents(directory)}
+
+
+def create_faq_store(model_name=None) -> Optional[FaqStore]:
+    """The store, or None for FAQ_STORE=0, when nothing's been built, or when it was built with another model."""
+    if os.getenv("FAQ_STORE", "1") in ("0", "false", "False"):
+        return None
+    path = pathlib.Path(os.getenv("FAQ_STORE_PATH", str(DEFAULT_FAQ_DIR)))
+    # No sources to compare against (e.g. a Pinecone-only deployment): trust the artifact
+    document_hashes = current_document_hashes() or None
+    try:
+        store = FaqStore.load(path, float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9")), document_hashes)
+    except FileNotFoundError:
+        logger.info("No FAQ store in %s (build it with build_faq.py)", path)
+        return None
+    if model_name and store.model and store.model != model_name:
+        logger.warning("FAQ store in %s was built with %s, not %s; not using it", path, store.model, model_name)
+        return None
+    logger.info("FAQ store: %d entries, %d questions, %d stale", len(store), len(store.vectors), len(store.stale))
+    return store
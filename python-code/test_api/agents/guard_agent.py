@@ -1,25 +1,27 @@
-import boto3
 import json
-from copy import deepcopy
-from .utils import get_chatbot_response
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory
+from .metrics import FALLBACKS, JSON_FAILURES
+from .tracing import span
+from .usage import should_downgrade
+from .utils import get_chatbot_response, create_llm_client
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("guard")
+
 class GuardAgent():
     def __init__(self):
-        self.client = boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
-        )
+        self.client = create_llm_client()
 
         self.model_id = "meta.llama3-1-8b-instruct-v1:0"
         self.model_inference_profile = 'arn:aws:bedrock:us-east-1:823413233438:inference-profile/us.meta.llama3-1-8b-instruct-v1:0'
 
     def get_response(self, message):
-        print('Calling Guard agent to validate query...')
+        logger.debug("Calling Guard agent to validate query...")
         
-        message = deepcopy(message)
+        message = MessageHistory.coerce(message)
 
         system_prompt = """
         You are a JSON-only content filter for a coffee shop AI assistant.
@@ -81,7 +83,7 @@ class GuardAgent():
 
         # Get contextual conversation (last 6 messages or all if fewer)
         # This includes enough context for ordering conversations
-        context_messages = message[-6:] if len(message) > 6 else message
+        context_messages = message[-6:]
         
         # Find the latest user message for focused analysis
         latest_user_message = None
@@ -103,11 +105,16 @@ class GuardAgent():
                 "content": msg["content"]
             })
         
-        print("Input Messages (Guard):", input_messages)
+        logger.debug("Input messages: %s", payload(input_messages), extra=SAMPLED)
 
         max_turns = 3
         
         for turn in range(1, max_turns + 1):
+            if turn > 1 and should_downgrade("guard.retry"):
+                # Out of budget is no reason to refuse the user: let the message through unchecked
+                FALLBACKS.inc(agent="guard_agent", reason="over_budget")
+                return self._create_allowed_response("Over the token budget, not retried")
+
             if turn > 1:
                 retry_prompt = f"""
                 RETRY ATTEMPT {turn}/{max_turns}:
@@ -125,29 +132,31 @@ class GuardAgent():
                 """
                 input_messages[0]["content"] = system_prompt + "\n\n" + retry_prompt
             
-            try:
-                chatbot_output = get_chatbot_response(self.client, self.model_inference_profile, input_messages)
-                print(f"Chatbot output (Guard - Turn {turn}):", chatbot_output)
+            with span("guard.attempt", retry=turn):
+                try:
+                    chatbot_output = get_chatbot_response(self.client, self.model_inference_profile, input_messages)
+                    logger.debug("Chatbot output (turn %d): %s", turn, payload(chatbot_output), extra=SAMPLED)
 
-                output = self.postprocess(chatbot_output, latest_user_message, context_messages)
-                print(f"Processed Output (Guard - Turn {turn}):", output)
+                    output = self.postprocess(chatbot_output, latest_user_message, context_messages)
+                    logger.debug("Processed output (turn %d): %s", turn, output)
 
-                # Validate that the decision is correct
-                if output["memory"]["guard_decision"] in ("allowed", "not allowed"):
-                    # Additional validation: check if reasoning makes sense with context
-                    if self._validate_contextual_reasoning(latest_user_message, context_messages, 
-                                                         output["memory"].get("reason", ""), 
-                                                         output["memory"]["guard_decision"]):
-                        return output
+                    # Validate that the decision is correct
+                    if output["memory"]["guard_decision"] in ("allowed", "not allowed"):
+                        # Additional validation: check if reasoning makes sense with context
+                        if self._validate_contextual_reasoning(latest_user_message, context_messages, 
+                                                             output["memory"].get("reason", ""), 
+                                                             output["memory"]["guard_decision"]):
+                            return output
+                        else:
+                            logger.warning("Turn %d: reasoning doesn't match context. Retrying...", turn)
                     else:
-                        print(f"⚠ Turn {turn}: Reasoning doesn't match context. Retrying...")
-                else:
-                    print(f"⚠ Turn {turn}: Invalid decision format. Retrying...")
+                        logger.warning("Turn %d: invalid decision format. Retrying...", turn)
                     
-            except Exception as e:
-                print(f"⚠ Turn {turn}: Error processing response: {e}")
+                except Exception as e:
+                    logger.warning("Turn %d: error processing response: %r", turn, e)
 
         # Final fallback
+        FALLBACKS.inc(agent="guard_agent", reason="max_retries")
         return self._create_error_response("Guard agent failed to provide valid response after multiple attempts")
     
     def _validate_contextual_reasoning(self, user_message, context_messages, reasoning, decision):
@@ -191,6 +200,18 @@ class GuardAgent():
                 
         return True
     
+    def _create_allowed_response(self, reason):
+        """An "allowed" decision the LLM didn't make"""
+        return {
+            "role": "assistant",
+            "content": "",
+            "memory": {
+                "agent": "Guard",
+                "guard_decision": "allowed",
+                "reason": reason
+            }
+        }
+
     def _create_error_response(self, error_msg):
         """Create a standard error response"""
         return {
@@ -237,14 +258,15 @@ class GuardAgent():
                     try:
                         json_str = output[start_idx:i+1]
                         json_obj = json.loads(json_str)
-                        print("Extracted JSON (Guard):", json_obj)
+                        logger.debug("Extracted JSON: %s", json_obj)
                         break
                     except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}")
+                        logger.debug("JSON decode error: %s", e)
                         continue
 
         if json_obj is None:
-            print("⚠ No valid JSON found in output")
+            logger.warning("No valid JSON found in output: %s", payload(output))
+            JSON_FAILURES.inc(agent="guard_agent")
             raise ValueError("No valid JSON found")
 
         # Validate required fields
@@ -0,0 +1,100 @@
+"""The documents behind the details agent's retrieval.
+
+Every *.jsonl file in the products folder contributes one document per product,
+and every text file one document (the about-us and menu texts, with the same
+wording as build_vector_db.ipynb). Ids are stable and derived from the source,
+not from the text, so editing a description updates the same vector:
+
+    product:cappuccino      a row of products.jsonl
+    text:about-us           Merry's_way_about_us.txt
+    text:menu               menu_items_text.txt
+
+build_knowledge_base.py embeds them into the vector store; the lexical index
+reads them from here when the store can't list its documents (Pinecone).
+"""
+import hashlib
+import json
+import os
+import pathlib
+import re
+from dataclasses import dataclass
+from typing import List
+
+from .log import get_logger
+
+logger = get_logger("knowledge_base")
+
+DEFAULT_PRODUCTS_DIR = pathlib.Path(__file__).resolve().parent.parent / "products"
+
+# file name -> (id, prefix the text is stored with)
+TEXT_DOCUMENTS = {
+    "Merry's_way_about_us.txt": ("text:about-us", "Coffee shop Merry's Way about section: "),
+    "menu_items_text.txt": ("text:menu", "Menu Items: "),
+}
+# Text files in the products folder that aren't knowledge
+IGNORED_FILES = {"products_prompt_link.txt"}
+
+_NOT_SLUG = re.compile(r"[^a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class Document:
+    id: str
+    text: str
+    source: str
+
+    @property
+    def content_hash(self):
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+def slugify(name):
+    return _NOT_SLUG.sub("-", name.lower()).strip("-")
+
+
+def products_dir():
+    return pathlib.Path(os.getenv("KNOWLEDGE_BASE_DIR", str(DEFAULT_PRODUCTS_DIR)))
+
+
+def product_text(product):
+    return (
+        f"{product['name']} : {product['description']} -- ingredients: {product['ingredients']} "
+        f"-- price: {product['price']} -- rating: {product['rating']}"
+    )
+
+
+def knowledge_base_documents(directory=None) -> List[Document]:
+    directory = pathlib.Path(directory or products_dir())
+    documents = {}
+
+    for path in sorted(directory.glob("*.jsonl")):
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                product = json.loads(line)
+                doc_id = f"product:{slugify(product['name'])}"
+                if doc_id in documents:
+                    logger.warning("%s: product '%s' is already in %s, keeping the later one",
+                                   path.name, product["name"], documents[doc_id].source)
+                documents[doc_id] = Document(doc_id, product_text(product), path.name)
+
+    for path in sorted(directory.glob("*.txt")):
+        if path.name in IGNORED_FILES:
+            continue
+        doc_id, prefix = TEXT_DOCUMENTS.get(path.name, (f"text:{slugify(path.stem)}", f"{path.stem}: "))
+        documents[doc_id] = Document(doc_id, prefix + path.read_text(), path.name)
+
+    return list(documents.values())
+
+
+def knowledge_base_texts(directory=None) -> List[str]:
+    return [document.text for document in knowledge_base_documents(directory)]
+
+
+def source_hash(documents):
+    """One hash over every (id, content hash): changes whenever any document does."""
+    digest = hashlib.sha256()
+    for document in sorted(documents, key=lambda d: d.id):
+        digest.update(f"{document.id}\0{document.content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,77 @@
+"""BM25 over the knowledge base documents, with an inverted index.
+
+Exact product names ("Ginger Scone price") are where embeddings are weakest
+and word overlap is strongest, so the details agent fuses this with the vector
+scores (see retrieval.py). Results have the vector store's shape:
+{"matches": [{"id", "score", "metadata"}, ...]}.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Sequence
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from have how i in is it me my of on or
+please the this to what whats which with you your
+""".split())
+
+
+def tokenize(text) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # "scones" and "scone" should match; keep short words and "-ss" words whole
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, ids: Sequence[str], texts: Sequence[str], metadata: Sequence[Dict[str, Any]] = None, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.metadata = list(metadata) if metadata is not None else [{"text": text} for text in texts]
+        self.k1 = k1
+        self.b = b
+
+        # term -> [(document, term frequency)]
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        self.lengths = []
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((i, tf))
+
+        n = len(self.ids)
+        self.average_length = (sum(self.lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def query(self, text, top_k=5):
+        scores = self.scores(text)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return {"matches": [
+            {"id": self.ids[i], "score": score, "metadata": self.metadata[i]}
+            for i, score in best
+        ]}
@@ -0,0 +1,145 @@
+import threading
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples."""
+    if isinstance(value, MappingProxyType):
+        return value
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Inverse of freeze(): plain dicts and lists, safe to mutate or json.dumps()."""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def with_content(message, content) -> Dict[str, Any]:
+    """Build a new message with the same role as `message` but a different content."""
+    return {"role": message["role"], "content": content}
+
+
+def replace_last_content(messages, content) -> List[Dict[str, Any]]:
+    """Return `messages` as a new list where the last message carries `content` instead.
+
+    This is what the agents used to do with deepcopy(messages) followed by
+    messages[-1]['content'] = prompt, without touching the transcript.
+    """
+    messages = list(messages)
+    if messages:
+        messages[-1] = with_content(messages[-1], content)
+    return messages
+
+
+class _Store:
+    """Append-only backing list shared by every view of one conversation."""
+    __slots__ = ("items", "lock")
+
+    def __init__(self, items):
+        self.items = items
+        self.lock = threading.Lock()
+
+
+class MessageHistory(Sequence):
+    """Immutable conversation transcript with O(1) slicing and appending.
+
+    Messages are frozen once when they enter the history. Slices are views
+    over the same backing store, and append() only copies when branching off
+    an older point of the conversation, so agents can pass the transcript
+    around without deep-copying it.
+    """
+    __slots__ = ("_store", "_start", "_stop")
+
+    def __init__(self, messages: Iterable[Any] = ()):
+        items = [freeze(message) for message in messages]
+        self._store = _Store(items)
+        self._start = 0
+        self._stop = len(items)
+
+    @classmethod
+    def _view(cls, store, start, stop):
+        view = cls.__new__(cls)
+        view._store = store
+        view._start = start
+        view._stop = stop
+        return view
+
+    @classmethod
+    def coerce(cls, messages) -> "MessageHistory":
+        """Return `messages` unchanged if it already is a history, otherwise freeze it once."""
+        if isinstance(messages, cls):
+            return messages
+        return cls(messages or ())
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                items = self._store.items
+                return MessageHistory(items[self._start + i] for i in range(start, stop, step))
+            stop = max(start, stop)
+            return self._view(self._store, self._start + start, self._start + stop)
+
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("message history index out of range")
+        return self._store.items[self._start + index]
+
+    def __iter__(self) -> Iterator[Mapping[str, Any]]:
+        items = self._store.items
+        for i in range(self._start, self._stop):
+            yield items[i]
+
+    def __reversed__(self) -> Iterator[Mapping[str, Any]]:
+        items = self._store.items
+        for i in range(self._stop - 1, self._start - 1, -1):
+            yield items[i]
+
+    def __repr__(self) -> str:
+        return f"MessageHistory({len(self)} messages)"
+
+    def append(self, message) -> "MessageHistory":
+        """Return a new history with `message` added at the end; this one is unchanged."""
+        frozen = freeze(message)
+        store = self._store
+        with store.lock:
+            if self._stop == len(store.items):
+                store.items.append(frozen)
+                return self._view(store, self._start, self._stop + 1)
+
+        # Someone already appended past this view: branch into a new store
+        items = store.items[self._start:self._stop]
+        items.append(frozen)
+        return self._view(_Store(items), 0, len(items))
+
+    def extend(self, messages: Iterable[Any]) -> "MessageHistory":
+        history = self
+        for message in messages:
+            history = history.append(message)
+        return history
+
+    def last(self, role: Optional[str] = None) -> Optional[Mapping[str, Any]]:
+        """Most recent message, optionally the most recent one with the given role."""
+        for message in reversed(self):
+            if role is None or message.get("role") == role:
+                return message
+        return None
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Plain, mutable list of dicts (e.g. for json.dumps)."""
+        return [thaw(message) for message in self]
@@ -0,0 +1,220 @@
+"""Small Prometheus-style metrics registry (counters and histograms with labels).
+
+Metrics live in the process, so with several workers each one exposes its own
+numbers; scrape every worker or use write_textfile() with a per-process path.
+"""
+import bisect
+import os
+import threading
+from typing import Dict, Iterable, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[:-1]) if state else 0
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            cumulative += state[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (served on /metrics)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the metrics atomically, e.g. for node_exporter's textfile collector."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "agent_stage_duration_seconds", "Time spent in each traced stage of a turn", ("stage",)
+)
+JSON_FAILURES = REGISTRY.counter(
+    "agent_json_failures_total", "Model outputs that could not be parsed as the expected JSON", ("agent",)
+)
+FALLBACKS = REGISTRY.counter(
+    "agent_fallbacks_total", "Times an agent fell back to a default answer", ("agent", "reason")
+)
+LLM_CALLS = REGISTRY.counter(
+    "llm_calls_total", "LLM completions requested", ("agent", "model")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "LLM tokens used, reported by the backend or estimated", ("agent", "model", "kind")
+)
+BUDGET_DOWNGRADES = REGISTRY.counter(
+    "llm_budget_downgrades_total", "Optional LLM stages skipped because the turn or session was over budget", ("stage",)
+)
+EMBEDDING_CACHE_REQUESTS = REGISTRY.counter(
+    "embedding_cache_requests_total", "Embedding lookups by where the vector came from", ("result",)
+)
+EMBEDDING_CACHE_HIT_RATIO = REGISTRY.gauge(
+    "embedding_cache_hit_ratio", "Share of embedding lookups served without running the model"
+)
+EMBEDDING_CACHE_BYTES = REGISTRY.gauge(
+    "embedding_cache_bytes", "Bytes held by the in-memory embedding cache"
+)
+EMBEDDING_ENCODE_SECONDS = REGISTRY.histogram(
+    "embedding_encode_seconds", "Time spent running the embedding model per batch", ("model",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "embedding_batch_size", "Texts per batched encode run by the embedding batcher", ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_BATCH_WAIT = REGISTRY.histogram(
+    "embedding_batch_wait_seconds", "Time an encode request waited in the batcher queue", ("batcher",),
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+CONTEXT_TOKENS = REGISTRY.counter(
+    "context_tokens_total", "Estimated tokens of retrieved context, before (retrieved) and after (packed) compression", ("kind",)
+)
+CONTEXT_TOKENS_SAVED = REGISTRY.histogram(
+    "context_tokens_saved", "Estimated context tokens removed from the prompt per query",
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600)
+)
+FAST_PATH_ANSWERS = REGISTRY.counter(
+    "catalog_fast_path_total", "Details questions answered from the catalog, or handed off to RAG", ("intent", "outcome")
+)
+FAQ_LOOKUPS = REGISTRY.counter(
+    "faq_store_lookups_total", "Details questions looked up in the precomputed FAQ store (hit, miss, stale)", ("outcome",)
+)
+PERSONALIZED_RECOMMENDATIONS = REGISTRY.counter(
+    "personalized_recommendations_total",
+    "Recommendation requests with a customer id: personalized from their history, or global (unknown customer)", ("outcome",)
+)
+POPULARITY_CUBE_LOOKUPS = REGISTRY.counter(
+    "popularity_cube_lookups_total", "Popular recommendations by the popularity cube cell that answered (its specific axes)", ("cell",)
+)
+RECOMMENDATION_TYPE_RESOLUTIONS = REGISTRY.counter(
+    "recommendation_type_resolutions_total",
+    "Recommendation types decided by the local resolver (LLM bypassed) or by the LLM", ("source", "recommendation_type")
+)
+FAQ_SIMILARITY = REGISTRY.histogram(
+    "faq_store_similarity", "Cosine similarity of the closest FAQ question",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0)
+)
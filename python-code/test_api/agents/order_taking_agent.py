@@ -1,16 +1,17 @@
-import boto3
 import json
 import uuid
-from copy import deepcopy
-from .utils import get_chatbot_response, double_check_json_output
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory, thaw
+from .metrics import FALLBACKS, JSON_FAILURES
+from .tracing import span
+from .utils import get_chatbot_response, double_check_json_output, create_llm_client
+
+logger = get_logger("order_taking")
 
 
 class OrderTakingAgent:
     def __init__(self, recommendation_agent):
-        self.client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name="us-east-1"
-        )
+        self.client = create_llm_client()
         self.model_id = "meta.llama3-3-70b-instruct-v1:0"
         self.model_inference_profile = (
             "arn:aws:bedrock:us-east-1:823413233438:inference-profile/us.meta.llama3-3-70b-instruct-v1:0"
@@ -21,13 +22,14 @@ class OrderTakingAgent:
     # Public Method
     # ---------------------------
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = MessageHistory.coerce(messages)
 
         # print("messages:", messages)
 
         # Get previous memory or default values
         memory = self._extract_last_memory(messages)
-        order = memory.get("order", [])
+        # The transcript is read-only, so work on our own copy of the previous order
+        order = thaw(memory.get("order", []))
         step_number = memory.get("step_number", 1)
         asked_recommendation_before = memory.get("asked_recommendation_before", False)
         order_id = memory.get("order_id", str(uuid.uuid4()))
@@ -39,20 +41,22 @@ class OrderTakingAgent:
         # Intent classification using LLM (extract one or multiple actions)
         # ---------------------------
         system_prompt_for_intent_classification = self._build_system_prompt_for_order_intents_classification(user_message)
-        input_messages_for_intent_classification = [{"role": "system", "content": system_prompt_for_intent_classification}] + messages
+        input_messages_for_intent_classification = [{"role": "system", "content": system_prompt_for_intent_classification}, *messages]
 
         # print("Input messages (intent classification):", input_messages_for_intent_classification)
 
-        chatbot_response_for_intent_classification = get_chatbot_response(self.client, self.model_inference_profile, input_messages_for_intent_classification)
-        chatbot_response_for_intent_classification = double_check_json_output(self.client, self.model_inference_profile, chatbot_response_for_intent_classification)
-        output_json_for_intent_classification = self._safe_json_load(chatbot_response_for_intent_classification)
+        with span("order.intent"):
+            chatbot_response_for_intent_classification = get_chatbot_response(self.client, self.model_inference_profile, input_messages_for_intent_classification)
+            chatbot_response_for_intent_classification = double_check_json_output(self.client, self.model_inference_profile, chatbot_response_for_intent_classification)
+            output_json_for_intent_classification = self._safe_json_load(chatbot_response_for_intent_classification)
 
-        print("Output JSON (intent classification):", output_json_for_intent_classification)
+        logger.debug("Output JSON (intent classification): %s", output_json_for_intent_classification)
 
         # ---------------------------
         # Fallback if JSON fails
         # ---------------------------
         if not output_json_for_intent_classification:
+            FALLBACKS.inc(agent="order_taking_agent", reason="intent_json")
             return self._generate_response(
                 "⚠️ Sorry, I couldn't process your order. Could you please rephrase?",
                 order, order_id, step_number, order_finalized
@@ -166,19 +170,7 @@ class OrderTakingAgent:
         # Clean: remove any zero-quantity items
         order = [o for o in order if o.get("quantity", 0) > 0]
 
-        print("Order:", order)
-
-        # ---------------------------
-        # Update memory
-        # ---------------------------
-        memory = {
-            "order": order,
-            "step_number": step_number,
-            "asked_recommendation_before": asked_recommendation_before,
-            "order_id": order_id,
-            "order_finalized": order_finalized
-        }
-        messages[-1]["memory"] = memory
+        logger.debug("Order: %s", order)
 
         # ---------------------------
         # Generate response using LLM
@@ -187,22 +179,24 @@ class OrderTakingAgent:
         system_prompt = self._build_system_prompt(order)
         input_messages = [{"role": "system", "content": system_prompt}]
 
-        print("Input messages (response generation feed):", input_messages)
+        logger.debug("Input messages (response generation feed): %s", payload(input_messages), extra=SAMPLED)
 
-        chatbot_response = get_chatbot_response(self.client, self.model_inference_profile, input_messages)
-        chatbot_response = double_check_json_output(self.client, self.model_inference_profile, chatbot_response)
-        output_json = self._safe_json_load(chatbot_response)
+        with span("order.response"):
+            chatbot_response = get_chatbot_response(self.client, self.model_inference_profile, input_messages)
+            chatbot_response = double_check_json_output(self.client, self.model_inference_profile, chatbot_response)
+            output_json = self._safe_json_load(chatbot_response)
 
         # ---------------------------
         # Fallback if JSON fails
         # ---------------------------
         if not output_json:
+            FALLBACKS.inc(agent="order_taking_agent", reason="response_json")
             return self._generate_response(
                 "⚠️ Sorry, something went wrong generating the response. Could you repeat?",
                 order, order_id, step_number, order_finalized
             )
 
-        print("Output JSON (order taking):", output_json)
+        logger.debug("Output JSON (order taking): %s", output_json)
 
         response = output_json.get("response", None)
 
@@ -407,9 +401,7 @@ class OrderTakingAgent:
         return total
 
     def _generate_order_summary(self, order, total=None):
-        print("Order:", order)
-        for item in order:
-            print("Item:", item["item"], "Quantity:", item["quantity"], "Price:", item["price"])
+        logger.debug("Order: %s", order)
 
         summary = "\n".join([f"- {item['quantity']} x {item['item']} = ${item['quantity'] * float(item['price']):.2f}" for item in order])
         if total is not None:
@@ -439,4 +431,5 @@ class OrderTakingAgent:
                 end_idx = output.rfind("}")
                 return json.loads(output[start_idx:end_idx + 1])
             except:
+                JSON_FAILURES.inc(agent="order_taking_agent")
                 return None
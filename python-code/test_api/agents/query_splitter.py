@@ -0,0 +1,122 @@
+"""Split a compound message into the separate requests it contains.
+
+"I'll have a latte — also what are your hours and what pastry do you
+recommend?" is an order, a details question and a recommendation request. The
+controller routes each part on its own and runs the agents side by side.
+
+Splitting is rule based and errs towards not splitting: sentence ends, dashes,
+semicolons, ", also" / "and also" / "by the way", and "and" followed by a
+question word. A "." only ends a sentence before a capitalized word and not
+after an abbreviation or initial ("Mr. Smith here"). "A latte and a croissant"
+stays one order. Fragments that are only pleasantries ("thanks!", "please")
+stay with the part before them.
+
+Once the parts are routed, adjacent parts for the same agent are merged
+(merge_adjacent); a message that still has more than the maximum goes whole
+to the agent most of its parts were routed to. One with more than twice that
+many parts isn't split at all.
+
+    QUERY_SPLITTER              1 (default) | 0 to route whole messages as before
+    QUERY_SPLITTER_MAX_PARTS    requests per message after merging; more and it goes to one agent (3)
+"""
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+
+_SENTENCE_END = re.compile(r"([?!.])\s+(?=\S)")
+_ABBREVIATIONS = frozenset(
+    "mr mrs ms dr st sr jr prof rev mt ave rd no nos vs etc approx incl min max oz lb lbs pt e.g i.e a.m p.m".split()
+)
+_CLAUSE_BREAK = re.compile(
+    r"\s+[—–]\s*|\s+-{1,2}\s+|\s*;\s*"
+    r"|\s*,\s*(?:and\s+)?(?:also|plus|oh and)\b[,\s]*"
+    r"|\s+and\s+also\b[,\s]*"
+    r"|\s*,?\s*\b(?:btw|by the way)\b[,\s]*",
+    re.IGNORECASE,
+)
+_QUESTION_WORDS = r"what|what's|whats|where|when|how|which|who|do|does|can|could|is|are|any|will|would"
+_AND_QUESTION = re.compile(rf"\s*,?\s+and\s+(?=(?:{_QUESTION_WORDS})\b)", re.IGNORECASE)
+_LEADING_CONNECTIVE = re.compile(r"^(?:and|also|plus|oh|so|then)\b[,\s]*", re.IGNORECASE)
+_FILLER = re.compile(
+    r"^(?:thanks?|thank you|thx|please|pls|ok|okay|cheers|great|perfect|cool|hi|hello|hey)"
+    r"(?: (?:so much|a lot|very much|there|you))*[\s!.,]*$",
+    re.IGNORECASE,
+)
+
+
+def _clean(part):
+    return _LEADING_CONNECTIVE.sub("", part.strip(" ,")).strip()
+
+
+def _sentences(text):
+    """`text` cut after "?" and "!", and after "." when a capitalized word that isn't part of an
+    abbreviation follows."""
+    sentences, start = [], 0
+    for end in _SENTENCE_END.finditer(text):
+        if end.group(1) == ".":
+            word = text[:end.start()].rsplit(None, 1)[-1].lstrip("(\"'").lower()
+            if len(word) == 1 or word in _ABBREVIATIONS or not text[end.end()].isupper():
+                continue
+        sentences.append(text[start:end.start() + 1])
+        start = end.end()
+    sentences.append(text[start:])
+    return sentences
+
+
+class QuerySplitter:
+    def __init__(self, max_parts=3):
+        self.max_parts = max_parts
+
+    def split(self, message) -> List[str]:
+        """The requests in `message`, in order; a single-element list when there's nothing to split."""
+        text = (message or "").strip()
+        if not text:
+            return [text]
+
+        pieces = []
+        for sentence in _sentences(text):
+            for clause in _CLAUSE_BREAK.split(sentence):
+                pieces.extend(_AND_QUESTION.split(clause))
+
+        parts: List[str] = []
+        pending = ""  # a leading "Hi!" waits for the request that follows it
+        for piece in (_clean(piece) for piece in pieces):
+            if not piece:
+                continue
+            if _FILLER.match(piece):
+                if parts:
+                    parts[-1] = f"{parts[-1]} {piece}"
+                else:
+                    pending = f"{pending} {piece}".strip()
+                continue
+            parts.append(f"{pending} {piece}".strip())
+            pending = ""
+
+        if len(parts) > 2 * self.max_parts:
+            return [text]
+        return parts or [text]
+
+    def merge_adjacent(self, parts: Sequence[str], agents: Sequence[str]) -> Optional[List[Tuple[str, str]]]:
+        """(agent, text) runs of adjacent parts routed to the same agent; None if there are more than
+        max_parts of them and the message should be routed whole."""
+        runs: List[Tuple[str, List[str]]] = []
+        for part, agent in zip(parts, agents):
+            if runs and runs[-1][0] == agent:
+                runs[-1][1].append(part)
+            else:
+                runs.append((agent, [part]))
+        if len(runs) > self.max_parts:
+            return None
+        return [(agent, join_parts(texts)) for agent, texts in runs]
+
+
+def join_parts(parts):
+    """Parts routed to the same agent, back into one message."""
+    return " ".join(part if part[-1] in ".?!" else f"{part}." for part in parts)
+
+
+def create_query_splitter():
+    """The splitter, or None for QUERY_SPLITTER=0."""
+    if os.getenv("QUERY_SPLITTER", "1") in ("0", "false", "False"):
+        return None
+    return QuerySplitter(max_parts=max(1, int(os.getenv("QUERY_SPLITTER_MAX_PARTS", "3"))))
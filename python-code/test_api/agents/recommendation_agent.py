@@ -1,20 +1,53 @@
-import boto3
-import pandas as pd
 import json
 import re
-from copy import deepcopy   # deepcopy copies by value and not by reference
 import os
-from .utils import get_chatbot_response, double_check_json_output
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .log import SAMPLED, get_logger, payload
+from .message_history import MessageHistory, replace_last_content
+from .metrics import (FALLBACKS, JSON_FAILURES, PERSONALIZED_RECOMMENDATIONS, POPULARITY_CUBE_LOOKUPS,
+                      RECOMMENDATION_TYPE_RESOLUTIONS)
+from .recommendation_index import AprioriIndex, CustomerIndex, PopularityCube, PopularityIndex
+from .recommendation_resolver import create_recommendation_resolver
+from .tracing import span
+from .usage import should_downgrade
+from .utils import get_chatbot_response, double_check_json_output, create_llm_client
 import dotenv
 
 dotenv.load_dotenv()
 
+logger = get_logger("recommendation")
+
+# Who and where the current turn is for (the request's optional customer_id, outlet_id and hour)
+_current_context: ContextVar = ContextVar("recommendation_context", default={})
+
+
+@contextmanager
+def recommendation_context(customer_id=None, outlet_id=None, hour=None):
+    """Recommendations made inside are for this customer, at this outlet and hour (the shop's clock if None);
+    without them everyone gets the global lists."""
+    token = _current_context.set({"customer_id": customer_id, "outlet_id": outlet_id, "hour": hour})
+    try:
+        yield
+    finally:
+        _current_context.reset(token)
+
+
+def _where(customer_id):
+    """Outlet, hour and customer for the popularity lookups of the current turn."""
+    context = _current_context.get()
+    return {
+        "outlet_id": context.get("outlet_id"),
+        "hour": context["hour"] if context.get("hour") is not None else time.localtime().tm_hour,
+        "customer_id": customer_id,
+    }
+
+
 class RecommendationAgent:
-    def __init__(self, apriori_recommendation_path, popularity_recomendation_path):
-        self.client = boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
-        )
+    def __init__(self, apriori_recommendation_path, popularity_recomendation_path, customer_affinity_path=None,
+                 popularity_cube_path=None):
+        self.client = create_llm_client()
 
         self.model_id = "meta.llama3-1-8b-instruct-v1:0"
         self.model_inference_profile = 'arn:aws:bedrock:us-east-1:823413233438:inference-profile/us.meta.llama3-1-8b-instruct-v1:0'
@@ -22,88 +55,91 @@ class RecommendationAgent:
         # loading JSON object of the apriori algorithm
         with open(apriori_recommendation_path, 'r') as json_file:
             self.apriori_recommendations = json.load(json_file)
+        # Sparse products x products confidence rows, so a basket is scored from its own rows only
+        self.apriori_index = AprioriIndex(self.apriori_recommendations)
 
         # print('apriori recommendations path:', apriori_recommendation_path)
         # print('apriori recommendations from data:', self.apriori_recommendations)
 
-        self.popularity_recommendations = pd.read_csv(popularity_recomendation_path)
+        # Ranked once here (overall and per category), so popular recommendations are slices
+        self.popularity_recommendations = PopularityIndex.from_csv(popularity_recomendation_path)
+
+        self.products = list(self.popularity_recommendations.products)
+        self.product_categories = list(self.popularity_recommendations.by_category)
+
+        # Per-customer purchase history; without it everyone gets the global lists
+        self.customer_index = None
+        if customer_affinity_path and os.path.exists(customer_affinity_path):
+            self.customer_index = CustomerIndex.from_npz(customer_affinity_path)
+            logger.info("Loaded purchase history of %d customers (%.1f KiB)",
+                        len(self.customer_index), self.customer_index.nbytes / 1024)
 
-        # print('popularity recommendations path:', popularity_recomendation_path)
-        # print('popularity recommendations from data:', self.popularity_recommendations)
+        # Popularity per outlet x hour x customer segment; without it popular means popular overall
+        self.popularity_cube = None
+        if popularity_cube_path and os.path.exists(popularity_cube_path):
+            self.popularity_cube = PopularityCube.from_npz(
+                popularity_cube_path, min_lines=int(os.getenv("POPULARITY_CUBE_MIN_LINES", "100"))
+            )
+            logger.info("Loaded popularity cube (%.1f KiB)", self.popularity_cube.nbytes / 1024)
 
-        self.products = self.popularity_recommendations['product'].tolist()
-        self.product_categories = list(set(self.popularity_recommendations['product_category'].tolist()))
+        # Clear-cut requests ("anything to go with a latte?") get their type from the catalog, not the LLM
+        self.resolver = create_recommendation_resolver()
 
         # print('products:', self.products)
         # print('product categories:', self.product_categories)
 
     def get_apriori_recommendations(self, products, top_k=5):
-        recommendation_list = []
-
-        for product in products:
-            if product in self.apriori_recommendations:
-                # recommendation_list.extend(self.apriori_recommendations[product][:top_k])
-                print('ordered product one:', product)
-
-                recommendation_list += self.apriori_recommendations[product]
-                # print('apriori recommendations list:', self.apriori_recommendations[product])
-                # print('recommendation list:', recommendation_list)
-
-        # Sort recommendation list based on "confidence" in descending order
-        recommendation_list = sorted(recommendation_list, key=lambda x: x['confidence'], reverse=True)
-        # print('sorted recommendation list:', recommendation_list)
-
+        """Products most often bought with `products` (best confidence of any of them), at most 2 per
+        category, never one that's already in the basket."""
+        logger.debug("Ordered products: %s", products)
+        return self.apriori_index.recommend(products, top_k=top_k, per_category=2)
+
+    def get_apriori_or_popular(self, products, top_k=5, **where):
+        """Apriori on `products`; the best sellers not already in the basket when no rule covers them
+        ("Hazelnut Biscotti" has none)."""
+        recommendations = self.get_apriori_recommendations(products, top_k=top_k)
+        if recommendations:
+            return recommendations
+        FALLBACKS.inc(agent="recommendation_agent", reason="no_apriori_rules")
+        basket = set(products)
+        popular = self.get_popular_recommendations(top_k=top_k + len(basket), **where)
+        return [product for product in popular if product not in basket][:top_k]
+
+    def get_popular_recommendations(self, product_categories=None, top_k=5, outlet_id=None, hour=None, customer_id=None):
+        """The best sellers, overall or in the given categories; at that outlet, hour and among customers
+        like this one when there's enough to go by."""
+        logger.debug("Product categories: %r", product_categories)
+        if self.popularity_cube is None:
+            return self.popularity_recommendations.recommend(product_categories, top_k=top_k)
+
+        cell = self.popularity_cube.cell(outlet_id, hour, customer_id=customer_id)
+        POPULARITY_CUBE_LOOKUPS.inc(cell=self.popularity_cube.describe(cell))
+        return self.popularity_cube.recommend(product_categories, top_k=top_k, cell=cell)
+
+    def get_personal_recommendations(self, customer_id, products=(), product_categories=None, top_k=5):
+        """What the customer usually buys and what goes with it (and with `products`); [] for an unknown customer."""
+        if customer_id is None:
+            return []
         recommendations = []
-        recommendations_per_category = {}
-
-        for recommendation in recommendation_list:
-            if recommendation in recommendations:
-                continue
-
-            # Limit 2 recommendations per category
-            product_category = recommendation['product_category']
-            if product_category not in recommendations_per_category:
-                recommendations_per_category[product_category] = 0
-
-            if recommendations_per_category[product_category] >= 2:
-                continue
-            
-            recommendations_per_category[product_category] += 1
-
-            # Add the recommendation to the list
-            recommendations.append(recommendation['product'])
-            
-            if len(recommendations) >= top_k:
-                break
-
+        if self.customer_index is not None:
+            recommendations = self.customer_index.recommend(customer_id, products, product_categories, top_k=top_k)
+        PERSONALIZED_RECOMMENDATIONS.inc(outcome="personal" if recommendations else "global")
+        logger.debug("Personal recommendations for customer %s: %s", customer_id, recommendations)
         return recommendations
-
-    def get_popular_recommendations(self, product_categories=None, top_k=5):
-        recommendation_df = self.popularity_recommendations
-
-        print('product_categories:', product_categories)
-        print('type(product_categories):', type(product_categories))
-
-        if type(product_categories) == str:
-            product_categories = [product_categories]
-
-        if product_categories is not None:
-            recommendation_df = self.popularity_recommendations[self.popularity_recommendations['product_category'].isin(product_categories)]
-
-        print('recommendation_df:', recommendation_df)
-
-        # sort by number of transactions (most popular at the top)
-        recommendation_df = recommendation_df.sort_values('number_of_transactions', ascending=False)
-        print('sorted recommendation_df:', recommendation_df)
-
-        if recommendation_df.shape[0] == 0:
-            return []
-
-        recommendation = recommendation_df['product'].tolist()[:top_k]
-
-        return recommendation
     
     def recommendation_classification(self, message):
+        if self.resolver is not None:
+            resolved = self.resolver.resolve(message)
+            if resolved is not None:
+                RECOMMENDATION_TYPE_RESOLUTIONS.inc(source="resolver", recommendation_type=resolved["recommendation_type"])
+                logger.debug("Resolved without the LLM: %s", resolved)
+                return resolved
+
+        output = self._classify_with_llm(message)
+        RECOMMENDATION_TYPE_RESOLUTIONS.inc(source="llm", recommendation_type=output["recommendation_type"])
+        return output
+
+    def _classify_with_llm(self, message):
 
         system_prompt = """ 
             You are a JSON-only API. Always output a single valid JSON object.
@@ -139,17 +175,18 @@ class RecommendationAgent:
 
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}] + message
+        input_messages = [{"role": "system", "content": system_prompt}, *message]
         # print('input messages (rec classification):', input_messages)
 
-        chatbot_response = get_chatbot_response(self.client,self.model_inference_profile,input_messages)
-        print('chatbot response (rec classification):', chatbot_response)
+        with span("recommendation.classify"):
+            chatbot_response = get_chatbot_response(self.client,self.model_inference_profile,input_messages)
+        logger.debug("Chatbot response (classification): %s", payload(chatbot_response), extra=SAMPLED)
 
         # chatbot_response = double_check_json_output(self.client,self.model_inference_profile,chatbot_response)
         # print('chatbot response after double check (rec classification):', chatbot_response)
 
         output = self.postprocess_classfication(chatbot_response)
-        print('final output (classification):', output)
+        logger.debug("Final output (classification): %s", output)
 
         return output
     
@@ -182,19 +219,30 @@ class RecommendationAgent:
                     try:
                         output = json.loads(input[start_idx:i+1])
                     except json.JSONDecodeError:
-                            print("Invalid JSON from model:", output)
+                            logger.warning("Invalid JSON from model: %s", payload(input))
+                            JSON_FAILURES.inc(agent="recommendation_agent")
+                            FALLBACKS.inc(agent="recommendation_agent", reason="invalid_json")
                             return {
                                 "recommendation_type": "popular",   
                                 "parameters": []
                             }
 
-        print('output:', output)
+        if output is None:
+            logger.warning("No JSON object in model output: %s", payload(input))
+            JSON_FAILURES.inc(agent="recommendation_agent")
+            FALLBACKS.inc(agent="recommendation_agent", reason="invalid_json")
+            return {
+                "recommendation_type": "popular",
+                "parameters": []
+            }
+
         recommendation_type = output.get('recommendation_type')
         parameters = output.get('parameters', [])
         chain_of_thought = output.get('chain_of_thought', None)
 
         if recommendation_type not in ["apriori", "popular", "popular by category"]:
-            print("Unexpected or missing recommendation_type:", output)
+            logger.warning("Unexpected or missing recommendation_type: %s", output)
+            FALLBACKS.inc(agent="recommendation_agent", reason="unknown_type")
             return {
                 "chain_of_thought": chain_of_thought,
                 "recommendation_type": "popular",   # fallback
@@ -207,18 +255,26 @@ class RecommendationAgent:
             "parameters": parameters
         }
     
-    def get_recommendations_from_order(self, messages, order): 
-        messages = deepcopy(messages)
+    def get_recommendations_from_order(self, messages, order, customer_id=None):
+        with span("order.recommendations", agent="recommendation_agent", items=len(order)):
+            return self._get_recommendations_from_order(messages, order, customer_id)
+
+    def _get_recommendations_from_order(self, messages, order, customer_id=None):
+        messages = MessageHistory.coerce(messages)
+        customer_id = customer_id if customer_id is not None else _current_context.get().get("customer_id")
 
         products = []
         for item in order:
             products.append(item.get('product') or item.get('item'))
 
-        recommendations = self.get_apriori_recommendations(products)
-        print('recommendations (from order):', recommendations)
+        recommendations = (self.get_personal_recommendations(customer_id, products)
+                           or self.get_apriori_or_popular(products, **_where(customer_id)))
+        logger.debug("Recommendations (from order): %s", recommendations)
+
+        if should_downgrade("order.recommendations"):
+            return self.postprocess(self.format_recommendations(recommendations, "You might also enjoy:"))
 
         recommendations_str = ", ".join(recommendations)
-        print('recommendations_str (from order):', recommendations_str)
 
         system_prompt = f"""
         You are a helpful AI assistant for a coffee shop application.
@@ -240,8 +296,7 @@ class RecommendationAgent:
 
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
         chatbot_response = get_chatbot_response(self.client,self.model_inference_profile,input_messages)
         
@@ -249,35 +304,44 @@ class RecommendationAgent:
 
         return output
     
-    def get_response(self, messages):
-        messages = deepcopy(messages)
+    def get_response(self, messages, customer_id=None):
+        messages = MessageHistory.coerce(messages)
+        context = _current_context.get()
+        customer_id = customer_id if customer_id is not None else context.get("customer_id")
+        where = _where(customer_id)
 
-        print('Calling Recommendation Classifier to understand user intent...')
+        logger.debug("Calling Recommendation Classifier to understand user intent...")
         recommendation_classification = self.recommendation_classification(messages)
         recommendation_type = recommendation_classification['recommendation_type']
         # parameters = recommendation_classification['parameters']
 
-        print('recommendation_classification:', recommendation_classification)
-        print('recommendation_type:', recommendation_type)
-        print('parameters:', recommendation_classification['parameters'])
+        logger.debug("Recommendation classification: %s", recommendation_classification)
 
         recommendations = []
+        parameters = recommendation_classification['parameters']
 
+        # A known customer gets recommendations from their own history; everyone else the global lists
         if recommendation_type == "apriori":
-            recommendations = self.get_apriori_recommendations(recommendation_classification['parameters'])
+            recommendations = (self.get_personal_recommendations(customer_id, products=parameters)
+                               or self.get_apriori_or_popular(parameters, **where))
         elif recommendation_type == "popular":
-            recommendations = self.get_popular_recommendations()
+            recommendations = (self.get_personal_recommendations(customer_id)
+                               or self.get_popular_recommendations(**where))
         elif recommendation_type == "popular by category":
-            recommendations = self.get_popular_recommendations(product_categories= recommendation_classification['parameters'])
+            recommendations = (self.get_personal_recommendations(customer_id, product_categories=parameters)
+                               or self.get_popular_recommendations(product_categories=parameters, **where))
         
         if recommendations == []:
+            FALLBACKS.inc(agent="recommendation_agent", reason="no_recommendations")
             return {"role": "assistant", "content": "I'm sorry, I can't help with that recommendation. Can I help you with something else?"}
         
-        print('recommendations (get_response):', recommendations)
+        logger.debug("Recommendations: %s", recommendations)
+
+        # Respond to user (a plain list instead of another LLM call when over budget)
+        if should_downgrade("recommendation.response"):
+            return self.postprocess(self.format_recommendations(recommendations, "Here's what I'd recommend:"))
 
-        # Respond to user
         recommendation_str = ", ".join(recommendations)
-        print('recommendation_str (get_response):', recommendation_str)
 
         system_prompt = f"""
         You are a helpful AI assistant for a coffee shop.
@@ -293,20 +357,23 @@ class RecommendationAgent:
         Please recommend these items exactly: {recommendation_str}        
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = [{"role": "system", "content": system_prompt}] + replace_last_content(messages[-3:], prompt)
 
-        print('input_messages (recommendation get_response):', input_messages)
+        logger.debug("Input messages: %s", payload(input_messages), extra=SAMPLED)
 
         chatbot_response = get_chatbot_response(self.client,self.model_inference_profile,input_messages)
-        print('chatbot_response (recommendation):', chatbot_response)
+        logger.debug("Chatbot response: %s", payload(chatbot_response), extra=SAMPLED)
 
         output = self.postprocess(chatbot_response)
-        print('post-processed output (recommendation):', output)
 
         # return chatbot_response
         return output
     
+    def format_recommendations(self, recommendations, heading):
+        if not recommendations:
+            return ""
+        return heading + "\n" + "\n".join(f"- {item}" for item in recommendations)
+
     def postprocess(self, output):
         output = { 
             "role": "assistant", 
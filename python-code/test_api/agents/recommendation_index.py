@@ -0,0 +1,355 @@
+"""Apriori and popularity recommendations, precomputed at load time.
+
+apriori_recommendations.json maps a product to the products bought with it:
+
+    {"Latte": [{"product": "Chocolate Croissant", "product_category": "Bakery", "confidence": 0.31}, ...]}
+
+At load time this becomes a sparse products x products confidence matrix (row:
+the product in the basket, column: the product to recommend) and the category
+of every column. A basket is scored with a max over its rows, the basket itself is
+masked out, and the top-k under the per-category cap comes from argpartition:
+the best `per_category` of every category, then the best `top_k` of those.
+
+popularity_recommendation.csv (product, product_category,
+number_of_transactions) becomes one ranked tuple for everything and one per
+category, so "popular" is a slice and "popular by category" a merge of a
+few sorted tuples.
+
+customer_affinity.npz (from train_recommendations.py) holds every loyalty
+customer's share of purchases per product as sparse rows (ids sorted, so a
+customer is a binary search away) and the products x products co-occurrence
+matrix. A customer's products are scored as affinity @ (co-occurrence +
+identity): what they usually buy and what goes with it. Only the products a
+customer bought are stored, so 100k customers take a few MiB.
+
+popularity_cube.npz holds the same counts per outlet x hour bucket x
+customer segment x product, slot 0 of the first three axes being the roll-up
+("all"), with every cell's ranking (overall and per category) precomputed. A
+lookup walks from the most specific cell towards the roll-ups until one has
+enough lines to go by, then slices the first k of its ranking.
+"""
+import csv
+import heapq
+import itertools
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+
+class AprioriIndex:
+    def __init__(self, rules: Dict[str, List[dict]]):
+        antecedents = list(rules)
+        # Every product some rule points to, in order of first appearance
+        first_seen = {}
+        for recommendations in rules.values():
+            for recommendation in recommendations:
+                first_seen.setdefault(recommendation["product"], recommendation["product_category"])
+        products, categories = list(first_seen), list(first_seen.values())
+
+        self.products = products
+        self.category_names = sorted(set(categories))
+        category_index = {name: c for c, name in enumerate(self.category_names)}
+        self.categories = np.array([category_index[c] for c in categories], dtype=np.int64)
+
+        # Names as the LLM or the order agent write them ("latte") find the same row
+        self.rows = {name.casefold(): i for i, name in enumerate(antecedents)}
+        self.columns = {name.casefold(): j for j, name in enumerate(products)}
+
+        # The rules as sparse rows (only the products a rule points to are stored, so memory grows with the
+        # number of rules, not products squared). float64: rules that tie in the file still tie here, and
+        # nothing else does. The rank is the rule's position in its product's list, to break ties the way
+        # the file orders them
+        indptr, indices, confidence, rule_rank = [0], [], [], []
+        for recommendations in rules.values():
+            best = {}
+            for rank, recommendation in enumerate(recommendations):
+                j = self.columns[recommendation["product"].casefold()]
+                if recommendation["confidence"] > best.get(j, (0.0, 0))[0]:
+                    best[j] = (recommendation["confidence"], rank)
+            for j, (value, rank) in best.items():
+                indices.append(j)
+                confidence.append(value)
+                rule_rank.append(rank)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.confidence = np.array(confidence, dtype=np.float64)
+        self.rule_rank = np.array(rule_rank, dtype=np.int32)
+        self.members = [np.flatnonzero(self.categories == c) for c in range(len(self.category_names))]
+        # Baskets repeat a lot (the order agent asks with the first item of every order)
+        self._recommend = lru_cache(maxsize=4096)(self._recommend)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _normalize(basket):
+        return tuple(dict.fromkeys(str(name).casefold() for name in basket if name))
+
+    def scores(self, basket: Iterable[str]):
+        """(scores, tie_break): best confidence of every product given the basket, -inf for the basket
+        itself and for products no rule points to; ties go to the earlier basket item, then the earlier rule."""
+        names = self._normalize(basket)
+        rows = [self.rows[name] for name in names if name in self.rows]
+        if not rows:
+            return np.full(len(self.products), -np.inf), np.zeros(len(self.products), dtype=np.int64)
+
+        # Only the basket's rows are read: their rules, gathered into flat arrays
+        entries = np.concatenate([np.arange(self.indptr[i], self.indptr[i + 1]) for i in rows])
+        columns = self.indices[entries]
+        confidence = self.confidence[entries]
+        position = np.repeat(np.arange(len(rows)), [self.indptr[i + 1] - self.indptr[i] for i in rows])
+
+        scores = np.zeros(len(self.products))
+        np.maximum.at(scores, columns, confidence)
+        best = confidence == scores[columns]
+        tie_break = np.full(len(self.products), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(tie_break, columns[best],
+                      position[best] * (len(self.products) + 1) + self.rule_rank[entries][best])
+
+        scores[scores <= 0] = -np.inf
+        in_basket = [self.columns[name] for name in names if name in self.columns]
+        scores[in_basket] = -np.inf
+        return scores, tie_break
+
+    def recommend(self, basket: Iterable[str], top_k=5, per_category=2) -> List[str]:
+        if top_k <= 0 or per_category <= 0:
+            return []
+        return list(self._recommend(self._normalize(basket), top_k, per_category))
+
+    def _recommend(self, basket, top_k, per_category):
+        scores, tie_break = self.scores(basket)
+
+        # Only the best `per_category` of a category can make it (and whatever ties with the last of them)
+        candidates = []
+        for members in self.members:
+            if len(members) > per_category:
+                kth = members[np.argpartition(-scores[members], per_category - 1)[per_category - 1]]
+                members = members[scores[members] >= scores[kth]]
+            candidates.append(members)
+        candidates = np.concatenate(candidates) if candidates else np.zeros(0, dtype=np.int64)
+        candidates = candidates[np.isfinite(scores[candidates])]
+
+        # Best first, then the cap: the n-th product of its category in that order is kept if n <= per_category
+        candidates = candidates[np.lexsort((tie_break[candidates], -scores[candidates]))]
+        categories = self.categories[candidates]
+        seen = np.cumsum(categories[:, None] == np.arange(len(self.category_names)), axis=0)
+        keep = seen[np.arange(len(candidates)), categories] <= per_category
+        return tuple(self.products[j] for j in candidates[keep][:top_k])
+
+
+class PopularityIndex:
+    def __init__(self, rows: Sequence[dict]):
+        rows = [(int(float(row["number_of_transactions"])), row["product"], row["product_category"]) for row in rows]
+        # In the order of the file, as the agent's prompts list them
+        self.products = tuple(product for _, product, _ in rows)
+
+        # Most transactions first; equal counts keep the order of the file
+        ranked = sorted(rows, key=lambda row: -row[0])
+        self.ranked = tuple(product for _, product, _ in ranked)
+        by_category: Dict[str, list] = {}
+        for count, product, category in ranked:
+            by_category.setdefault(category, []).append((-count, product))
+        self.by_category = {category: tuple(items) for category, items in by_category.items()}
+        # "coffee" from the LLM finds "Coffee"
+        self.categories = {category.casefold(): category for category in self.by_category}
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def recommend(self, categories: Optional[Union[str, Iterable[str]]] = None, top_k=5) -> List[str]:
+        if categories is None:
+            return list(self.ranked[:top_k])
+        if isinstance(categories, str):
+            categories = [categories]
+
+        lists = []
+        for category in dict.fromkeys(str(c).casefold() for c in categories):
+            if category in self.categories:
+                lists.append(self.by_category[self.categories[category]][:top_k])
+        if len(lists) == 1:
+            return [product for _, product in lists[0]]
+        # Each list is already ranked: merging the first top_k of each is enough
+        return [product for _, product in itertools.islice(heapq.merge(*lists, key=lambda item: item[0]), top_k)]
+
+
+class CustomerIndex:
+    def __init__(self, products, categories, cooccurrence, customer_ids, indptr, indices, affinity):
+        self.products = [str(name) for name in products]
+        self.categories = np.asarray(categories).astype(str)
+        self.columns = {name.casefold(): j for j, name in enumerate(self.products)}
+        self.category_names = {name.casefold(): name for name in self.categories}
+
+        # A customer's own favourites count as much as what goes with them
+        self.related = np.asarray(cooccurrence, dtype=np.float32) + np.eye(len(self.products), dtype=np.float32)
+        self.customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices)
+        self.affinity = np.asarray(affinity, dtype=np.float32)
+
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.related, self.customer_ids, self.indptr, self.indices, self.affinity))
+
+    def _row(self, customer_id):
+        try:
+            customer_id = int(customer_id)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self.customer_ids, customer_id))
+        if i == len(self.customer_ids) or self.customer_ids[i] != customer_id:
+            return None
+        return slice(self.indptr[i], self.indptr[i + 1])
+
+    def __contains__(self, customer_id):
+        return self._row(customer_id) is not None
+
+    def scores(self, customer_id, basket: Iterable[str] = ()):
+        """Score of every product for the customer (and what's in the basket), -inf for the basket itself;
+        None for a customer we don't know."""
+        row = self._row(customer_id)
+        if row is None:
+            return None
+        scores = self.affinity[row] @ self.related[self.indices[row]]
+
+        in_basket = [self.columns[name] for name in AprioriIndex._normalize(basket) if name in self.columns]
+        if in_basket:
+            # The basket weighs as much as the whole history
+            scores = scores + self.related[in_basket].mean(axis=0)
+            scores[in_basket] = -np.inf
+        scores[scores <= 0] = -np.inf
+        return scores
+
+    def recommend(self, customer_id, basket: Iterable[str] = (), categories=None, top_k=5, per_category=2) -> List[str]:
+        """Best products for the customer, at most `per_category` per category; [] for an unknown customer."""
+        scores = self.scores(customer_id, basket)
+        if scores is None or top_k <= 0:
+            return []
+        if categories is not None:
+            if isinstance(categories, str):
+                categories = [categories]
+            wanted = [self.category_names[c] for c in (str(c).casefold() for c in categories) if c in self.category_names]
+            scores[~np.isin(self.categories, wanted)] = -np.inf
+
+        recommendations, taken = [], {}
+        for j in np.argsort(-scores, kind="stable"):
+            if not np.isfinite(scores[j]) or len(recommendations) == top_k:
+                break
+            category = self.categories[j]
+            if taken.get(category, 0) < per_category:
+                taken[category] = taken.get(category, 0) + 1
+                recommendations.append(self.products[j])
+        return recommendations
+
+
+class PopularityCube:
+    def __init__(self, products, categories, category_names, outlet_ids, hour_starts, hour_names, segments,
+                 counts, ranking, customer_ids, customer_segments, min_lines=100):
+        self.products = [str(name) for name in products]
+        self.category_names = [str(name) for name in category_names]
+        self.categories = {name.casefold(): c + 1 for c, name in enumerate(self.category_names)}
+        self.outlet_ids = np.asarray(outlet_ids, dtype=np.int64)
+        self.hour_starts = np.asarray(hour_starts, dtype=np.int64)
+        self.hour_names = {str(name).casefold(): h + 1 for h, name in enumerate(hour_names)}
+        self.segments = [str(name) for name in segments]
+        self.segment_slots = {name.casefold(): i for i, name in enumerate(self.segments)}
+        # "Gen Z/F" rolls up to "Gen Z", everything else straight to "all"
+        self.segment_parents = [self.segment_slots.get(name.split("/")[0].casefold(), 0) if "/" in name else 0
+                                for name in self.segments]
+        self.counts = np.asarray(counts)
+        self.ranking = np.asarray(ranking)
+        self.lines = self.counts.sum(axis=-1)
+        self.customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self.customer_segments = np.asarray(customer_segments)
+        self.min_lines = min_lines
+
+    @classmethod
+    def from_npz(cls, path, min_lines=100):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files}, min_lines=min_lines)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.counts, self.ranking, self.lines, self.customer_ids,
+                                              self.customer_segments))
+
+    def outlet_slot(self, outlet_id):
+        try:
+            outlet_id = int(outlet_id)
+        except (TypeError, ValueError):
+            return 0
+        i = int(np.searchsorted(self.outlet_ids, outlet_id))
+        return i + 1 if i < len(self.outlet_ids) and self.outlet_ids[i] == outlet_id else 0
+
+    def hour_slot(self, hour):
+        """Bucket of an hour of the day (7, "07", "07:45") or of a bucket name ("morning")."""
+        if hour is None:
+            return 0
+        if isinstance(hour, str) and hour.casefold() in self.hour_names:
+            return self.hour_names[hour.casefold()]
+        try:
+            hour = int(str(hour).split(":")[0])
+        except ValueError:
+            return 0
+        return int(np.searchsorted(self.hour_starts, hour, side="right")) if 0 <= hour < 24 else 0
+
+    def segment_slot(self, segment=None, customer_id=None):
+        """Slot of a segment name ("Gen Z", "F", "Gen Z/F", "anonymous"), else of the customer's segment."""
+        if segment is not None:
+            return self.segment_slots.get(str(segment).casefold(), 0)
+        if customer_id is None:
+            return 0
+        try:
+            customer_id = int(customer_id)
+        except (TypeError, ValueError):
+            return 0
+        i = int(np.searchsorted(self.customer_ids, customer_id))
+        if i < len(self.customer_ids) and self.customer_ids[i] == customer_id:
+            return int(self.customer_segments[i])
+        return self.segment_slots.get("anonymous", 0)
+
+    def cell(self, outlet_id=None, hour=None, segment=None, customer_id=None):
+        """(outlet, hour, segment) slots of the most specific cell with at least `min_lines` lines:
+        the segment is coarsened first, then the hour, then the outlet is dropped."""
+        outlet, hour, segment = self.outlet_slot(outlet_id), self.hour_slot(hour), self.segment_slot(segment, customer_id)
+        for o in dict.fromkeys((outlet, 0)):
+            for h in dict.fromkeys((hour, 0)):
+                s = segment
+                while True:
+                    if self.lines[o, h, s] >= self.min_lines or (o, h, s) == (0, 0, 0):
+                        return o, h, s
+                    if s == 0:
+                        break
+                    s = self.segment_parents[s]
+        return 0, 0, 0
+
+    def describe(self, cell):
+        """"outlet+hour+segment", ..., "global": the axes a cell is specific on."""
+        return "+".join(axis for axis, slot in zip(("outlet", "hour", "segment"), cell) if slot) or "global"
+
+    def recommend(self, categories: Optional[Union[str, Iterable[str]]] = None, top_k=5, cell=(0, 0, 0)) -> List[str]:
+        o, h, s = cell
+        counts = self.counts[o, h, s]
+        if categories is None:
+            ranked = self.ranking[0, o, h, s, :top_k]
+            return [self.products[j] for j in ranked if counts[j] > 0]
+        if isinstance(categories, str):
+            categories = [categories]
+
+        lists = []
+        for c in dict.fromkeys(self.categories[str(c).casefold()] for c in categories if str(c).casefold() in self.categories):
+            ranked = self.ranking[c, o, h, s, :top_k]
+            lists.append([(-int(counts[j]), int(j)) for j in ranked if j >= 0 and counts[j] > 0])
+        # Each list is already ranked: merging the first top_k of each is enough (ties in name order, as the csv)
+        return [self.products[j] for _, j in itertools.islice(heapq.merge(*lists), top_k)]
@@ -0,0 +1,218 @@
+"""Decide the recommendation type without the LLM when the message makes it obvious.
+
+"What goes well with a latte?" names a product: apriori on it. "Any pastries
+you'd recommend?" names a category: popular by category. "What do you
+recommend?" with an order in progress (the order agent's memory in the
+history): apriori on the order; without one: popular. Product and category
+names come from the catalog (agents/catalog.py). A category word that also
+names products ("croissant", "scone", "hot chocolate") is only taken as the
+product, and only when the message pairs it ("what goes with a croissant?");
+otherwise it's unclear whether they want that product's kind or something to
+go with it, and the LLM decides.
+
+A word the catalog matching doesn't know is looked up in the pre-embedded
+catalog vocabulary (agents/embeddings.py), so "expresso" still finds the
+Espresso shot; one that isn't close to anything there hands off.
+
+Anything less clear-cut (negations, comparisons, dietary questions, long
+messages, names that only loosely match, both products and categories, or
+any other noun: "recommend a tea" isn't a request for the best sellers)
+returns None and the agent asks the LLM as before.
+
+    RECOMMENDATION_RESOLVER             1 (default) | 0 to always ask the LLM
+    RECOMMENDATION_RESOLVER_SIMILARITY  cosine similarity for a vocabulary match (0.8)
+"""
+import os
+import re
+from typing import Callable, List, Optional
+
+from .catalog import load_catalog, normalize_text
+from .catalog_answers import CatalogAnswerer
+from .log import get_logger
+from .message_history import MessageHistory
+
+logger = get_logger("recommendation")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Needs reading, not matching
+HAND_OFF = re.compile(
+    r"\b(not|no|don'?t|doesn'?t|never|without|except|instead|other than|besides|than|compare|versus|vs|"
+    r"vegan|vegetarian|gluten|dairy|lactose|allerg\w*|nuts?|calories|caffeine|healthy|cheap\w*|price\w*|budget)\b"
+)
+# A recommendation request with nothing more specific in it
+GENERIC = re.compile(
+    r"\b(recommend\w*|suggest\w*|suggestions?|popular|best ?sell\w*|specials?|favou?rites?|what'?s good|"
+    r"what should i (get|have|try|order)|surprise me|anything (good|nice)|something (good|nice)|ideas?)\b"
+)
+# Words a recommendation request can have besides product and category names; anything else
+# ("tea", "drink", "sandwich") is something we didn't understand
+FILLER = frozenset("""
+    a an the some any me my i you your we us our it its this that these those one ones
+    s d ll m re ve t
+    what which whats how is are am be do does did can could would will should might may
+    to for of on in at with and or along alongside together too also please thanks thank hi hey hello
+    get have try go goes going pair pairs paired well good nice great tasty lovely today now here
+    something anything else more like want looking need give tell know
+    recommend recommends recommended recommendation recommendations
+    suggest suggests suggested suggestion suggestions
+    popular best top seller sellers selling bestseller bestsellers bestselling special specials
+    favorite favorites favourite favourites idea ideas surprise
+""".split())
+# "what goes with ...": the named item is the basket, not the kind of thing they want
+PAIRING = re.compile(r"\bgo(?:es)?(?: well)? with\b|\bpair\w*\b|\balong ?(?:with|side)\b")
+MAX_WORDS = 25
+
+# The categories the recommendation lists use
+SERVED_CATEGORIES = {"Drinking Chocolate": "Chocolate"}
+
+
+def _words(text):
+    return _WORD.findall(text)
+
+
+class RecommendationResolver:
+    def __init__(self, matcher: CatalogAnswerer, vocabulary_lookup: Optional[Callable] = None):
+        # The catalog matching of the details fast path: alias words -> product, category words -> category
+        self.matcher = matcher
+        # words -> nearest (kind, text, target) catalog vocabulary entry or None (EmbeddingService.nearest_vocabulary)
+        self.vocabulary_lookup = vocabulary_lookup
+        self.max_words = max(matcher.max_alias_words, max((len(words) for words in matcher.category_words), default=1))
+
+        # Category words narrower than their category: word -> the product it names exactly, or None
+        # ("scone" is some of the Bakery, but which one?)
+        self.ambiguous = {}
+        for words, category in matcher.category_words.items():
+            named = {product for alias, product in matcher.aliases.items() if alias[-1] == words[-1]}
+            in_category = {product for product in matcher.catalog.products
+                           if SERVED_CATEGORIES.get(product.category, product.category) == category}
+            exact = matcher.aliases.get(words)
+            if exact is not None or (named and named != in_category):
+                self.ambiguous[words] = exact
+
+    def mentions(self, words, pairing=False):
+        """(products, categories, unmatched words) in `words`, longest match first; None if something
+        looked like a product but didn't match confidently, or a word could be a product or a category
+        (see self.ambiguous) and `pairing` doesn't settle it."""
+        products, categories = [], []
+        leftover = []
+        position = 0
+        while position < len(words):
+            for n in range(min(self.max_words, len(words) - position), 0, -1):
+                key = tuple(words[position:position + n])
+                category = self.matcher.category_words.get(key)
+                product = self.matcher.aliases.get(key)
+                if category is not None and key in self.ambiguous:
+                    product = self.ambiguous[key]
+                    if not pairing or product is None:
+                        return None
+                    if product.name not in products:
+                        products.append(product.name)
+                elif category is not None:
+                    category = SERVED_CATEGORIES.get(category, category)
+                    if category not in categories:
+                        categories.append(category)
+                elif product is not None:
+                    if product.name not in products:
+                        products.append(product.name)
+                else:
+                    continue
+                position += n
+                break
+            else:
+                leftover.append(words[position])
+                position += 1
+
+        # Close spellings ("capuccino") in what's left
+        matched = self.matcher.match_products(leftover)
+        if matched is None:
+            return None
+        close, covered = matched
+        products.extend(product.name for product in close if product.name not in products)
+        return products, categories, [word for word, done in zip(leftover, covered) if not done]
+
+    @staticmethod
+    def current_order(messages) -> List[str]:
+        """Items of the order in progress, from the order agent's last memory."""
+        for message in reversed(messages):
+            memory = message.get("memory") or {}
+            if memory.get("agent") == "order_taking_agent":
+                if memory.get("order_finalized"):
+                    return []
+                return [item.get("item") or item.get("product") for item in memory.get("order") or []
+                        if item.get("item") or item.get("product")]
+        return []
+
+    def resolve(self, messages) -> Optional[dict]:
+        """The classification (as RecommendationAgent.postprocess_classfication returns it), or None."""
+        messages = MessageHistory.coerce(messages)
+        if not messages:
+            return None
+        text = normalize_text(str(messages[-1].get("content") or "")).replace("’", "'")
+        words = _words(text)
+        if not words or len(words) > MAX_WORDS or HAND_OFF.search(text):
+            return None
+
+        mentions = self.mentions(words, pairing=bool(PAIRING.search(text)))
+        if mentions is None:
+            return None
+        products, categories, unmatched = mentions
+        unknown = [word for word in unmatched if word not in FILLER]
+        if unknown:
+            if self.vocabulary_lookup is None:
+                return None
+            try:
+                entries = self.vocabulary_lookup(unknown)
+            except Exception as e:
+                # No embedding model (offline, failed to load): the LLM decides as before
+                logger.warning("Vocabulary lookup of %s failed: %r", unknown, e)
+                return None
+            for entry in entries:
+                if entry is None:
+                    return None
+                kind, text, target = entry
+                if tuple(_words(normalize_text(text))) in self.ambiguous:
+                    return None
+                if kind.startswith("category"):
+                    target = SERVED_CATEGORIES.get(target, target)
+                    found = categories
+                else:
+                    found = products
+                if target not in found:
+                    found.append(target)
+        if products and categories:
+            # "a croissant and a latte": apriori on the products would drop the category
+            return None
+
+        if products:
+            return self._decision("apriori", products, f"Mentions {', '.join(products)}")
+        if categories:
+            return self._decision("popular by category", categories, f"Asks about {', '.join(categories)}")
+        if not GENERIC.search(text):
+            return None
+        order = self.current_order(messages)
+        if order:
+            return self._decision("apriori", order, "Order in progress")
+        return self._decision("popular", [], "No product or category mentioned")
+
+    @staticmethod
+    def _decision(recommendation_type, parameters, reason):
+        return {"chain_of_thought": reason, "recommendation_type": recommendation_type, "parameters": list(parameters)}
+
+
+def create_recommendation_resolver() -> Optional[RecommendationResolver]:
+    """The resolver, or None for RECOMMENDATION_RESOLVER=0 or when there's no catalog."""
+    if os.getenv("RECOMMENDATION_RESOLVER", "1") in ("0", "false", "False"):
+        return None
+    try:
+        matcher = CatalogAnswerer(load_catalog())
+    except FileNotFoundError:
+        return None
+
+    from .embeddings import get_embedding_service
+    similarity = float(os.getenv("RECOMMENDATION_RESOLVER_SIMILARITY", "0.8"))
+
+    def vocabulary_lookup(words):
+        return get_embedding_service().nearest_vocabulary(words, min_similarity=similarity)
+
+    return RecommendationResolver(matcher, vocabulary_lookup)
@@ -0,0 +1,128 @@
+"""Hybrid retrieval for the details agent: vector similarity fused with BM25.
+
+Both retrievers return a few candidates, the rankings are fused and only the
+documents close enough to the best one are kept, so an exact product question
+carries that product's document and not the long about-us text as well.
+
+    RETRIEVAL_MODE              hybrid (default) | vector (the old top-2 by cosine)
+    RETRIEVAL_FUSION            rrf (reciprocal rank, default) | weighted
+    RETRIEVAL_CANDIDATES        candidates taken from each retriever (5)
+    RETRIEVAL_MAX_RESULTS       documents handed to the prompt at most (2)
+    RETRIEVAL_RELATIVE_CUTOFF   keep documents scoring at least this share of the best one (0.6)
+    RETRIEVAL_LEXICAL_WEIGHT    BM25 share in weighted fusion (0.5)
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from .knowledge_base import knowledge_base_documents
+from .lexical_index import BM25Index
+from .log import get_logger
+
+logger = get_logger("retrieval")
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k=RRF_K) -> Dict[str, float]:
+    fused: Dict[str, float] = {}
+    for matches in rankings:
+        for rank, match in enumerate(matches):
+            fused[match["id"]] = fused.get(match["id"], 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+
+def weighted_fusion(vector_matches, lexical_matches, lexical_weight=0.5) -> Dict[str, float]:
+    """Cosine (already in [-1, 1]) plus BM25 scaled by the best BM25 score of the query."""
+    fused: Dict[str, float] = {}
+    for match in vector_matches:
+        fused[match["id"]] = (1 - lexical_weight) * max(match["score"], 0.0)
+    best = max((match["score"] for match in lexical_matches), default=0.0)
+    if best > 0:
+        for match in lexical_matches:
+            fused[match["id"]] = fused.get(match["id"], 0.0) + lexical_weight * match["score"] / best
+    return fused
+
+
+def build_lexical_index(vector_store) -> BM25Index:
+    """Index the documents the vector store holds; Pinecone can't list them, so read the source files."""
+    ids = getattr(vector_store, "ids", None)
+    metadata = getattr(vector_store, "metadata", None)
+    if ids and metadata:
+        return BM25Index(ids, [meta.get("text", "") for meta in metadata], metadata)
+
+    documents = knowledge_base_documents()
+    return BM25Index([document.id for document in documents], [document.text for document in documents])
+
+
+class HybridRetriever:
+    def __init__(self, vector_store, lexical_index: Optional[BM25Index] = None, fusion="rrf", candidates=5,
+                 max_results=2, relative_cutoff=0.6, lexical_weight=0.5):
+        self.vector_store = vector_store
+        self._indexed_ids = getattr(vector_store, "ids", None)
+        self.lexical_index = lexical_index if lexical_index is not None else build_lexical_index(vector_store)
+        self._own_index = lexical_index is None
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown RETRIEVAL_FUSION '{fusion}' (expected 'rrf' or 'weighted')")
+        self.fusion = fusion
+        self.candidates = candidates
+        self.max_results = max_results
+        self.relative_cutoff = relative_cutoff
+        self.lexical_weight = lexical_weight
+
+    def query(self, vector, text, top_k=None):
+        """{"matches": [...]} best first, each with the fused score and the two source scores."""
+        max_results = top_k or self.max_results
+        if self._own_index and getattr(self.vector_store, "ids", None) is not self._indexed_ids:
+            # The local store was reloaded (upsert/delete); index what it holds now
+            self._indexed_ids = self.vector_store.ids
+            self.lexical_index = build_lexical_index(self.vector_store)
+        vector_matches = self.vector_store.query(vector, top_k=max(self.candidates, max_results))["matches"]
+        lexical_matches = self.lexical_index.query(text, top_k=self.candidates)["matches"]
+
+        if self.fusion == "rrf":
+            fused = reciprocal_rank_fusion([vector_matches, lexical_matches])
+        else:
+            fused = weighted_fusion(vector_matches, lexical_matches, self.lexical_weight)
+        if not fused:
+            return {"matches": []}
+
+        by_id = {match["id"]: match for match in lexical_matches}
+        by_id.update({match["id"]: match for match in vector_matches})
+        vector_scores = {match["id"]: match["score"] for match in vector_matches}
+        lexical_scores = {match["id"]: match["score"] for match in lexical_matches}
+
+        ranked = sorted(fused.items(), key=lambda item: -item[1])
+        # Adaptive cutoff: the best document always goes in, the rest only if they're close to it
+        threshold = ranked[0][1] * self.relative_cutoff
+        kept = [(doc_id, score) for doc_id, score in ranked if score >= threshold][:max_results]
+
+        return {"matches": [
+            {
+                "id": doc_id,
+                "score": score,
+                "metadata": by_id[doc_id]["metadata"],
+                "vector_score": vector_scores.get(doc_id),
+                "lexical_score": lexical_scores.get(doc_id),
+            }
+            for doc_id, score in kept
+        ]}
+
+
+def create_retriever(vector_store) -> Optional[HybridRetriever]:
+    """The hybrid retriever, or None for RETRIEVAL_MODE=vector."""
+    mode = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+    if mode == "vector":
+        return None
+    if mode != "hybrid":
+        raise ValueError(f"Unknown RETRIEVAL_MODE '{mode}' (expected 'hybrid' or 'vector')")
+
+    retriever = HybridRetriever(
+        vector_store,
+        fusion=os.getenv("RETRIEVAL_FUSION", "rrf").lower(),
+        candidates=int(os.getenv("RETRIEVAL_CANDIDATES", "5")),
+        max_results=int(os.getenv("RETRIEVAL_MAX_RESULTS", "2")),
+        relative_cutoff=float(os.getenv("RETRIEVAL_RELATIVE_CUTOFF", "0.6")),
+        lexical_weight=float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "0.5")),
+    )
+    logger.info("Hybrid retrieval over %d documents (%s fusion)", len(retriever.lexical_index), retriever.fusion)
+    return retriever
@@ -0,0 +1,233 @@
+"""Nested timing spans for one turn: guard, classification, retrieval, generation...
+
+    with span("details.retrieve", hybrid=True) as s:
+        ...
+        s.set_attribute("matches", len(matches))
+
+Every finished span is observed in the agent_stage_duration_seconds histogram
+and handed to the configured exporters (TRACE_EXPORTERS, comma separated):
+    memory  keep the last spans in RECENT_SPANS (default)
+    jsonl   append one JSON object per span to TRACE_JSONL_PATH
+    otlp    send OTLP/JSON batches to OTEL_EXPORTER_OTLP_ENDPOINT (an OpenTelemetry collector)
+"""
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .log import get_logger
+from .metrics import STAGE_DURATION
+
+logger = get_logger("tracing")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def get_attribute(self, key, default=None):
+        """Attribute of this span or the closest ancestor that has it (e.g. 'agent')."""
+        span = self
+        while span is not None:
+            if key in span.attributes:
+                return span.attributes[key]
+            span = span.parent
+        return default
+
+    @property
+    def duration(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    new_span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = repr(e)
+        raise
+    finally:
+        new_span.end_ns = time.time_ns()
+        _current_span.reset(token)
+        STAGE_DURATION.observe(new_span.duration, stage=name)
+        for exporter in EXPORTERS:
+            exporter.export(new_span)
+
+
+def set_attribute(key, value):
+    """Set an attribute on the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+# ---------------------------
+# Exporters
+# ---------------------------
+class InMemorySpanExporter:
+    def __init__(self, max_spans=2000):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, finished_span):
+        self.spans.append(finished_span)
+
+    def trace(self, trace_id) -> List[Span]:
+        return [s for s in list(self.spans) if s.trace_id == trace_id]
+
+
+class _BackgroundExporter:
+    """Hands spans to a daemon thread so exporting never blocks the request."""
+
+    def __init__(self, batch_size=256, flush_interval=2.0, max_queue=10_000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        threading.Thread(target=self._run, name=type(self).__name__, daemon=True).start()
+
+    def export(self, finished_span):
+        try:
+            self._queue.put_nowait(finished_span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                logger.warning("%s: failed to export %d spans: %r", type(self).__name__, len(batch), e)
+
+    def write(self, batch):
+        raise NotImplementedError
+
+
+class JsonLinesSpanExporter(_BackgroundExporter):
+    def __init__(self, path, **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+
+    def write(self, batch):
+        with open(self.path, "a") as f:
+            for finished_span in batch:
+                f.write(json.dumps(finished_span.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpSpanExporter(_BackgroundExporter):
+    """OTLP/HTTP with JSON encoding, understood by the OpenTelemetry collector, Jaeger, Tempo..."""
+
+    def __init__(self, endpoint, service_name="coffee-shop-agents", **kwargs):
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith("/v1/traces") else endpoint + "/v1/traces"
+        self.service_name = service_name
+        super().__init__(**kwargs)
+
+    def write(self, batch):
+        spans = []
+        for finished_span in batch:
+            spans.append({
+                "traceId": finished_span.trace_id,
+                "spanId": finished_span.span_id,
+                "parentSpanId": finished_span.parent.span_id if finished_span.parent is not None else "",
+                "name": finished_span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(finished_span.start_ns),
+                "endTimeUnixNano": str(finished_span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in finished_span.attributes.items()],
+                "status": {"code": 2, "message": finished_span.error} if finished_span.error else {"code": 1},
+            })
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "agents.tracing"}, "spans": spans}],
+        }]}
+
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(request, timeout=10).close()
+
+
+RECENT_SPANS = InMemorySpanExporter()
+
+
+def _exporters_from_env():
+    exporters = []
+    for name in os.getenv("TRACE_EXPORTERS", "memory").split(","):
+        name = name.strip().lower()
+        if name == "memory":
+            exporters.append(RECENT_SPANS)
+        elif name == "jsonl":
+            exporters.append(JsonLinesSpanExporter(os.getenv("TRACE_JSONL_PATH", "traces.jsonl")))
+        elif name == "otlp":
+            exporters.append(OtlpHttpSpanExporter(
+                os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"),
+                service_name=os.getenv("OTEL_SERVICE_NAME", "coffee-shop-agents")
+            ))
+        elif name and name != "none":
+            raise ValueError(f"Unknown trace exporter '{name}'")
+    return exporters
+
+
+EXPORTERS = _exporters_from_env()
@@ -0,0 +1,135 @@
+"""Token and LLM-call accounting per agent, per turn and per session, with budgets.
+
+The controller opens a turn with track_turn(); get_chatbot_response() records every
+call into it. Optional stages (JSON double-check, guard retries, LLM-written
+recommendations) ask should_downgrade() first and take a cheaper path once the
+turn or the session is over budget:
+
+    LLM_TURN_TOKEN_BUDGET      prompt + completion tokens for one turn (unset/0 = no limit)
+    LLM_SESSION_TOKEN_BUDGET   the same for a whole conversation
+
+Session totals travel in the "usage" memory of the assistant messages, so they
+work for session-keyed and full-transcript requests alike.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from .metrics import BUDGET_DOWNGRADES, LLM_TOKENS
+
+_current_turn: ContextVar = ContextVar("current_turn_usage", default=None)
+
+
+def estimate_tokens(text):
+    """Rough count for backends that don't report usage (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _budget_from_env(name):
+    value = int(os.getenv(name, "0") or 0)
+    return value if value > 0 else None
+
+
+class TurnUsage:
+    def __init__(self, session_before=None, turn_budget=None, session_budget=None):
+        self.session_before = dict(session_before or {})
+        self.turn_budget = turn_budget
+        self.session_budget = session_budget
+        self.by_agent: Dict[str, Dict[str, int]] = {}
+        self.downgrades: List[str] = []
+        self._lock = threading.Lock()
+
+    def record(self, agent, prompt_tokens, completion_tokens, estimated=False):
+        with self._lock:
+            counts = self.by_agent.setdefault(agent or "unknown", {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_calls": 0
+            })
+            counts["calls"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["completion_tokens"] += completion_tokens
+            counts["estimated_calls"] += int(estimated)
+
+    def _sum(self, key):
+        return sum(counts[key] for counts in list(self.by_agent.values()))
+
+    @property
+    def total_tokens(self):
+        return self._sum("prompt_tokens") + self._sum("completion_tokens")
+
+    @property
+    def session_tokens(self):
+        before = self.session_before.get("prompt_tokens", 0) + self.session_before.get("completion_tokens", 0)
+        return before + self.total_tokens
+
+    def over_budget(self):
+        if self.turn_budget is not None and self.total_tokens >= self.turn_budget:
+            return True
+        return self.session_budget is not None and self.session_tokens >= self.session_budget
+
+    def to_dict(self):
+        turn = {
+            "calls": self._sum("calls"),
+            "prompt_tokens": self._sum("prompt_tokens"),
+            "completion_tokens": self._sum("completion_tokens"),
+            "by_agent": {agent: dict(counts) for agent, counts in self.by_agent.items()},
+        }
+        session = {
+            key: self.session_before.get(key, 0) + turn[key]
+            for key in ("calls", "prompt_tokens", "completion_tokens")
+        }
+        session["turns"] = self.session_before.get("turns", 0) + 1
+
+        usage = {"turn": turn, "session": session}
+        if self.downgrades:
+            usage["downgrades"] = list(self.downgrades)
+        return usage
+
+
+def current_usage() -> Optional[TurnUsage]:
+    return _current_turn.get()
+
+
+def session_usage_from(messages):
+    """Session totals carried by the most recent assistant message, if any."""
+    for message in reversed(messages):
+        usage = (message.get("memory") or {}).get("usage")
+        if usage and "session" in usage:
+            return usage["session"]
+    return {}
+
+
+@contextmanager
+def track_turn(messages=(), turn_budget=None, session_budget=None):
+    usage = TurnUsage(
+        session_usage_from(messages),
+        turn_budget if turn_budget is not None else _budget_from_env("LLM_TURN_TOKEN_BUDGET"),
+        session_budget if session_budget is not None else _budget_from_env("LLM_SESSION_TOKEN_BUDGET"),
+    )
+    token = _current_turn.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_turn.reset(token)
+
+
+def record_llm_call(agent, model, prompt_tokens, completion_tokens, estimated=False):
+    LLM_TOKENS.inc(prompt_tokens, agent=agent, model=model, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, agent=agent, model=model, kind="completion")
+
+    usage = _current_turn.get()
+    if usage is not None:
+        usage.record(agent, prompt_tokens, completion_tokens, estimated)
+
+
+def should_downgrade(stage):
+    """True when the current turn is over budget; the caller then skips or templates `stage`."""
+    usage = _current_turn.get()
+    if usage is None or not usage.over_budget():
+        return False
+
+    with usage._lock:
+        usage.downgrades.append(stage)
+    BUDGET_DOWNGRADES.inc(stage=stage)
+    return True
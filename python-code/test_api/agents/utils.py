@@ -1,27 +1,106 @@
 import json
+import os
+from functools import lru_cache
 
-# Getting response from bedrock Llama
-def get_chatbot_response(client, model_id, messages, temperature=0.0):
-    formatted_prompt = convert_message_to_llama3_prompt(messages)
+from .log import get_logger
+from .metrics import LLM_CALLS
+from .tracing import span
+from .usage import estimate_tokens, record_llm_call, should_downgrade
+
+logger = get_logger("llm")
+
+
+@lru_cache(maxsize=None)
+def create_llm_client():
+    """LLM client shared by all agents, picked with LLM_BACKEND.
+
+    - bedrock (default): AWS Bedrock runtime
+    - openai: any OpenAI-compatible server (Ollama, vLLM, the local stub in benchmarks/) at LLM_BASE_URL
+    """
+    backend = os.getenv("LLM_BACKEND", "bedrock").lower()
+
+    if backend == "bedrock":
+        import boto3
+        return boto3.client(
+            service_name='bedrock-runtime',
+            region_name=os.getenv("AWS_REGION", "us-east-1")
+        )
+
+    if backend == "openai":
+        from openai import OpenAI
+        return OpenAI(
+            base_url=os.getenv("LLM_BASE_URL", "http://localhost:11434/v1"),
+            api_key=os.getenv("LLM_API_KEY", "ollama")
+        )
+
+    raise ValueError(f"Unknown LLM_BACKEND '{backend}' (expected 'bedrock' or 'openai')")
+
+
+def is_bedrock_client(client):
+    return hasattr(client, "invoke_model")
 
+
+# Getting response from bedrock Llama (or an OpenAI-compatible server)
+def get_chatbot_response(client, model_id, messages, temperature=0.0):
     input_messages = []
     for message in messages: 
         input_messages.append({"role": message["role"], "content": message["content"]})
 
-    print("Attempting to get LM response...")
+    logger.debug("Attempting to get LM response...")
+
+    with span("llm.generate", model=model_id) as llm_span:
+        agent = llm_span.get_attribute("agent", "")
+        LLM_CALLS.inc(agent=agent, model=model_id)
+
+        if not is_bedrock_client(client):
+            response = client.chat.completions.create(
+                model=os.getenv("LLM_MODEL", model_id),
+                messages=input_messages,
+                temperature=temperature,
+                top_p=0.8,
+                max_tokens=2000
+            )
+            output = (response.choices[0].message.content or "").strip()
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                _record_usage(llm_span, agent, model_id, usage.prompt_tokens, usage.completion_tokens)
+            else:
+                _record_usage(llm_span, agent, model_id, _estimate_prompt(input_messages), estimate_tokens(output), True)
+            return output
+
+        formatted_prompt = convert_message_to_llama3_prompt(messages)
+
+        response = client.invoke_model(
+            modelId=model_id,
+            body=json.dumps({
+                "max_gen_len": 2000,
+                "temperature": temperature,
+                "top_p": 0.8,
+                "prompt": formatted_prompt
+            })
+        )
 
-    response = client.invoke_model(
-        modelId=model_id,
-        body=json.dumps({
-            "max_gen_len": 2000,
-            "temperature": temperature,
-            "top_p": 0.8,
-            "prompt": formatted_prompt
-        })
-    )
+        response_body = json.loads(response['body'].read())
+        output = response_body.get("generation", "").strip()
+        if "prompt_token_count" in response_body:
+            _record_usage(llm_span, agent, model_id,
+                          response_body["prompt_token_count"], response_body.get("generation_token_count", 0))
+        else:
+            _record_usage(llm_span, agent, model_id, estimate_tokens(formatted_prompt), estimate_tokens(output), True)
+        return output
+
+
+def _estimate_prompt(messages):
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def _record_usage(llm_span, agent, model_id, prompt_tokens, completion_tokens, estimated=False):
+    llm_span.set_attribute("prompt_tokens", prompt_tokens)
+    llm_span.set_attribute("completion_tokens", completion_tokens)
+    if estimated:
+        llm_span.set_attribute("tokens_estimated", True)
+    record_llm_call(agent, model_id, prompt_tokens, completion_tokens, estimated)
 
-    response_body = json.loads(response['body'].read())
-    return response_body.get("generation", "").strip()
 
 # Converting OpenAI-like prompt to Bedrock llama3 prompt
 def convert_message_to_llama3_prompt(messages):
@@ -37,6 +116,10 @@ def convert_message_to_llama3_prompt(messages):
     return prompt
 
 def double_check_json_output(client,model_id,json_string):
+    # Over budget: hand back the model output as is, callers already parse it defensively
+    if should_downgrade("double_check_json"):
+        return json_string
+
     prompt = f""" 
     Return ONLY valid JSON that Python's json.loads() will accept.
     - All keys and string values must be double quoted.
@@ -49,6 +132,7 @@ def double_check_json_output(client,model_id,json_string):
 
     messages = [{"role": "user", "content": prompt}]
 
-    response = get_chatbot_response(client,model_id,messages)
+    with span("llm.double_check_json"):
+        response = get_chatbot_response(client,model_id,messages)
 
     return response
\ No newline at end of file
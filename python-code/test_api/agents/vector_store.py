@@ -0,0 +1,304 @@
+"""Vector stores behind one interface: Pinecone, or a local NumPy artifact.
+
+    store = create_vector_store()     # VECTOR_STORE=pinecone (default) | local
+    store.query(vector, top_k=2)      # {"matches": [{"id", "score", "metadata"}, ...]}
+
+The local store is a directory with
+    vectors.npy       float32 matrix, one L2-normalized row per document
+    metadata.jsonl    {"id": ..., "metadata": {...}} per row, in the same order
+    manifest.json     dimension, count, embedding model, sha256 of the other two
+The manifest is replaced last and a reload only takes files whose hashes match
+it, so a reload during a write never pairs new metadata with old vectors.
+The matrix is memory-mapped, so every worker process on the machine shares the
+same pages, and a query is one matrix-vector product plus a partial sort.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+DEFAULT_LOCAL_PATH = pathlib.Path(__file__).resolve().parent.parent / "vector_store"
+
+
+class VectorStore(Protocol):
+    name: str
+    # Largest upsert/delete the backend takes in one call (None = no limit)
+    upsert_batch_size: Optional[int]
+
+    def query(self, vector: Sequence[float], top_k: int = 2) -> Dict[str, Any]:
+        ...
+
+    def upsert(self, vectors: List[Dict[str, Any]]) -> None:
+        ...
+
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    def ready(self) -> bool:
+        ...
+
+    def list_ids(self) -> Optional[List[str]]:
+        ...
+
+
+class PineconeVectorStore:
+    upsert_batch_size = 100
+
+    def __init__(self, api_key=None, index_name=None, namespace="ns1", host=None):
+        from pinecone import Pinecone
+
+        self.pc = Pinecone(api_key=api_key)
+        self.name = index_name
+        self.namespace = namespace
+        self.host = host
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        # Resolving the index host is a control-plane round trip; do it once, not per query
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self.pc.Index(self.name, host=self.host or "")
+        return self._index
+
+    def query(self, vector, top_k=2):
+        results = self.index.query(
+            namespace=self.namespace,
+            # Plain floats: the client rejects np.float32 values
+            vector=np.asarray(vector, dtype=np.float32).tolist(),
+            top_k=top_k,
+            include_values=False,
+            include_metadata=True
+        )
+        return {"matches": [
+            {"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+            for match in results["matches"]
+        ]}
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=vectors, namespace=self.namespace)
+
+    def delete(self, ids):
+        if ids:
+            self.index.delete(ids=list(ids), namespace=self.namespace)
+
+    def ready(self):
+        return bool(self.name)
+
+    def ensure_index(self, dimension, metric="cosine", cloud="aws", region="us-east-1"):
+        """Create the serverless index if it doesn't exist (create_index waits until it's ready)."""
+        from pinecone import ServerlessSpec
+
+        if not self.pc.has_index(self.name):
+            self.pc.create_index(
+                name=self.name,
+                dimension=dimension,
+                metric=metric,
+                spec=ServerlessSpec(cloud=cloud, region=region)
+            )
+            self._index = None
+
+    def list_ids(self):
+        """Every id in the namespace (serverless indexes only; None when listing isn't supported)."""
+        try:
+            return [doc_id for page in self.index.list(namespace=self.namespace) for doc_id in page]
+        except Exception:
+            return None
+
+
+class LocalVectorStore:
+    # Every write rewrites the artifact, so take everything in one go
+    upsert_batch_size = None
+
+    def __init__(self, path=DEFAULT_LOCAL_PATH):
+        self.path = pathlib.Path(path)
+        self.name = str(self.path)
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.manifest: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self, attempts=5):
+        vectors_path = self.path / "vectors.npy"
+        if not vectors_path.exists():
+            return
+
+        for attempt in range(attempts):
+            try:
+                loaded = self._read()
+                break
+            except ValueError:
+                # Most likely a write in progress: the manifest is replaced last, give it a moment
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.05)
+
+        # Swap everything at once so a concurrent query never sees a half-loaded store
+        self.matrix, self.ids, self.metadata, self.manifest = loaded
+
+    def _read(self):
+        """(matrix, ids, metadata, manifest), each file opened once; ValueError if they don't belong together."""
+        vectors_path = self.path / "vectors.npy"
+        manifest_path = self.path / "manifest.json"
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        hashes = manifest.get("sha256", {})
+
+        with open(self.path / "metadata.jsonl", "rb") as f:
+            raw_metadata = f.read()
+        if hashes and hashlib.sha256(raw_metadata).hexdigest() != hashes.get("metadata.jsonl"):
+            raise ValueError(f"{self.path}: metadata.jsonl doesn't match manifest.json")
+        ids, metadata = [], []
+        for line in raw_metadata.decode("utf-8").splitlines():
+            if line.strip():
+                row = json.loads(line)
+                ids.append(row["id"])
+                metadata.append(row["metadata"])
+
+        with open(vectors_path, "rb") as f:
+            # Hash and map the same file, even if a writer replaces vectors.npy in between
+            if hashes and _file_sha256(f) != hashes.get("vectors.npy"):
+                raise ValueError(f"{vectors_path} doesn't match manifest.json")
+            f.seek(0)
+            matrix = _memmap_npy(f)
+        if matrix.shape[0] != len(ids):
+            raise ValueError(f"{vectors_path} has {matrix.shape[0]} rows but metadata has {len(ids)}")
+
+        return matrix, ids, metadata, manifest
+
+    def query(self, vector, top_k=2):
+        matrix = self.matrix
+        if matrix is None or matrix.shape[0] == 0:
+            return {"matches": []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # Rows are normalized, so the dot product is the cosine similarity
+        scores = matrix @ query
+        top_k = min(top_k, scores.shape[0])
+        if top_k < scores.shape[0]:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return {"matches": [
+            {"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadata[i]}
+            for i in order
+        ]}
+
+    def upsert(self, vectors):
+        """Insert or replace rows by id; the artifact is rewritten (the knowledge base is small)."""
+        with self._lock:
+            rows = {doc_id: (self.matrix[i], meta) for i, (doc_id, meta) in enumerate(zip(self.ids, self.metadata))}
+            for vector in vectors:
+                rows[vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata", {}))
+            self._write(rows)
+
+    def delete(self, ids):
+        with self._lock:
+            ids = set(ids)
+            rows = {
+                doc_id: (self.matrix[i], meta)
+                for i, (doc_id, meta) in enumerate(zip(self.ids, self.metadata)) if doc_id not in ids
+            }
+            self._write(rows)
+
+    def _write(self, rows):
+        write_local_store(
+            self.path,
+            ids=list(rows),
+            vectors=[values for values, _ in rows.values()],
+            metadata=[meta for _, meta in rows.values()],
+            model=self.manifest.get("model")
+        )
+        self.reload()
+
+    def ready(self):
+        return self.matrix is not None
+
+    def list_ids(self):
+        return list(self.ids)
+
+
+def _file_sha256(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _memmap_npy(f):
+    """np.load(mmap_mode="r") for an open .npy file (np.load only maps paths)."""
+    if np.lib.format.read_magic(f) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(f, dtype=dtype, mode="r", shape=shape, offset=f.tell(), order="F" if fortran_order else "C")
+
+
+def write_local_store(path, ids, vectors, metadata, model=None):
+    """Write a local store artifact; each file is replaced atomically, the manifest with the
+    hashes of the other two last."""
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if not len(ids):
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    elif matrix.ndim == 1:
+        matrix = matrix.reshape(len(ids), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+
+    suffix = f".{os.getpid()}.tmp"
+    with open(path / ("metadata.jsonl" + suffix), "w") as f:
+        for doc_id, meta in zip(ids, metadata):
+            f.write(json.dumps({"id": doc_id, "metadata": dict(meta)}) + "\n")
+    with open(path / ("vectors.npy" + suffix), "wb") as f:
+        np.save(f, matrix)
+    hashes = {}
+    for name in ("metadata.jsonl", "vectors.npy"):
+        with open(path / (name + suffix), "rb") as f:
+            hashes[name] = _file_sha256(f)
+    with open(path / ("manifest.json" + suffix), "w") as f:
+        json.dump({
+            "dimension": int(matrix.shape[1]) if matrix.size else 0,
+            "count": len(ids),
+            "model": model,
+            "metric": "cosine",
+            "sha256": hashes
+        }, f, indent=2)
+
+    for name in ("metadata.jsonl", "vectors.npy", "manifest.json"):
+        os.replace(path / (name + suffix), path / name)
+
+
+def create_vector_store() -> VectorStore:
+    backend = os.getenv("VECTOR_STORE", "pinecone").lower()
+
+    if backend == "pinecone":
+        return PineconeVectorStore(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            index_name=os.getenv("PINECONE_INDEX_NAME"),
+            namespace=os.getenv("PINECONE_NAMESPACE", "ns1"),
+            host=os.getenv("PINECONE_INDEX_HOST")
+        )
+
+    if backend == "local":
+        return LocalVectorStore(os.getenv("LOCAL_VECTOR_STORE_PATH", str(DEFAULT_LOCAL_PATH)))
+
+    raise ValueError(f"Unknown VECTOR_STORE '{backend}' (expected 'pinecone' or 'local')")
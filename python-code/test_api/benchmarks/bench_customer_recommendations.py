@@ -0,0 +1,78 @@
+"""Personalized recommendations: lookup latency and memory as the customer base grows.
+
+The trained customer_affinity.npz (about 2,000 loyalty customers) is
+replicated with fresh customer ids up to each size, then every run looks up
+random known customers, with and without a basket, plus unknown ones (which
+fall back to the global lists in the agent).
+
+Run from the test_api folder:
+    python -m benchmarks.bench_customer_recommendations
+    python -m benchmarks.bench_customer_recommendations --customers 2000,100000,1000000
+"""
+import argparse
+import pathlib
+import random
+import time
+
+import numpy as np
+
+from agents.recommendation_index import CustomerIndex
+
+FOLDER = pathlib.Path(__file__).resolve().parent.parent
+
+
+def replicated(index, customers):
+    """`index` with its customers copied (new ids) until there are `customers` of them."""
+    copies = -(-customers // len(index))
+    lengths = np.diff(index.indptr)
+    offset = int(index.customer_ids.max()) + 1
+    customer_ids = np.concatenate([index.customer_ids + i * offset for i in range(copies)])[:customers]
+    lengths = np.tile(lengths, copies)[:customers]
+    nonzeros = int(lengths.sum())
+    return CustomerIndex(
+        index.products, index.categories, index.related - np.eye(len(index.products), dtype=np.float32),
+        customer_ids, np.concatenate([[0], np.cumsum(lengths)]),
+        np.tile(index.indices, copies)[:nonzeros], np.tile(index.affinity, copies)[:nonzeros],
+    )
+
+
+def percentiles(fn, args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        for arg in args:
+            start = time.perf_counter()
+            fn(*arg)
+            times.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(times, [50, 99]) * 1e6
+    return p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=str(FOLDER / "recommendation_objects" / "customer_affinity.npz"))
+    parser.add_argument("--customers", default="2000,10000,100000")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    base = CustomerIndex.from_npz(args.path)
+    rng = random.Random(0)
+
+    print(f"{'customers':>10} {'memory':>10} {'lookup':<16} {'p50':>8} {'p99':>8}")
+    for customers in (int(n) for n in args.customers.split(",")):
+        index = replicated(base, customers)
+        known = [int(c) for c in rng.choices(list(index.customer_ids), k=args.lookups)]
+        basket = [rng.sample(index.products, 2) for _ in known]
+        unknown = [int(index.customer_ids.max()) + 1 + i for i in range(args.lookups)]
+
+        runs = [
+            ("known", index.recommend, [(c,) for c in known]),
+            ("known + basket", index.recommend, list(zip(known, basket))),
+            ("unknown", index.recommend, [(c,) for c in unknown]),
+        ]
+        for name, fn, calls in runs:
+            p50, p99 = percentiles(fn, calls)
+            print(f"{customers:>10} {index.nbytes / 2**20:>6.2f} MiB {name:<16} {p50:>6.1f}us {p99:>6.1f}us")
+
+
+if __name__ == "__main__":
+    main()
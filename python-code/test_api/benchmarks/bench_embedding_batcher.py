@@ -0,0 +1,162 @@
+"""Throughput and latency of query embedding with and without the micro-batcher.
+
+Run from the test_api folder:
+    python -m benchmarks.bench_embedding_batcher
+    python -m benchmarks.bench_embedding_batcher --sessions 1,8,64 --requests 20 --wait-ms 2 --batch-size 32
+    EMBEDDING_BACKEND=onnx python -m benchmarks.bench_embedding_batcher --mode asyncio
+
+Every session sends `--requests` encode calls back to back, each one a text no
+other call uses, so the cache never answers and every call reaches the model.
+    direct     each session calls the encoder on its own single text
+    batched    sessions submit to one shared EmbeddingBatcher
+With --mode asyncio the sessions are coroutines on one event loop and the direct
+variant runs the encoder in the default thread pool (what the server does).
+
+Before timing, a cancelled encode_async is checked not to take the batcher down.
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from agents.embedding_batcher import EmbeddingBatcher
+from agents.embeddings import create_encoder
+
+QUESTION_TEMPLATES = [
+    "What's in the {} latte?",
+    "How much does a {} croissant cost?",
+    "Is the {} scone vegan?",
+    "Do you have {} syrup for my cappuccino?",
+]
+
+
+def question(session, i):
+    return QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)].format(f"session {session} request {i}")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# ---------------------------
+# Threads
+# ---------------------------
+def run_threads(encode, sessions, requests):
+    latencies = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(sessions)
+
+    def session(n):
+        start_line.wait()
+        own = []
+        for i in range(requests):
+            started = time.perf_counter()
+            encode(question(n, i))
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+# ---------------------------
+# asyncio
+# ---------------------------
+def run_asyncio(encode_async, sessions, requests):
+    latencies = []
+
+    async def session(n):
+        for i in range(requests):
+            started = time.perf_counter()
+            await encode_async(question(n, i))
+            latencies.append(time.perf_counter() - started)
+
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(session(n) for n in range(sessions)))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    return latencies, elapsed
+
+
+def check_cancelled(encode_fn):
+    """A cancelled encode_async must not stop the worker: the next encode still gets its vector."""
+    batcher = EmbeddingBatcher(lambda texts: time.sleep(0.05) or encode_fn(texts), max_batch=4, max_wait_ms=1)
+
+    async def cancel_one():
+        task = asyncio.ensure_future(batcher.encode_async("cancelled before its batch ran"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel_one())
+    try:
+        batcher.encode("asked after the cancel", timeout=5)
+    except FutureTimeoutError:
+        raise SystemExit("cancelled encode_async stopped the batcher worker")
+    finally:
+        batcher.close()
+
+
+def report(name, sessions, latencies, elapsed, batch_sizes=None):
+    line = (
+        f"{name:<10} {sessions:>8} {len(latencies) / elapsed:>10.1f} "
+        f"{percentile(latencies, 50) * 1e3:>9.2f} {percentile(latencies, 95) * 1e3:>9.2f} "
+        f"{percentile(latencies, 99) * 1e3:>9.2f}"
+    )
+    if batch_sizes:
+        line += f" {statistics.mean(batch_sizes):>10.1f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,8,64", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="encode calls per session")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-ms", type=float, default=2.0)
+    parser.add_argument("--mode", choices=("threads", "asyncio"), default="threads")
+    args = parser.parse_args()
+
+    encoder = create_encoder()
+    encoder.load()
+    encoder.encode(["warm up the model"] * 4)
+    check_cancelled(encoder.encode)
+    print(f"encoder: {encoder.model_name}, mode: {args.mode}, batch size {args.batch_size}, wait {args.wait_ms} ms\n")
+    print(f"{'variant':<10} {'sessions':>8} {'enc/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean batch':>10}")
+
+    for sessions in (int(n) for n in args.sessions.split(",")):
+        direct = lambda text: encoder.encode([text])[0]
+        if args.mode == "threads":
+            latencies, elapsed = run_threads(direct, sessions, args.requests)
+        else:
+            async def direct_async(text):
+                return await asyncio.get_running_loop().run_in_executor(None, direct, text)
+            latencies, elapsed = run_asyncio(direct_async, sessions, args.requests)
+        report("direct", sessions, latencies, elapsed)
+
+        batches = []
+        batcher = EmbeddingBatcher(
+            lambda texts: batches.append(len(texts)) or encoder.encode(texts),
+            max_batch=args.batch_size, max_wait_ms=args.wait_ms, name="bench"
+        )
+        if args.mode == "threads":
+            latencies, elapsed = run_threads(batcher.encode, sessions, args.requests)
+        else:
+            latencies, elapsed = run_asyncio(batcher.encode_async, sessions, args.requests)
+        batcher.close()
+        report("batched", sessions, latencies, elapsed, batches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""CPU micro-benchmarks for the non-LLM code that runs on every turn.
+
+Run from the test_api folder:
+    python -m benchmarks.bench_hot_paths                   # compare with the saved baseline
+    python -m benchmarks.bench_hot_paths --save-baseline   # record a new baseline
+    python -m benchmarks.bench_hot_paths --filter apriori --threshold 0.1
+
+Every path is timed on fixed inputs from small up to adversarially large:
+    json.*        brace-scan JSON extraction (guard, classifier, recommendation classifier)
+                  and the order agent's find/rfind loader
+    apriori.*     RecommendationAgent.get_apriori_recommendations
+    popular.*     RecommendationAgent.get_popular_recommendations
+    history.*     handing the transcript to the agents (MessageHistory, deepcopy for reference)
+    cleanup.*     the beautify_output regex cleanup in api/development_code.py
+
+Baselines are machine specific, so record one on the machine you compare on.
+The exit status is 1 when a case got slower than baseline * (1 + threshold).
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import pathlib
+import platform
+import random
+import sys
+import tempfile
+import time
+from copy import deepcopy
+
+from agents import ClassificationAgent, GuardAgent, OrderTakingAgent, RecommendationAgent
+from agents.log import configure_logging
+from agents.message_history import MessageHistory, replace_last_content
+from benchmarks.bench_message_history import build_transcript
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+RECOMMENDATION_OBJECTS = ROOT / "recommendation_objects"
+DEFAULT_BASELINE = pathlib.Path(__file__).resolve().parent / "baselines" / "hot_paths.json"
+
+SIZES = ("small", "medium", "large", "adversarial")
+
+
+# ---------------------------
+# Inputs
+# ---------------------------
+def json_outputs():
+    answer = json.dumps({
+        "chain_of_thought": "The user asks for a latte, which is an order.",
+        "decision": "allowed",
+        "recommendation_type": "popular",
+        "parameters": [],
+        "message": ""
+    })
+    chatter = "Sure! Here is the JSON you asked for, based on the conversation so far. "
+    return {
+        "small": answer,
+        "medium": chatter * 4 + "```json\n" + answer + "\n```" + chatter,
+        # a long rambling answer with a few braces in the prose before the real object
+        "large": (chatter + "{not json} ") * 200 + answer + chatter * 50,
+        # thousands of balanced-but-invalid objects, every one of them goes through json.loads
+        "adversarial": "{x}" * 20_000 + answer,
+    }
+
+
+def synthetic_recommendation_objects(folder, products, categories, rows_per_product=3):
+    """Apriori rules and a popularity table for a made-up catalogue of `products` items."""
+    rng = random.Random(42)
+    names = [f"Product {i}" for i in range(products)]
+    category_of = {name: f"Category {i % categories}" for i, name in enumerate(names)}
+
+    rules = {
+        name: [
+            {"product": other, "product_category": category_of[other], "confidence": rng.random()}
+            for other in rng.sample(names, min(rows_per_product, products))
+        ]
+        for name in names
+    }
+    apriori_path = os.path.join(folder, "apriori_recommendations.json")
+    with open(apriori_path, "w") as f:
+        json.dump(rules, f)
+
+    popularity_path = os.path.join(folder, "popularity_recommendation.csv")
+    with open(popularity_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["product", "product_category", "number_of_transactions"])
+        for name in names:
+            writer.writerow([name, category_of[name], rng.randint(1, 10_000)])
+
+    return apriori_path, popularity_path, names, sorted(set(category_of.values()))
+
+
+def _cleanup_function():
+    """clean_output_text from api/development_code.py (a separate tree, so load it by path)."""
+    path = ROOT.parent / "api" / "development_code.py"
+    spec = importlib.util.spec_from_file_location("api_development_code", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.clean_output_text
+
+
+def cleanup_texts():
+    reply = "Here are a few ideas:\n\n\n-   **Latte**   with   oat milk\n\n  \n- Croissant  \n\n\n\nEnjoy!   "
+    return {
+        "small": reply,
+        "medium": reply * 20,
+        "large": reply * 1_000,
+        # long runs of whitespace-only lines and spaces that the patterns have to walk through
+        "adversarial": ("\n" + " \t " * 200) * 2_000 + "x" + " " * 100_000,
+    }
+
+
+def build_cases():
+    """name -> (fn, arg); fn(arg) is one timed call."""
+    cases = {}
+
+    # JSON extraction: the agents' postprocess methods don't need a model client
+    guard = object.__new__(GuardAgent)
+    classifier = object.__new__(ClassificationAgent)
+    order_agent = object.__new__(OrderTakingAgent)
+
+    real = RecommendationAgent(
+        str(RECOMMENDATION_OBJECTS / "apriori_recommendations.json"),
+        str(RECOMMENDATION_OBJECTS / "popularity_recommendation.csv")
+    )
+
+    context = [{"role": "user", "content": "I'd like a latte"}]
+    for size, text in json_outputs().items():
+        cases[f"json.guard.{size}"] = (lambda t: guard.postprocess(t, "I'd like a latte", context), text)
+        cases[f"json.classification.{size}"] = (classifier.postprocess, text)
+        cases[f"json.recommendation.{size}"] = (real.postprocess_classfication, text)
+        cases[f"json.order_safe_load.{size}"] = (order_agent._safe_json_load, text)
+
+    # Recommendations on the shipped artifacts, and on a big synthetic catalogue for the adversarial case
+    products = list(real.products)
+    cases["apriori.small"] = (real.get_apriori_recommendations, products[:1])
+    cases["apriori.medium"] = (real.get_apriori_recommendations, products[:5])
+    cases["apriori.large"] = (real.get_apriori_recommendations, products)
+
+    cases["popular.small"] = (lambda categories: real.get_popular_recommendations(categories), None)
+    cases["popular.medium"] = (lambda categories: real.get_popular_recommendations(categories), "Coffee")
+    cases["popular.large"] = (lambda categories: real.get_popular_recommendations(categories), list(real.product_categories))
+
+    tmp = tempfile.mkdtemp(prefix="bench_hot_paths_")
+    apriori_path, popularity_path, names, categories = synthetic_recommendation_objects(
+        tmp, products=20_000, categories=50, rows_per_product=20
+    )
+    big = RecommendationAgent(apriori_path, popularity_path)
+    cases["apriori.adversarial"] = (big.get_apriori_recommendations, names[:500])
+    cases["popular.adversarial"] = (lambda categories: big.get_popular_recommendations(categories), categories[:25])
+
+    # Transcript handling for one agent call
+    for size, turns in zip(SIZES, (10, 100, 1_000, 10_000)):
+        messages = build_transcript(turns)
+        history = MessageHistory(messages)
+        cases[f"history.message_history.{size}"] = (
+            lambda h: [{"role": "system", "content": "system"}] + replace_last_content(MessageHistory.coerce(h)[-3:], "prompt"),
+            history
+        )
+        if turns <= 1_000:
+            cases[f"history.deepcopy.{size}"] = (lambda m: deepcopy(m)[-3:], messages)
+
+    clean_output_text = _cleanup_function()
+    for size, text in cleanup_texts().items():
+        cases[f"cleanup.{size}"] = (clean_output_text, text)
+
+    return cases
+
+
+# ---------------------------
+# Timing
+# ---------------------------
+def time_case(fn, arg, min_time=0.2, repeat=5):
+    """Best per-call time over `repeat` rounds that take about `min_time` together."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn(arg)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / (repeat * 100) else 2
+
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn(arg)
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds spent per case")
+    args = parser.parse_args()
+
+    # The adversarial inputs make the agents warn on every call; time the parsing, not the logging
+    configure_logging(level="ERROR")
+
+    cases = {name: case for name, case in build_cases().items() if args.filter in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'case':<40} {'time':>12} {'baseline':>12} {'change':>8}")
+    for name, (fn, arg) in cases.items():
+        seconds = time_case(fn, arg, min_time=args.min_time)
+        results[name] = seconds
+
+        line = f"{name:<40} {format_time(seconds):>12}"
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            flag = ""
+            if change > args.threshold:
+                regressions.append(name)
+                flag = "  REGRESSION"
+            line += f" {format_time(baseline[name]):>12} {change * 100:>+7.1f}%{flag}"
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        merged = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+                "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "results": merged
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+    elif regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+    else:
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
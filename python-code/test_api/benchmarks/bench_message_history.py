@@ -0,0 +1,85 @@
+"""Per-turn cost of handing the transcript to the agents: deepcopy vs MessageHistory.
+
+Run from the test_api folder:
+    python -m benchmarks.bench_message_history
+"""
+import time
+import tracemalloc
+from copy import deepcopy
+
+from agents.message_history import MessageHistory, replace_last_content
+
+# guard, classifier, chosen agent, nested recommendation call... as in a typical order turn
+AGENT_CALLS_PER_TURN = 6
+TURNS = (10, 100, 1000)
+REPEAT = 20
+
+
+def build_transcript(turns):
+    messages = []
+    order = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"I'd like {turn % 3 + 1} latte(s) and a croissant please"})
+        order = order + [{"item": "Latte", "quantity": turn % 3 + 1, "price": 4.75}] if len(order) < 10 else order
+        messages.append({
+            "role": "assistant",
+            "content": "Sure! I've added that to your order. Would you like anything else?",
+            "memory": {
+                "agent": "order_taking_agent",
+                "step_number": turn + 1,
+                "order": order,
+                "order_id": "b6f4d2a8-0c5e-4f0b-9a3c-1f2e3d4c5b6a",
+                "order_finalized": False,
+                "asked_recommendation_before": True
+            }
+        })
+    messages.append({"role": "user", "content": "What pastry goes well with it?"})
+    return messages
+
+
+def turn_with_deepcopy(messages):
+    for _ in range(AGENT_CALLS_PER_TURN):
+        copied = deepcopy(messages)
+        copied[-1]["content"] = "prompt"
+        input_messages = [{"role": "system", "content": "system"}] + copied[-3:]
+    return input_messages
+
+
+def turn_with_history(history):
+    for _ in range(AGENT_CALLS_PER_TURN):
+        history = MessageHistory.coerce(history)
+        input_messages = [{"role": "system", "content": "system"}] + replace_last_content(history[-3:], "prompt")
+    return input_messages
+
+
+def measure(fn, arg):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(arg)
+    elapsed = (time.perf_counter() - start) / REPEAT
+
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print(f"{'turns':>6} | {'deepcopy ms':>12} {'peak KiB':>9} | {'history ms':>11} {'peak KiB':>9} | {'speedup':>8}")
+    for turns in TURNS:
+        messages = build_transcript(turns)
+        # The controller freezes the request once; in session mode only the new message is frozen
+        history = MessageHistory(messages)
+
+        old_time, old_peak = measure(turn_with_deepcopy, messages)
+        new_time, new_peak = measure(turn_with_history, history)
+
+        print(
+            f"{turns:>6} | {old_time * 1000:>12.3f} {old_peak / 1024:>9.1f} | "
+            f"{new_time * 1000:>11.3f} {new_peak / 1024:>9.1f} | {old_time / new_time:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Training the recommendation objects: train_recommendations.py vs the notebook's method.
+
+The notebook reads the whole receipts file, merges it with the products,
+builds a dense transactions x products pivot table and encodes it cell by
+cell with applymap before apriori. train_recommendations.py streams the
+receipts and builds a sparse boolean matrix. Both run on the April receipts
+and on copies scaled up with fresh transaction ids (the same baskets, more of
+them), with time and tracemalloc peak memory per run.
+
+Run from the test_api folder:
+    python -m benchmarks.bench_recommendation_training
+    python -m benchmarks.bench_recommendation_training --scales 1,10,40
+"""
+import argparse
+import pathlib
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import train_recommendations as training
+from train_recommendations import CUSTOMERS_FILE, GENERATIONS_FILE, OUTLETS_FILE, PRODUCTS_FILE, PRODUCTS_TO_TAKE, RECEIPTS_FILE
+
+
+def train_dense(data_dir, min_support=0.05, min_lift=1.0):
+    """The notebook, cell for cell."""
+    import pandas as pd
+    from mlxtend.frequent_patterns import apriori, association_rules
+
+    data_dir = pathlib.Path(data_dir)
+    receipts = pd.read_csv(data_dir / RECEIPTS_FILE)
+    products = pd.read_csv(data_dir / PRODUCTS_FILE)
+    dataset = pd.merge(receipts[["transaction_id", "customer_id", "product_id", "quantity"]],
+                       products[["product_id", "product_category", "product"]], how="left", on="product_id")
+    for suffix in (" Rg", " Sm", " Lg"):
+        dataset["product"] = dataset["product"].str.replace(suffix, "")
+    dataset = dataset[dataset["product"].isin(PRODUCTS_TO_TAKE)].copy()
+    dataset["transaction"] = dataset["transaction_id"].astype("str") + "_" + dataset["customer_id"].astype("str")
+    lines = dataset["transaction"].value_counts()
+    dataset = dataset[dataset["transaction"].isin(lines[lines > 1].index)]
+
+    basket = (dataset.groupby(["transaction", "product"])["product"].count().reset_index(name="count")
+              .pivot_table(index="transaction", columns="product", values="count", aggfunc="sum").fillna(0))
+    basket_sets = basket.map(lambda x: 1 if x > 0 else 0).astype(bool)
+
+    frequent = apriori(basket_sets, min_support=min_support, use_colnames=True)
+    return association_rules(frequent, num_itemsets=len(basket_sets), metric="lift", min_threshold=min_lift)
+
+
+def scaled_copy(data_dir, scale, out_dir):
+    """The receipts `scale` times over, every copy with its own transaction ids."""
+    import pandas as pd
+
+    receipts = pd.read_csv(pathlib.Path(data_dir) / RECEIPTS_FILE)
+    offset = int(receipts["transaction_id"].max()) + 1
+    copies = [receipts.assign(transaction_id=receipts["transaction_id"] + i * offset) for i in range(scale)]
+    pd.concat(copies, ignore_index=True).to_csv(pathlib.Path(out_dir) / RECEIPTS_FILE, index=False)
+    for name in (PRODUCTS_FILE, CUSTOMERS_FILE, GENERATIONS_FILE, OUTLETS_FILE):
+        shutil.copyfile(pathlib.Path(data_dir) / name, pathlib.Path(out_dir) / name)
+    return len(receipts) * scale
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=str(training.DEFAULT_DATA_DIR))
+    parser.add_argument("--scales", default="1,5,20", help="comma-separated copies of the receipts")
+    args = parser.parse_args()
+
+    # Imports aren't part of either method's cost
+    import mlxtend.frequent_patterns  # noqa: F401
+    import pandas  # noqa: F401
+    import scipy.sparse  # noqa: F401
+
+    print(f"{'lines':>9} {'method':<8} {'time':>9} {'peak':>10} {'rules':>6}")
+    for scale in (int(s) for s in args.scales.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            lines = scaled_copy(args.data_dir, scale, tmp) if scale > 1 else None
+            data_dir = tmp if scale > 1 else args.data_dir
+            lines = lines or sum(1 for _ in open(pathlib.Path(data_dir) / RECEIPTS_FILE)) - 1
+
+            (_, _, _, _, counts, stages), seconds, _ = measure(training.train, data_dir)
+            # train() resets the peak per stage, so its peak is the largest stage peak
+            peak = max(stage["peak_mib"] for stage in stages.results.values())
+            print(f"{lines:>9} {'sparse':<8} {seconds:>8.2f}s {peak:>7.1f} MiB {counts['rules']:>6}")
+            rules, seconds, peak = measure(train_dense, data_dir)
+            print(f"{lines:>9} {'dense':<8} {seconds:>8.2f}s {peak:>7.1f} MiB {len(rules):>6}")
+
+
+if __name__ == "__main__":
+    main()
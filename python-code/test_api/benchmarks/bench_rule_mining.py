@@ -0,0 +1,84 @@
+"""Mining the association rules: bitset_miner.py vs mlxtend's apriori.
+
+The April receipts are parsed once, then replicated in memory with fresh
+transaction ids (the same baskets, more of them) up to each line count. Both
+engines get the same sparse basket matrix from train_recommendations and must
+produce the same rules; the bitset engine runs with one process and with
+--workers processes over the transaction shards.
+
+Run from the test_api folder:
+    python -m benchmarks.bench_rule_mining
+    python -m benchmarks.bench_rule_mining --lines 50000,1000000,10000000 --workers 8
+    python -m benchmarks.bench_rule_mining --mlxtend-max 1000000   # skip mlxtend on the big ones
+"""
+import argparse
+import os
+import pathlib
+import time
+
+import numpy as np
+
+import bitset_miner
+import train_recommendations as training
+from train_recommendations import PRODUCTS_FILE, PRODUCTS_TO_TAKE, RECEIPTS_FILE
+
+
+def replicate(keys, product_ids, lines):
+    """`lines` receipt lines: copies of the parsed ones, every copy with its own transaction ids."""
+    copies = -(-lines // len(keys))
+    offset = int(keys.max()) + 1
+    keys = np.concatenate([keys + i * offset for i in range(copies)])[:lines]
+    return keys, np.tile(product_ids, copies)[:lines]
+
+
+def rule_set(rules):
+    return {
+        (frozenset(row.antecedents), frozenset(row.consequents), round(row.confidence, 12), round(row.lift, 12))
+        for row in rules.itertuples()
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=str(training.DEFAULT_DATA_DIR))
+    parser.add_argument("--lines", default="50000,1000000,10000000", help="comma-separated receipt line counts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mlxtend-max", type=int, default=10_000_000, help="largest line count to run mlxtend on")
+    parser.add_argument("--min-support", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Imports aren't part of either engine's cost
+    import mlxtend.frequent_patterns  # noqa: F401
+    import pandas  # noqa: F401
+    import scipy.sparse  # noqa: F401
+
+    data_dir = pathlib.Path(args.data_dir)
+    _, product_columns = training.load_products(data_dir / PRODUCTS_FILE)
+    keys, _, product_ids, _, _ = training.read_lines([data_dir / RECEIPTS_FILE], product_columns)
+
+    print(f"{'lines':>9} {'baskets':>9} {'engine':<14} {'time':>9} {'rules':>6}")
+    for lines in (int(n) for n in args.lines.split(",")):
+        matrix, _ = training.basket_matrix(*replicate(keys, product_ids, lines), product_columns)
+        runs = [("bitset x1", lambda: bitset_miner.mine_rules(matrix, PRODUCTS_TO_TAKE, args.min_support, workers=1))]
+        if args.workers > 1:
+            runs.append((f"bitset x{args.workers}",
+                         lambda: bitset_miner.mine_rules(matrix, PRODUCTS_TO_TAKE, args.min_support, workers=args.workers)))
+        if lines <= args.mlxtend_max:
+            runs.append(("mlxtend", lambda: training.mine_rules(matrix, args.min_support, engine="mlxtend")))
+
+        reference = None
+        for name, run in runs:
+            rules, seconds = timed(run)
+            same = "" if reference is None or rule_set(rules) == reference else "  (rules differ!)"
+            reference = reference if reference is not None else rule_set(rules)
+            print(f"{lines:>9} {matrix.shape[0]:>9} {name:<14} {seconds:>8.3f}s {len(rules):>6}{same}")
+
+
+if __name__ == "__main__":
+    main()
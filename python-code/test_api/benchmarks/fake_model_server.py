@@ -0,0 +1,330 @@
+"""Fake OpenAI/Ollama-compatible model server for running the agents locally without Bedrock.
+
+Replies are scripted per agent prompt, so the whole pipeline (guard, classifier,
+order taking, recommendations, details) gets JSON it can parse. Latency follows
+a simple model of an LLM server: a fixed overhead, prefill time proportional to
+the prompt tokens, decode time proportional to the completion tokens, and a
+limited number of generation slots.
+
+    python -m benchmarks.fake_model_server --port 8001 --prefill-tps 2000 --decode-tps 40
+    LLM_BACKEND=openai LLM_BASE_URL=http://localhost:8001/v1 python main.py
+
+Endpoints: POST /v1/chat/completions (OpenAI), POST /api/chat and /api/generate
+(Ollama), GET /v1/models, GET /stats (request counts per agent prompt).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MENU = {
+    "cappuccino": ("Cappuccino", 4.50),
+    "jumbo savory scone": ("Jumbo Savory Scone", 3.25),
+    "latte": ("Latte", 4.75),
+    "chocolate chip biscotti": ("Chocolate Chip Biscotti", 2.50),
+    "espresso": ("Espresso shot", 2.00),
+    "hazelnut biscotti": ("Hazelnut Biscotti", 2.75),
+    "chocolate croissant": ("Chocolate Croissant", 3.75),
+    "cranberry scone": ("Cranberry Scone", 3.50),
+    "almond croissant": ("Almond Croissant", 4.00),
+    "croissant": ("Croissant", 3.25),
+    "ginger biscotti": ("Ginger Biscotti", 2.50),
+    "oatmeal scone": ("Oatmeal Scone", 3.25),
+    "ginger scone": ("Ginger Scone", 3.50),
+}
+
+CATEGORY_WORDS = {
+    "Coffee": ("coffee", "latte", "cappuccino", "espresso"),
+    "Bakery": ("pastry", "pastries", "bakery", "scone", "croissant", "biscotti"),
+    "Flavours": ("syrup", "flavour", "flavor"),
+    "Chocolate": ("chocolate",),
+}
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+
+
+def last_user_content(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+
+def find_items(text):
+    """Menu items mentioned in `text`, longest names first so 'almond croissant' wins over 'croissant'."""
+    text = text.lower()
+    found = []
+    for key in sorted(MENU, key=len, reverse=True):
+        match = re.search(r"(\d+|a|an|one|two|three|four|five)?\s*" + re.escape(key), text)
+        if match:
+            qty = match.group(1)
+            qty = int(qty) if qty and qty.isdigit() else NUMBERS.get(qty, 1)
+            found.append((MENU[key][0], qty, MENU[key][1]))
+            text = text.replace(key, " ")
+    return found
+
+
+def classify(text):
+    text = text.lower()
+    if any(word in text for word in ("recommend", "suggest", "what goes well", "what should i")):
+        return "recommendation_agent"
+    if any(word in text for word in ("i'd like", "i want", "i'll have", "get me", "order", "add", "that's all", "finalize")):
+        return "order_taking_agent"
+    return "details_agent"
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for English prompts
+    return max(1, len(text) // 4)
+
+
+def route_of(messages):
+    """Name of the agent prompt this request comes from."""
+    system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = last_user_content(messages)
+
+    if "Here is the json string to fix:" in user:
+        return "double_check_json"
+    if "content filter" in system:
+        return "guard"
+    if "classification agent" in system:
+        return "classification"
+    if "intent-classifier" in system:
+        return "order_intent"
+    if "Order Taking Agent" in system:
+        return "order_response"
+    if "Determine the type of recommendation" in system:
+        return "recommendation_classification"
+    if "recommend these items exactly:" in user:
+        return "recommendation"
+    if "Return ONLY valid JSON" in system:
+        return "json_repair"
+    return "details"
+
+
+def scripted_reply(messages, overrides=None):
+    """Pick a reply based on which agent's prompt this is. Returns (route, content)."""
+    route = route_of(messages)
+    if overrides and route in overrides:
+        return route, overrides[route]
+    return route, _scripted_content(route, messages)
+
+
+def _scripted_content(route, messages):
+    system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = last_user_content(messages)
+
+    if route == "double_check_json":
+        # double_check_json_output: hand the JSON back unchanged
+        return user.split("Here is the json string to fix:", 1)[1].strip()
+
+    if route == "guard":
+        return json.dumps({
+            "chain_of_thought": "The user is asking the coffee shop assistant about a greeting, menu question, "
+                                "order or order modification, or a recommendation.",
+            "decision": "allowed",
+            "message": ""
+        })
+
+    if route == "classification":
+        return json.dumps({"Reason": "keyword match", "decision": classify(user), "message": ""})
+
+    if route == "order_intent":
+        user_message = system.split("User Message:", 1)[-1].split("CRITICAL:", 1)[0]
+        lowered = user_message.lower()
+        if any(word in lowered for word in ("that's all", "nothing else", "finalize", "done")):
+            return json.dumps({"intent": "FINALIZE_ORDER", "details": None, "chain_of_thought": "done"})
+        items = find_items(user_message)
+        if not items:
+            return json.dumps({"intent": "UNCLEAR", "details": None, "chain_of_thought": "no menu item"})
+        return json.dumps({
+            "actions": [{"type": "add", "item": name, "quantity": qty, "price": price} for name, qty, price in items],
+            "chain_of_thought": "items found in the message"
+        })
+
+    if route == "order_response":
+        return json.dumps({"order": [], "response": "Added to your order. Would you like anything else?"})
+
+    if route == "recommendation_classification":
+        lowered = user.lower()
+        categories = [category for category, words in CATEGORY_WORDS.items() if any(w in lowered for w in words)]
+        if categories:
+            return json.dumps({"chain_of_thought": "category mentioned", "recommendation_type": "popular by category", "parameters": categories})
+        return json.dumps({"chain_of_thought": "no category", "recommendation_type": "popular", "parameters": []})
+
+    if route == "recommendation":
+        items = user.split("recommend these items exactly:", 1)[1].strip().splitlines()[0]
+        return "You might enjoy:\n" + "\n".join(f"- {item.strip()}" for item in items.split(",") if item.strip())
+
+    if route == "json_repair":
+        match = re.search(r"\{.*\}", user, re.DOTALL)
+        return match.group(0) if match else "{}"
+
+    return "Merry's Way is open 7am to 8pm every day. Our Latte is $4.75 and our Cappuccino is $4.50."
+
+
+@dataclass
+class LatencyModel:
+    """Seconds spent on one request: overhead + prefill + decode, with optional jitter."""
+    overhead_ms: float = 20.0
+    prefill_tps: float = 2000.0     # prompt tokens processed per second
+    decode_tps: float = 40.0        # completion tokens generated per second
+    jitter: float = 0.1             # +/- fraction applied to the total
+
+    def seconds(self, prompt_tokens, completion_tokens):
+        total = self.overhead_ms / 1000.0
+        if self.prefill_tps > 0:
+            total += prompt_tokens / self.prefill_tps
+        if self.decode_tps > 0:
+            total += completion_tokens / self.decode_tps
+        if self.jitter:
+            total *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, total)
+
+
+class FakeModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=None, slots=0, overrides=None):
+        super().__init__(address, FakeModelHandler)
+        self.latency = latency or LatencyModel(overhead_ms=0, prefill_tps=0, decode_tps=0, jitter=0)
+        # Like a GPU server, only `slots` generations run at once (0 = unlimited)
+        self.slots = threading.BoundedSemaphore(slots) if slots else None
+        self.overrides = overrides or {}
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def generate(self, messages):
+        route, content = scripted_reply(messages, self.overrides)
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        completion_tokens = estimate_tokens(content)
+
+        if self.slots:
+            self.slots.acquire()
+        try:
+            time.sleep(self.latency.seconds(prompt_tokens, completion_tokens))
+        finally:
+            if self.slots:
+                self.slots.release()
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats[f"route.{route}"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+        return content, prompt_tokens, completion_tokens
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        elif self.path == "/stats":
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "fake")
+
+        if self.path in ("/v1/chat/completions", "/chat/completions"):
+            content, prompt_tokens, completion_tokens = self.server.generate(request.get("messages", []))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+        elif self.path in ("/api/chat", "/api/generate"):
+            started = time.perf_counter_ns()
+            if self.path == "/api/chat":
+                messages = request.get("messages", [])
+            else:
+                messages = [{"role": "system", "content": request.get("system", "")},
+                            {"role": "user", "content": request.get("prompt", "")}]
+            content, prompt_tokens, completion_tokens = self.server.generate(messages)
+
+            payload = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": time.perf_counter_ns() - started,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": completion_tokens
+            }
+            if self.path == "/api/chat":
+                payload["message"] = {"role": "assistant", "content": content}
+            else:
+                payload["response"] = content
+            self._send_json(200, payload)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def start_fake_model_server(host="127.0.0.1", port=0, latency=None, slots=0, overrides=None):
+    """Run the server on a background thread; returns it (server.server_address has the real port)."""
+    server = FakeModelServer((host, port), latency, slots, overrides)
+    threading.Thread(target=server.serve_forever, name="fake-model-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="fixed latency per request")
+    parser.add_argument("--prefill-tps", type=float, default=2000.0, help="prompt tokens per second (0 = free)")
+    parser.add_argument("--decode-tps", type=float, default=40.0, help="completion tokens per second (0 = free)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- fraction of random latency noise")
+    parser.add_argument("--slots", type=int, default=0, help="concurrent generations (0 = unlimited)")
+    parser.add_argument("--replies", help="JSON file mapping a route (guard, classification, ...) to a fixed reply")
+    args = parser.parse_args()
+
+    overrides = None
+    if args.replies:
+        with open(args.replies) as f:
+            overrides = json.load(f)
+
+    latency = LatencyModel(args.overhead_ms, args.prefill_tps, args.decode_tps, args.jitter)
+    server = FakeModelServer((args.host, args.port), latency, args.slots, overrides)
+    print(f"Fake model server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
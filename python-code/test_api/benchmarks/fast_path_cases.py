@@ -0,0 +1,99 @@
+"""Regression cases for the rule-based paths in front of the LLM.
+
+Every case is a message and what the rules should make of it: the start of
+the answer (or decision, or split), or None when it has to go to the LLM as
+a whole. Exits with 1 if any case fails.
+
+Run from the test_api folder:
+    python -m benchmarks.fast_path_cases
+"""
+import sys
+
+from agents.catalog import load_catalog
+from agents.catalog_answers import CatalogAnswerer
+from agents.query_splitter import QuerySplitter
+from agents.recommendation_resolver import RecommendationResolver
+
+CATALOG_ANSWERS = [
+    ("How much is a latte?", "Our Latte is $4.75"),
+    ("how much does the cappuccino cost", "Our Cappuccino is"),
+    ("How much for a croissant?", "Our Croissant is"),
+    ("What's the price of a latte?", "Our Latte is $4.75"),
+    # Quantities, not prices
+    ("How much sugar is in a latte?", None),
+    ("how much milk goes in a cappuccino", None),
+    ("How much caffeine does an espresso shot have?", None),
+    ("how much protein is in the croissant", None),
+    ("How many shots are in a latte?", None),
+    # More than the lookup answers: RAG gets the whole message
+    ("What are your opening hours and how much is a latte?", None),
+    ("what does the latte cost in euros", None),
+    ("How much does a large latte cost", None),
+    ("how much is a latte and a cappuccino", "Our Latte is $4.75. Our Cappuccino is"),
+    ("what is your best rated drink", "Our best-rated drink is"),
+]
+
+RECOMMENDATION_TYPES = [
+    ("What goes well with a latte?", "apriori ['Latte']"),
+    ("Any pastries you'd recommend?", "popular by category ['Bakery']"),
+    ("What do you recommend?", "popular []"),
+    ("What do you suggest to go with an almond croisant?", "apriori ['Almond Croissant']"),
+    # Nouns the catalog doesn't know, or products and categories together: the LLM decides
+    ("recommend a tea", None),
+    ("Recommend a drink", None),
+    ("suggest me a croissant and a latte", None),
+    # A word that's a product and a category is the product only when paired with something
+    ("what goes with a croissant", "apriori ['Croissant']"),
+    ("what goes with an almond croissant", "apriori ['Almond Croissant']"),
+    ("what goes with a scone", None),
+    ("recommend a biscotti", None),
+]
+
+SPLITS = [
+    ("I'll have a latte — also what are your hours?", "I'll have a latte | what are your hours?"),
+    ("I want a latte. What are your hours?", "I want a latte. | What are your hours?"),
+    # Abbreviations and initials don't end a sentence
+    ("Mr. Smith here, a latte please", None),
+    ("Dr. Jones wants 2 oz. of syrup. Thanks", None),
+]
+
+
+def check(name, fn, cases):
+    failures = 0
+    for message, expected in cases:
+        got = fn(message)
+        ok = got is None if expected is None else got is not None and got.startswith(expected)
+        if not ok:
+            failures += 1
+            print(f"FAIL {name}: {message!r} -> {got!r} (expected {expected!r})")
+    print(f"{name}: {len(cases) - failures}/{len(cases)} passed")
+    return failures
+
+
+def main():
+    answerer = CatalogAnswerer(load_catalog())
+
+    def catalog_answer(message):
+        answer = answerer.answer(message)
+        return answer.text if answer else None
+
+    resolver = RecommendationResolver(answerer)
+
+    def recommendation_type(message):
+        decision = resolver.resolve([{"role": "user", "content": message}])
+        return f"{decision['recommendation_type']} {decision['parameters']}" if decision else None
+
+    splitter = QuerySplitter()
+
+    def split(message):
+        parts = splitter.split(message)
+        return " | ".join(parts) if len(parts) > 1 else None
+
+    failures = check("catalog answers", catalog_answer, CATALOG_ANSWERS)
+    failures += check("recommendation types", recommendation_type, RECOMMENDATION_TYPES)
+    failures += check("query splits", split, SPLITS)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Replay scripted coffee-shop conversations against AgentController and report latency and throughput.
+
+Run from the test_api folder:
+    python -m benchmarks.load_generator --concurrency 8 --conversations 64
+
+A fake model server (benchmarks/fake_model_server.py) is started in-process
+unless --llm-base-url points at one that's already running. The embedding
+model loads lazily (EMBEDDING_LOAD=lazy unless set), on the first turn that
+needs it. So offline, without the model in the local cache, run only
+the scenarios that don't embed:
+    VECTOR_STORE=local python -m benchmarks.load_generator --scenarios order,recommendation
+Anything routed to the details agent (greetings too) needs the embedding model
+and a vector store; VECTOR_STORE=local with an artifact from
+build_knowledge_base.py keeps those off the network once the model is cached.
+
+Reports p50/p95/p99 latency per turn and per stage (guard, classification,
+the chosen agent, the nested order recommendation call, single LLM calls),
+LLM calls per turn and sustained turns per second.
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from types import SimpleNamespace
+
+CONVERSATIONS = {
+    "greeting": [
+        "Hi there!",
+        "What can you do for me?",
+        "Thanks, bye!",
+    ],
+    "details": [
+        "What are your opening hours?",
+        "How much is a cappuccino?",
+        "What's in the almond croissant?",
+        "Do you deliver to Astoria?",
+    ],
+    "order": [
+        "I'd like 2 lattes and a croissant please",
+        "Also add a ginger scone and an espresso",
+        "That's all, please finalize the order",
+    ],
+    "recommendation": [
+        "Can you recommend a pastry?",
+        "What coffee do you suggest?",
+        "I'll have a cappuccino, order it please",
+        "What goes well with it?",
+    ],
+}
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # Nearest rank: the smallest sample with at least q% of the samples at or below it
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageRecorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def timed(self, stage, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+
+class TimedClient:
+    """OpenAI-compatible client proxy that times every call."""
+
+    def __init__(self, client, recorder):
+        self._client = client
+        self._recorder = recorder
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._client.chat.completions.create(**kwargs)
+        finally:
+            self._recorder.record("llm_call", time.perf_counter() - start)
+
+
+def instrument(controller, recorder):
+    controller.guard_agent.get_response = recorder.timed("guard", controller.guard_agent.get_response)
+    controller.classification_agent.get_response = recorder.timed(
+        "classification", controller.classification_agent.get_response
+    )
+    for name, agent in controller.agent_dict.items():
+        agent.get_response = recorder.timed(name, agent.get_response)
+
+    recommendation_agent = controller.recommendation_agent
+    recommendation_agent.get_recommendations_from_order = recorder.timed(
+        "order_taking_agent.recommendations", recommendation_agent.get_recommendations_from_order
+    )
+
+    agents = [controller.guard_agent, controller.classification_agent, *controller.agent_dict.values()]
+    client = TimedClient(controller.guard_agent.client, recorder)
+    for agent in agents:
+        agent.client = client
+
+
+def run_conversation(controller, script, protocol, results):
+    session_id = uuid.uuid4().hex
+    version = 0
+    messages = []
+
+    for user_message in script:
+        start = time.perf_counter()
+        llm_calls = 0
+        try:
+            if protocol == "session":
+                response = controller.get_response({"input": {
+                    "session_id": session_id, "version": version, "message": user_message
+                }})
+                version = response["session"]["version"]
+            else:
+                messages.append({"role": "user", "content": user_message})
+                response = controller.get_response({"input": {"messages": messages}})
+                messages.append(response)
+            # The controller's own count, which includes the calls made on the fan-out threads
+            llm_calls = response["memory"]["usage"]["turn"]["calls"]
+            error = None
+        except Exception as e:
+            error = repr(e)
+
+        results.append({
+            "latency": time.perf_counter() - start,
+            "llm_calls": llm_calls,
+            "error": error
+        })
+        if error:
+            break
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'name':<36} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, samples in rows:
+        print(
+            f"  {name:<36} {len(samples):>7} {percentile(samples, 50) * 1000:>9.1f} "
+            f"{percentile(samples, 95) * 1000:>9.1f} {percentile(samples, 99) * 1000:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations running at the same time")
+    parser.add_argument("--conversations", type=int, default=32, help="total conversations to replay")
+    parser.add_argument("--scenarios", default=",".join(CONVERSATIONS), help="comma separated subset of scenarios")
+    parser.add_argument("--protocol", choices=("session", "full"), default="session")
+    parser.add_argument("--llm-base-url", help="use an already running model server instead of the in-process fake")
+    parser.add_argument("--prefill-tps", type=float, default=2000.0)
+    parser.add_argument("--decode-tps", type=float, default=40.0)
+    parser.add_argument("--overhead-ms", type=float, default=20.0)
+    parser.add_argument("--slots", type=int, default=0, help="concurrent generations on the fake server")
+    parser.add_argument("--json", help="also write the raw report to this file")
+    args = parser.parse_args()
+
+    fake_server = None
+    if args.llm_base_url:
+        base_url = args.llm_base_url
+    else:
+        from benchmarks.fake_model_server import LatencyModel, start_fake_model_server
+        latency = LatencyModel(args.overhead_ms, args.prefill_tps, args.decode_tps)
+        fake_server = start_fake_model_server(latency=latency, slots=args.slots)
+        base_url = f"http://127.0.0.1:{fake_server.server_address[1]}/v1"
+
+    os.environ["LLM_BACKEND"] = "openai"
+    os.environ["LLM_BASE_URL"] = base_url
+    # Don't load the embedding model at startup: the scenarios without details turns never need it
+    os.environ.setdefault("EMBEDDING_LOAD", "lazy")
+
+    from agent_controller import AgentController
+    from session_store import InMemorySessionStore
+
+    controller = AgentController(session_store=InMemorySessionStore())
+    recorder = StageRecorder()
+    instrument(controller, recorder)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    per_scenario = defaultdict(list)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i in range(args.conversations):
+            scenario = scenarios[i % len(scenarios)]
+            executor.submit(run_conversation, controller, CONVERSATIONS[scenario], args.protocol, per_scenario[scenario])
+    elapsed = time.perf_counter() - started
+
+    turns = [turn for results in per_scenario.values() for turn in results]
+    ok_turns = [turn for turn in turns if not turn["error"]]
+    errors = [turn["error"] for turn in turns if turn["error"]]
+
+    print(f"\n{len(turns)} turns in {elapsed:.2f}s at concurrency {args.concurrency} ({args.protocol} protocol)")
+    print(f"sustained throughput: {len(ok_turns) / elapsed:.2f} turns/s, errors: {len(errors)}")
+    if errors:
+        print(f"first error: {errors[0]}")
+
+    print_table("Per turn", [
+        ("all", [t["latency"] for t in ok_turns]),
+        *[(name, [t["latency"] for t in results if not t["error"]]) for name, results in per_scenario.items()],
+    ])
+    print_table("Per stage", sorted(recorder.samples.items()))
+
+    llm_calls = [t["llm_calls"] for t in ok_turns]
+    if llm_calls:
+        print(f"\nLLM calls per turn: mean {sum(llm_calls) / len(llm_calls):.2f}, "
+              f"p50 {percentile(llm_calls, 50)}, max {max(llm_calls)}")
+
+    if args.json:
+        report = {
+            "elapsed_s": elapsed,
+            "concurrency": args.concurrency,
+            "turns": len(turns),
+            "errors": len(errors),
+            "turns_per_s": len(ok_turns) / elapsed,
+            "turn_latency_s": {name: [t["latency"] for t in results] for name, results in per_scenario.items()},
+            "stage_latency_s": dict(recorder.samples),
+            "llm_calls_per_turn": llm_calls,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f)
+
+    if fake_server is not None:
+        fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Association rules from packed bitsets, for pairs and triples of products.
+
+Every product's transactions are a bitset of uint64 words (bit t set when
+transaction t contains the product), so the support of a pair is
+popcount(A & B) and of a triple popcount(A & B & C). Transactions are split
+into shards that a process pool counts independently; the counts add up.
+
+Two passes, as apriori does: singles and pairs first, then only the triples
+whose three pairs are all frequent. The rules are the ones mlxtend's
+apriori + association_rules give for itemsets of up to three products, with
+supports computed the same way (count / transactions), so they come out
+identical:
+
+    rules = mine_rules(matrix, min_support=0.05, min_lift=1.0, workers=4)
+    # DataFrame: antecedents, consequents, antecedent support, consequent support,
+    #            support, confidence, lift
+
+`matrix` is the sparse boolean transactions x products matrix from
+train_recommendations.basket_matrix().
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Transactions per shard: 2^17 transactions -> 2048 words (16 KiB) per product
+SHARD_TRANSACTIONS = 1 << 17
+
+
+def popcount(words):
+    """Set bits per row of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(*words.shape, 8)
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=(-1, -2), dtype=np.int64)
+
+
+def pack_bitsets(indptr, indices, n_products):
+    """(products x words) uint64 bitsets from the CSR arrays of a block of transactions."""
+    n_transactions = len(indptr) - 1
+    words = max(1, (n_transactions + 63) // 64)
+    rows = np.repeat(np.arange(n_transactions), np.diff(indptr))
+    bits = np.zeros((n_products, words * 64), dtype=bool)
+    bits[indices, rows] = True
+    return np.packbits(bits, axis=1, bitorder="little").view(np.uint64)
+
+
+def count_shard(indptr, indices, n_products, triples=None, batch=1024):
+    """Counts in one shard: (singles, pairs in itertools.combinations order), or the counts of `triples`."""
+    bitsets = pack_bitsets(indptr, indices, n_products)
+    if triples is not None:
+        # In batches, so the intermediate ANDs stay at batch x words
+        return np.concatenate([
+            popcount(bitsets[chunk[:, 0]] & bitsets[chunk[:, 1]] & bitsets[chunk[:, 2]])
+            for chunk in np.array_split(triples, max(1, -(-len(triples) // batch)))
+        ]) if len(triples) else np.zeros(0, dtype=np.int64)
+
+    singles = popcount(bitsets)
+    # One product against all the later ones: products x words at a time
+    pairs = [popcount(bitsets[i] & bitsets[i + 1:]) for i in range(n_products - 1)]
+    return singles, np.concatenate(pairs) if pairs else np.zeros(0, dtype=np.int64)
+
+
+def shards(matrix, shard_transactions=SHARD_TRANSACTIONS):
+    """(indptr, indices) of every block of `shard_transactions` rows, each starting at 0."""
+    matrix = matrix.tocsr()
+    for start in range(0, matrix.shape[0], shard_transactions):
+        stop = min(start + shard_transactions, matrix.shape[0])
+        lo, hi = matrix.indptr[start], matrix.indptr[stop]
+        yield matrix.indptr[start:stop + 1] - lo, matrix.indices[lo:hi].astype(np.int64)
+
+
+def _map(pool, fn, blocks, *args):
+    if pool is None:
+        return [fn(indptr, indices, *args) for indptr, indices in blocks]
+    futures = [pool.submit(fn, indptr, indices, *args) for indptr, indices in blocks]
+    return [future.result() for future in futures]
+
+
+def count_itemsets(matrix, min_support=0.05, workers=None, shard_transactions=SHARD_TRANSACTIONS):
+    """{itemset (tuple of product columns): count} for the frequent singles, pairs and triples."""
+    n_transactions, n_products = matrix.shape
+    blocks = list(shards(matrix, shard_transactions))
+    workers = workers if workers is not None else min(len(blocks), os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(blocks) > 1 else None
+
+    try:
+        # Pass 1: singles and every pair (which singles are frequent is only known once the shards are merged)
+        all_pairs = np.array(list(itertools.combinations(range(n_products), 2)), dtype=np.int64).reshape(-1, 2)
+        results = _map(pool, count_shard, blocks, n_products)
+        singles = np.sum([singles for singles, _ in results], axis=0) if results else np.zeros(n_products, np.int64)
+        pair_counts = np.sum([pairs for _, pairs in results], axis=0) if results else np.zeros(len(all_pairs), np.int64)
+
+        # Compared as mlxtend does, support = count / transactions
+        def frequent(count):
+            return count / n_transactions >= min_support
+
+        counts = {(i,): int(c) for i, c in enumerate(singles) if frequent(c)}
+        frequent_pairs = {
+            (int(i), int(j)): int(c) for (i, j), c in zip(all_pairs, pair_counts)
+            if frequent(c) and (i,) in counts and (j,) in counts
+        }
+        counts.update(frequent_pairs)
+
+        # Pass 2: triples whose three pairs are all frequent
+        candidates = np.array([
+            (i, j, k) for (i, j), k in itertools.product(frequent_pairs, range(n_products))
+            if k > j and (i, k) in frequent_pairs and (j, k) in frequent_pairs
+        ], dtype=np.int64).reshape(-1, 3)
+        if len(candidates):
+            results = _map(pool, count_shard, blocks, n_products, candidates)
+            triple_counts = np.sum(results, axis=0)
+            counts.update({
+                tuple(int(x) for x in triple): int(c) for triple, c in zip(candidates, triple_counts) if frequent(c)
+            })
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return counts
+
+
+def mine_rules(matrix, columns, min_support=0.05, min_lift=1.0, workers=None, shard_transactions=SHARD_TRANSACTIONS):
+    """Rules in mlxtend's association_rules layout (the columns recommendations_json() reads, and a few more)."""
+    import pandas as pd
+
+    n_transactions = matrix.shape[0]
+    counts = count_itemsets(matrix, min_support, workers, shard_transactions)
+    support = {itemset: count / n_transactions for itemset, count in counts.items()}
+
+    rules = []
+    for itemset, itemset_support in support.items():
+        if len(itemset) < 2:
+            continue
+        for size in range(1, len(itemset)):
+            for antecedent in itertools.combinations(itemset, size):
+                consequent = tuple(item for item in itemset if item not in antecedent)
+                # Multiplied back by n as association_rules does, so the floats match to the last bit
+                confidence = (itemset_support * n_transactions) / (support[antecedent] * n_transactions)
+                lift = confidence / support[consequent]
+                if lift >= min_lift:
+                    rules.append({
+                        "antecedents": frozenset(columns[i] for i in antecedent),
+                        "consequents": frozenset(columns[i] for i in consequent),
+                        "antecedent support": support[antecedent],
+                        "consequent support": support[consequent],
+                        "support": itemset_support,
+                        "confidence": confidence,
+                        "lift": lift,
+                    })
+    return pd.DataFrame(rules, columns=["antecedents", "consequents", "antecedent support", "consequent support",
+                                        "support", "confidence", "lift"])
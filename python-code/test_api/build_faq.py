@@ -0,0 +1,166 @@
+"""Build or refresh the precomputed FAQ answers (agents/faq_store.py).
+
+Run from the test_api folder, with the same LLM, vector store and embedding
+settings the API uses:
+    python build_faq.py                                  # refresh what changed
+    python build_faq.py --dry-run                        # show what would be regenerated
+    python build_faq.py --full                           # regenerate every answer
+    python build_faq.py --questions mined_questions.txt  # another question list
+
+The questions come from faq/questions.json ({"id", "question", "paraphrases"}
+per entry) or a text file with one question per line, e.g. mined from the
+conversation logs. Every answer is generated by the details agent (retrieval,
+context compression and prompt as at serving time) and remembers the content
+hash of the documents it was retrieved from. An answer is regenerated when its
+question is new or reworded, when one of those documents changed, when the
+embedding model did, or, after documents were added to the knowledge base (or
+renamed), when retrieval for its question now returns other documents; the rest
+are kept as they are. Index new documents with build_knowledge_base.py first. Paraphrases can be edited
+freely, the vectors are re-encoded on every run (from the embedding cache).
+"""
+import argparse
+import json
+import os
+import pathlib
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from agents.faq_store import DEFAULT_FAQ_DIR, STORE_FILE, VECTORS_FILE, added_documents, normalize_rows, read_store
+from agents.knowledge_base import DEFAULT_PRODUCTS_DIR, knowledge_base_documents, slugify, source_hash
+
+load_dotenv()
+
+DEFAULT_QUESTIONS = DEFAULT_FAQ_DIR / "questions.json"
+
+
+def load_questions(path):
+    path = pathlib.Path(path)
+    if path.suffix == ".json":
+        questions = json.loads(path.read_text())
+    else:
+        questions = [
+            {"id": slugify(line.strip()), "question": line.strip()}
+            for line in path.read_text().splitlines() if line.strip()
+        ]
+    seen = set()
+    for question in questions:
+        if question["id"] in seen:
+            raise ValueError(f"{path}: duplicate question id '{question['id']}'")
+        seen.add(question["id"])
+        question.setdefault("paraphrases", [])
+    return questions
+
+
+def plan_changes(questions, manifest, model_name, document_hashes, full=False, retrieve=None):
+    """(to_generate, kept): questions that need a new answer, and {id: entry} of the answers still good.
+    `retrieve(question)` gives the ids of the documents retrieved for it now; with documents added since
+    the last build, an answer is kept only if they are still the ones it was generated from (without
+    `retrieve`, none is kept)."""
+    previous = {entry["id"]: entry for entry in manifest.get("entries", [])}
+    if full or manifest.get("model") != model_name:
+        previous = {}
+    added = added_documents(manifest, document_hashes) if previous else set()
+
+    to_generate, kept = [], {}
+    for question in questions:
+        entry = previous.get(question["id"])
+        if (
+            entry is None
+            or entry["question"] != question["question"]
+            or any(document_hashes.get(doc_id) != digest for doc_id, digest in entry.get("sources", {}).items())
+            or added and (retrieve is None
+                          or set(retrieve(question)) & set(document_hashes) != set(entry.get("sources", {})))
+        ):
+            to_generate.append(question)
+        else:
+            kept[question["id"]] = entry
+    return to_generate, kept
+
+
+def write_store(path, manifest, vectors):
+    """Vectors first, then the json that describes them; both replaced atomically."""
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp_vectors = path / f"{VECTORS_FILE}.{os.getpid()}.tmp.npy"
+    np.save(tmp_vectors, vectors)
+    os.replace(tmp_vectors, path / VECTORS_FILE)
+    tmp_manifest = path / f"{STORE_FILE}.{os.getpid()}.tmp"
+    tmp_manifest.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_manifest, path / STORE_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=str(DEFAULT_QUESTIONS), help="questions.json or one question per line")
+    parser.add_argument("--out", default=os.getenv("FAQ_STORE_PATH", str(DEFAULT_FAQ_DIR)))
+    parser.add_argument("--products-dir", default=str(DEFAULT_PRODUCTS_DIR))
+    parser.add_argument("--full", action="store_true", help="regenerate every answer")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+
+    from agents.details_agent import DetailsAgent
+
+    questions = load_questions(args.questions)
+    documents = knowledge_base_documents(args.products_dir)
+    document_hashes = {document.id: document.content_hash for document in documents}
+    manifest, _ = read_store(args.out)
+
+    agent = DetailsAgent()
+    # Answers come from RAG, not from the store being rebuilt, nor from the catalog fast path
+    agent.faq_store = None
+    agent.catalog_answerer = None
+    model_name = agent.embedding_service.model_name
+
+    def retrieve(question):
+        embedding = agent.embedding_service.encode(question["question"])
+        result = agent.get_closest_results(embedding, query_text=question["question"])
+        return [match["id"] for match in result["matches"]]
+
+    to_generate, kept = plan_changes(questions, manifest, model_name, document_hashes, args.full, retrieve)
+    print(f"{len(questions)} questions: {len(to_generate)} to generate, {len(kept)} unchanged (model {model_name})")
+    if args.dry_run:
+        for question in to_generate:
+            print(f"  generate  {question['id']}: {question['question']}")
+        return
+
+    start = time.perf_counter()
+    generated = {}
+    for question in to_generate:
+        embedding = agent.embedding_service.encode(question["question"])
+        answer, doc_ids = agent.generate_answer([{"role": "user", "content": question["question"]}], embedding)
+        generated[question["id"]] = {
+            "answer": answer.strip(),
+            "sources": {doc_id: document_hashes[doc_id] for doc_id in doc_ids if doc_id in document_hashes},
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        print(f"  {question['id']}: {answer.strip()[:80]}")
+    generate_seconds = time.perf_counter() - start
+
+    entries, rows, texts = [], [], []
+    for question in questions:
+        entry = dict(kept.get(question["id"]) or generated[question["id"]])
+        entry.update(id=question["id"], question=question["question"], paraphrases=question["paraphrases"])
+        for text in [question["question"]] + question["paraphrases"]:
+            rows.append(len(entries))
+            texts.append(text)
+        entries.append(entry)
+
+    vectors = normalize_rows(agent.embedding_service.encode_many(texts)).astype(np.float16)
+    write_store(args.out, {
+        "model": model_name,
+        "dimension": int(vectors.shape[1]),
+        "source_hash": source_hash(documents),
+        "documents": document_hashes,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rows": rows,
+        "entries": entries,
+    }, vectors)
+
+    print(f"Generated {len(generated)} answers in {generate_seconds:.2f}s; {len(entries)} entries, "
+          f"{len(rows)} questions ({vectors.nbytes / 1024:.1f} KiB of vectors) in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
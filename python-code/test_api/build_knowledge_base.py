@@ -0,0 +1,178 @@
+"""Build or refresh the coffee shop knowledge base in the configured vector store.
+
+Replaces the build_vector_db.ipynb notebook. The documents come from
+agents/knowledge_base.py: every product in products/*.jsonl plus the text files.
+
+Run from the test_api folder:
+    VECTOR_STORE=local python build_knowledge_base.py      # refresh what changed
+    python build_knowledge_base.py --out ./vector_store     # a local store at this path
+    python build_knowledge_base.py --dry-run                # show what would change
+    python build_knowledge_base.py --full                   # re-embed everything
+
+Each run compares the documents with the index manifest (one content hash per
+document id). Only new or changed documents are embedded, in parallel batches,
+and upserted in batches. Upserts by id are idempotent, so an interrupted run
+can simply be repeated. Documents that disappeared from the sources are deleted
+from the store. The manifest is written last, so it always describes what the
+store holds:
+
+    {"model", "dimension", "store", "source_hash", "updated_at",
+     "documents": {id: {"hash", "source", "chars"}}}
+
+It lives in the local store's folder, or in vector_store/ for Pinecone
+(pinecone.<index>.<namespace>.manifest.json). Changing the embedding model
+rebuilds everything.
+"""
+import argparse
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from agents.knowledge_base import DEFAULT_PRODUCTS_DIR, knowledge_base_documents, source_hash
+
+load_dotenv()
+
+MANIFEST_DIR = pathlib.Path(__file__).resolve().parent / "vector_store"
+
+
+def manifest_path(store):
+    from agents.vector_store import LocalVectorStore
+
+    if isinstance(store, LocalVectorStore):
+        return store.path / "index_manifest.json"
+    return MANIFEST_DIR / f"pinecone.{store.name}.{store.namespace}.manifest.json"
+
+
+def load_manifest(path):
+    path = pathlib.Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_manifest(path, manifest):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, path)
+
+
+def plan_changes(documents, manifest, model_name, existing_ids=None, full=False):
+    """(to_embed, unchanged, to_delete) against what the manifest says the store holds."""
+    indexed = manifest.get("documents", {})
+    if full or manifest.get("model") != model_name:
+        indexed = {}
+
+    to_embed = [document for document in documents if indexed.get(document.id, {}).get("hash") != document.content_hash]
+    embed_ids = {document.id for document in to_embed}
+    unchanged = [document for document in documents if document.id not in embed_ids]
+
+    current = {document.id for document in documents}
+    known = set(manifest.get("documents", {}))
+    # Ids in the store that no manifest knows about (e.g. the notebook's text.split(":")[0] ids)
+    if existing_ids is not None:
+        known |= set(existing_ids)
+    to_delete = sorted(known - current)
+    return to_embed, unchanged, to_delete
+
+
+def batches(items, size):
+    size = size or len(items) or 1
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def embed_documents(encoder, documents, batch_size=32, workers=2):
+    """Vectors for `documents`, in order; batches are encoded concurrently (the model releases the GIL)."""
+    chunks = list(batches(documents, batch_size))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda chunk: encoder.encode([document.text for document in chunk]), chunks))
+    return [vector for result in results for vector in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products-dir", default=str(DEFAULT_PRODUCTS_DIR))
+    parser.add_argument("--out", help="write a local store here (default: the configured VECTOR_STORE)")
+    parser.add_argument("--manifest", help="index manifest path (default: next to the store)")
+    parser.add_argument("--batch-size", type=int, default=32, help="documents per encode batch")
+    parser.add_argument("--workers", type=int, default=2, help="encode batches in parallel")
+    parser.add_argument("--upsert-batch-size", type=int, help="vectors per upsert (default: the store's limit)")
+    parser.add_argument("--full", action="store_true", help="re-embed every document")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+
+    from agents.embeddings import create_encoder
+    from agents.vector_store import LocalVectorStore, PineconeVectorStore, create_vector_store
+
+    documents = knowledge_base_documents(args.products_dir)
+    store = LocalVectorStore(args.out) if args.out else create_vector_store()
+    path = pathlib.Path(args.manifest) if args.manifest else manifest_path(store)
+    manifest = load_manifest(path)
+
+    encoder = create_encoder()
+    model_name = encoder.model_name
+
+    to_embed, unchanged, to_delete = plan_changes(documents, manifest, model_name, store.list_ids(), args.full)
+    print(f"{len(documents)} documents: {len(to_embed)} to embed, {len(unchanged)} unchanged, "
+          f"{len(to_delete)} to delete ({store.name}, model {model_name})")
+    if args.dry_run:
+        for document in to_embed:
+            print(f"  embed   {document.id}")
+        for doc_id in to_delete:
+            print(f"  delete  {doc_id}")
+        return
+    if not to_embed and not to_delete and manifest:
+        print("Up to date")
+        return
+
+    start = time.perf_counter()
+    vectors = embed_documents(encoder, to_embed, args.batch_size, args.workers) if to_embed else []
+    encode_seconds = time.perf_counter() - start
+    dimension = len(vectors[0]) if len(vectors) else manifest.get("dimension")
+
+    if isinstance(store, PineconeVectorStore) and dimension:
+        store.ensure_index(
+            dimension,
+            cloud=os.getenv("PINECONE_CLOUD", "aws"),
+            region=os.getenv("PINECONE_REGION", "us-east-1")
+        )
+    if isinstance(store, LocalVectorStore):
+        store.manifest["model"] = model_name
+
+    upsert_batch_size = args.upsert_batch_size or store.upsert_batch_size
+    # Deletes first: after a model change the dimension may differ from the stale rows
+    for chunk in batches(to_delete, upsert_batch_size):
+        store.delete(chunk)
+    records = [
+        {
+            "id": document.id,
+            "values": [float(x) for x in vector],
+            "metadata": {"text": document.text, "source": document.source}
+        }
+        for document, vector in zip(to_embed, vectors)
+    ]
+    for chunk in batches(records, upsert_batch_size):
+        store.upsert(chunk)
+
+    write_manifest(path, {
+        "model": model_name,
+        "dimension": dimension,
+        "store": store.name,
+        "source_hash": source_hash(documents),
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "documents": {
+            document.id: {"hash": document.content_hash, "source": document.source, "chars": len(document.text)}
+            for document in documents
+        },
+    })
+
+    print(f"Embedded {len(to_embed)} documents in {encode_seconds:.2f}s, deleted {len(to_delete)}; "
+          f"manifest at {path}")
+
+
+if __name__ == "__main__":
+    main()
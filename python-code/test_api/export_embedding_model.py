@@ -0,0 +1,185 @@
+"""Export the sentence-transformers embedding model to ONNX (fp32 + int8) and check parity.
+
+Run from the test_api folder, once, on a machine that can reach the model hub:
+    python export_embedding_model.py                       # export + parity check
+    python export_embedding_model.py --check-only          # parity check of an existing export
+
+The output directory (models/all-MiniLM-L6-v2-onnx by default) is what
+EMBEDDING_BACKEND=onnx loads; copy it next to the service, no network needed there.
+    model.onnx              fp32 graph: input_ids, attention_mask, token_type_ids -> token embeddings
+    model_int8.onnx         the same with dynamically quantized int8 weights
+    tokenizer.json          fast tokenizer
+    embedding_config.json   max sequence length, padding token, normalization
+    parity.json             the report printed by the check
+
+The parity check embeds the knowledge base documents, the catalog vocabulary and
+a set of customer questions with both backends and reports the cosine similarity
+to the torch vectors, the largest element difference, whether the knowledge base
+retrieval (top-2 per question) is unchanged, and load/encode times.
+"""
+import argparse
+import json
+import pathlib
+import time
+
+import numpy as np
+
+from agents.catalog import load_catalog
+from agents.embeddings import DEFAULT_MODEL, DEFAULT_ONNX_DIR, OnnxEncoder
+from agents.knowledge_base import DEFAULT_PRODUCTS_DIR, knowledge_base_texts
+
+QUESTIONS = [
+    "What's in a latte?",
+    "How much is the chocolate croissant?",
+    "Do you have anything vegan?",
+    "What are your opening hours?",
+    "Where is the coffee shop located?",
+    "Which pastry has the best rating?",
+    "Is there dairy in the hazelnut biscotti?",
+    "Tell me about the owners of Merry's Way",
+    "What syrups can I add to my coffee?",
+    "Do you deliver?",
+]
+
+
+def export(model_name, out_dir, opset=17, quantize=True):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    pooling = [module for module in model if type(module).__name__ == "Pooling"]
+    if pooling and not getattr(pooling[0], "pooling_mode_mean_tokens", True):
+        raise SystemExit("Only mean pooling is supported by the ONNX encoder")
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.transformer(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    sample = tokenizer(["a warmup sentence", "another one"], padding=True, return_tensors="pt")
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(out_dir / "model.onnx"),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["token_embeddings"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                          "token_embeddings": dynamic},
+            opset_version=opset,
+            do_constant_folding=True,
+            dynamo=False
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(out_dir / "model.onnx"), str(out_dir / "model_int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(str(out_dir / "tokenizer.json"))
+    (out_dir / "embedding_config.json").write_text(json.dumps({
+        "source_model": model_name,
+        "max_seq_length": model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "dimension": model.get_sentence_embedding_dimension(),
+    }, indent=2))
+
+    print(f"Exported {model_name} to {out_dir}")
+
+
+def _rowwise_cosine(a, b):
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return (a * b).sum(axis=1)
+
+
+def _top_k(queries, documents, k=2):
+    documents = documents / np.clip(np.linalg.norm(documents, axis=1, keepdims=True), 1e-12, None)
+    return np.argsort(-(queries @ documents.T), axis=1, kind="stable")[:, :k]
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def parity_check(model_name, out_dir, products_dir):
+    from sentence_transformers import SentenceTransformer
+
+    documents = knowledge_base_texts(products_dir)
+    vocabulary = [text for _, text, _ in load_catalog().vocabulary()]
+    texts = documents + vocabulary + QUESTIONS
+
+    torch_model, torch_load = _timed(lambda: SentenceTransformer(model_name, device="cpu"))
+    torch_model.encode(QUESTIONS[:2])
+    reference, torch_batch = _timed(lambda t: np.asarray(torch_model.encode(t), dtype=np.float32), texts)
+    _, torch_single = _timed(lambda: [torch_model.encode([q]) for q in QUESTIONS])
+    reference_hits = _top_k(reference[-len(QUESTIONS):], reference[:len(documents)])
+
+    report = {
+        "model": model_name,
+        "texts": len(texts),
+        "torch": {
+            "load_seconds": round(torch_load, 3),
+            "batch_seconds": round(torch_batch, 4),
+            "single_ms": round(torch_single / len(QUESTIONS) * 1e3, 2),
+        },
+    }
+
+    for quantized in (False, True):
+        encoder = OnnxEncoder(out_dir, quantized=quantized)
+        if not encoder.model_file.exists():
+            continue
+        _, load = _timed(encoder.load)
+        encoder.encode(QUESTIONS[:2])
+        vectors, batch = _timed(encoder.encode, texts)
+        _, single = _timed(lambda: [encoder.encode([q]) for q in QUESTIONS])
+
+        cosine = _rowwise_cosine(vectors, reference)
+        hits = _top_k(vectors[-len(QUESTIONS):], vectors[:len(documents)])
+        report[encoder.model_file.name] = {
+            "cosine_min": round(float(cosine.min()), 5),
+            "cosine_mean": round(float(cosine.mean()), 5),
+            "max_abs_diff": round(float(np.abs(vectors - reference).max()), 5),
+            "retrieval_top2_agreement": round(float((hits == reference_hits).all(axis=1).mean()), 3),
+            "load_seconds": round(load, 3),
+            "batch_seconds": round(batch, 4),
+            "single_ms": round(single / len(QUESTIONS) * 1e3, 2),
+        }
+
+    (pathlib.Path(out_dir) / "parity.json").write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="sentence-transformers model name or local path")
+    parser.add_argument("--out", default=str(DEFAULT_ONNX_DIR))
+    parser.add_argument("--products-dir", default=str(DEFAULT_PRODUCTS_DIR))
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 model")
+    parser.add_argument("--check-only", action="store_true", help="only run the parity check")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.model, args.out, opset=args.opset, quantize=not args.no_quantize)
+    parity_check(args.model, args.out, args.products_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
-from agent_controller import AgentController
-import aws
+import os
+import uvicorn
 
 def main():
-    agent_controller = AgentController()
+    # Each worker is a separate process with its own AgentController and admission limits (see server.py)
+    uvicorn.run(
+        "server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        timeout_graceful_shutdown=int(os.getenv("SERVER_DRAIN_TIMEOUT", "30"))
+    )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
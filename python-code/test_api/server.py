@@ -0,0 +1,274 @@
+"""ASGI service around AgentController.get_response.
+
+Run one or more workers with uvicorn (see main.py), e.g.
+    uvicorn server:app --workers 4 --port 8000
+
+Endpoints:
+    POST /v1/chat   body = AgentController request ({"input": {...}})
+    GET  /healthz   liveness: the process is up and serving the event loop
+    GET  /readyz    readiness: models, indexes and recommendation objects are loaded
+    GET  /metrics   Prometheus text format: per-stage latency, JSON failures, fallbacks, LLM calls
+
+Admission control, per worker:
+    - at most SERVER_MAX_IN_FLIGHT requests run the agents at the same time
+    - at most SERVER_MAX_QUEUE requests wait for a slot; more are shed with 429
+    - a request that waits longer than SERVER_MAX_QUEUE_WAIT seconds is shed with 503
+    - on shutdown new requests get 503 while in-flight ones are drained
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.log import configure_logging, get_logger
+from agents.metrics import REGISTRY
+from session_store import SessionConflictError
+
+logger = get_logger("server")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _message_error(message, where):
+    if not isinstance(message, dict):
+        return f"{where} must be an object"
+    if not isinstance(message.get("role"), str) or not isinstance(message.get("content"), str):
+        return f"{where} needs string 'role' and 'content'"
+    return None
+
+
+def request_error(input_body):
+    """What's wrong with the shape of a /v1/chat body, or None if the agents can take it."""
+    job_input = input_body.get("input") if isinstance(input_body, dict) else None
+    if not isinstance(job_input, dict):
+        return "body must be an object with an 'input' object"
+
+    for key in ("customer_id", "outlet_id"):
+        if job_input.get(key) is not None and not _is_int(job_input[key]):
+            return f"'{key}' must be an integer"
+    hour = job_input.get("hour")
+    if hour is not None and not (_is_int(hour) and 0 <= hour <= 23):
+        return "'hour' must be an integer from 0 to 23"
+
+    if "session_id" in job_input:
+        if not isinstance(job_input["session_id"], str) or not job_input["session_id"]:
+            return "'session_id' must be a non-empty string"
+        if job_input.get("version") is not None and not _is_int(job_input["version"]):
+            return "'version' must be an integer"
+        if job_input.get("etag") is not None and not isinstance(job_input["etag"], str):
+            return "'etag' must be a string"
+        message = job_input.get("message")
+        if isinstance(message, str):
+            return None
+        return _message_error(message, "'message'")
+
+    messages = job_input.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return "'input' needs a non-empty 'messages' list or a 'session_id' and 'message'"
+    for i, message in enumerate(messages):
+        error = _message_error(message, f"'messages[{i}]'")
+        if error:
+            return error
+    return None
+
+
+class AgentService:
+    def __init__(self,
+                 controller_factory=None,
+                 max_in_flight=4,
+                 max_queue=32,
+                 max_queue_wait=5.0,
+                 drain_timeout=30.0):
+        self.controller_factory = controller_factory
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.drain_timeout = drain_timeout
+
+        self.controller = None
+        self.load_error = None
+        self.draining = False
+        self.in_flight = 0
+        self.waiting = 0
+
+        self._slots = None
+        self._idle = None
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_in_flight=int(os.getenv("SERVER_MAX_IN_FLIGHT", "4")),
+            max_queue=int(os.getenv("SERVER_MAX_QUEUE", "32")),
+            max_queue_wait=float(os.getenv("SERVER_MAX_QUEUE_WAIT", "5")),
+            drain_timeout=float(os.getenv("SERVER_DRAIN_TIMEOUT", "30"))
+        )
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    async def startup(self):
+        configure_logging()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="agents")
+
+        # Load models in the background so /healthz answers while they load; /readyz says when we're done
+        asyncio.get_running_loop().create_task(self._load_controller())
+
+    async def _load_controller(self):
+        factory = self.controller_factory
+        if factory is None:
+            from agent_controller import AgentController
+            factory = AgentController
+
+        try:
+            self.controller = await asyncio.get_running_loop().run_in_executor(self._executor, factory)
+        except Exception as e:
+            self.load_error = repr(e)
+            logger.exception("Failed to load AgentController")
+
+    async def shutdown(self):
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out with %d request(s) still in flight", self.in_flight)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_status(self):
+        status = {
+            "ready": False,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue
+        }
+
+        if self.load_error:
+            status["error"] = self.load_error
+        elif self.controller is not None:
+            controller_status = self.controller.get_status()
+            status["components"] = controller_status["components"]
+            status["ready"] = controller_status["ready"] and not self.draining
+
+        return status
+
+    # ---------------------------
+    # Request handling
+    # ---------------------------
+    async def handle_chat(self, body):
+        if self.draining or self.controller is None:
+            return 503, {"error": "not ready"}, {"retry-after": "5"}
+
+        # A malformed request never takes a slot. Only the request's shape is the client's fault;
+        # anything raised inside the agents is ours
+        try:
+            input_body = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return 400, {"error": "request body is not valid JSON"}, {}
+        error = request_error(input_body)
+        if error:
+            return 400, {"error": "bad request", "detail": error}, {}
+
+        if self.waiting >= self.max_queue:
+            return 429, {"error": "too many requests"}, {"retry-after": "1"}
+
+        self.waiting += 1
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            return 503, {"error": "timed out waiting for a worker slot"}, {"retry-after": "2"}
+        finally:
+            self.waiting -= 1
+
+        if self.draining:
+            # Queued before shutdown started; the executor may already be gone
+            self._slots.release()
+            return 503, {"error": "shutting down"}, {"retry-after": "5"}
+
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._executor, self.controller.get_response, input_body)
+            headers = {"x-queue-wait-ms": f"{(time.monotonic() - queued_at) * 1000:.1f}"}
+            if "session" in response:
+                headers["etag"] = response["session"]["etag"]
+            return 200, response, headers
+        except SessionConflictError as e:
+            current = e.current.describe() if e.current is not None else None
+            return 409, {"error": "session out of sync", "detail": str(e), "session": current}, {}
+        except Exception:
+            logger.exception("Unhandled error in AgentController")
+            return 500, {"error": "internal error"}, {}
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def dispatch(self, method, path, body):
+        if path == "/healthz" and method == "GET":
+            return 200, {"status": "ok"}, {}
+
+        if path == "/readyz" and method == "GET":
+            status = self.get_status()
+            return (200 if status["ready"] else 503), status, {}
+
+        if path == "/metrics" and method == "GET":
+            return 200, REGISTRY.render(), {"content-type": "text/plain; version=0.0.4"}
+
+        if path == "/v1/chat":
+            if method != "POST":
+                return 405, {"error": "method not allowed"}, {"allow": "POST"}
+            return await self.handle_chat(body)
+
+        return 404, {"error": "not found"}, {}
+
+    # ---------------------------
+    # ASGI plumbing
+    # ---------------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        status, payload, headers = await self.dispatch(scope["method"], scope["path"], body)
+
+        headers = {"content-type": "application/json", **headers}
+        data = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        headers["content-length"] = str(len(data))
+        raw_headers = [(key.encode(), value.encode()) for key, value in headers.items()]
+
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": data})
+
+
+app = AgentService.from_env()
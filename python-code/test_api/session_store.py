@@ -0,0 +1,228 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Optional, Protocol
+
+from agents import MessageHistory
+from agents.message_history import thaw
+
+
+@dataclass(frozen=True)
+class Session:
+    """Server-side state of one conversation: the transcript plus a version for optimistic locking."""
+    session_id: str
+    epoch: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    version: int = 0
+    history: MessageHistory = field(default_factory=MessageHistory)
+    updated_at: float = 0.0
+
+    @property
+    def etag(self) -> str:
+        # The epoch changes if a session is evicted and started again, so an old
+        # client can't accidentally match a new session that reached the same version
+        return f"{self.epoch}-{self.version}"
+
+    def matches(self, version=None, etag=None) -> bool:
+        """Check the client's view of the session; anything the client didn't send is not checked."""
+        if etag is not None and etag != self.etag:
+            return False
+        if version is not None and int(version) != self.version:
+            return False
+        return True
+
+    def describe(self):
+        return {"session_id": self.session_id, "version": self.version, "etag": self.etag}
+
+
+class SessionConflictError(Exception):
+    """The client's version/etag doesn't match the stored session (or it was evicted)."""
+
+    def __init__(self, session_id: str, current: Optional[Session] = None):
+        self.session_id = session_id
+        self.current = current
+        if current is None:
+            super().__init__(f"Session '{session_id}' does not exist (expired or never created)")
+        else:
+            super().__init__(f"Session '{session_id}' is at version {current.version} (etag {current.etag})")
+
+
+class SessionStore(Protocol):
+    def load(self, session_id: str) -> Optional[Session]:
+        ...
+
+    def save(self, session: Session, history: MessageHistory) -> Session:
+        """Store `history` as the new state of `session` if nobody else wrote since it was loaded."""
+        ...
+
+    def delete(self, session_id: str) -> None:
+        ...
+
+
+class InMemorySessionStore:
+    """Process-local store with LRU eviction and an idle TTL."""
+
+    def __init__(self, max_sessions=10_000, ttl_seconds=3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self.ttl_seconds and now - session.updated_at > self.ttl_seconds:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def load(self, session_id):
+        with self._lock:
+            return self._get(session_id, time.time())
+
+    def save(self, session, history):
+        now = time.time()
+        with self._lock:
+            current = self._get(session.session_id, now)
+            if current is None:
+                if session.version != 0:
+                    raise SessionConflictError(session.session_id)
+            elif current.version != session.version or current.epoch != session.epoch:
+                raise SessionConflictError(session.session_id, current)
+
+            saved = replace(session, version=session.version + 1, history=history, updated_at=now)
+            self._sessions[session.session_id] = saved
+            self._sessions.move_to_end(session.session_id)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            return saved
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """File-backed store for local runs; safe to share between worker processes on one box.
+
+    Only the messages added since the last save are written on each turn.
+    """
+
+    def __init__(self, path="sessions.db", ttl_seconds=None):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                epoch TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (session_id, position)
+            );
+        """)
+
+    def _expired(self, updated_at):
+        return bool(self.ttl_seconds) and time.time() - updated_at > self.ttl_seconds
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT epoch, version, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            epoch, version, updated_at = row
+            if self._expired(updated_at):
+                self._delete(session_id)
+                return None
+
+            bodies = self._conn.execute(
+                "SELECT body FROM session_messages WHERE session_id = ? ORDER BY position", (session_id,)
+            ).fetchall()
+
+        history = MessageHistory(json.loads(body) for (body,) in bodies)
+        return Session(session_id, epoch, version, history, updated_at)
+
+    def save(self, session, history):
+        now = time.time()
+        new_messages = history[len(session.history):]
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT epoch, version, updated_at FROM sessions WHERE session_id = ?", (session.session_id,)
+                ).fetchone()
+
+                if row is not None and self._expired(row[2]):
+                    self._delete(session.session_id)
+                    row = None
+
+                if row is None:
+                    if session.version != 0:
+                        raise SessionConflictError(session.session_id)
+                    self._conn.execute(
+                        "INSERT INTO sessions (session_id, epoch, version, updated_at) VALUES (?, ?, 1, ?)",
+                        (session.session_id, session.epoch, now)
+                    )
+                else:
+                    epoch, version, updated_at = row
+                    if version != session.version or epoch != session.epoch:
+                        raise SessionConflictError(
+                            session.session_id, Session(session.session_id, epoch, version, updated_at=updated_at)
+                        )
+                    self._conn.execute(
+                        "UPDATE sessions SET version = ?, updated_at = ? WHERE session_id = ?",
+                        (version + 1, now, session.session_id)
+                    )
+
+                self._conn.executemany(
+                    "INSERT INTO session_messages (session_id, position, body) VALUES (?, ?, ?)",
+                    [
+                        (session.session_id, len(session.history) + i, json.dumps(thaw(message)))
+                        for i, message in enumerate(new_messages)
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return replace(session, version=session.version + 1, history=history, updated_at=now)
+
+    def _delete(self, session_id):
+        self._conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+        self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._delete(session_id)
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store configured through SESSION_STORE (memory | sqlite)."""
+    kind = os.getenv("SESSION_STORE", "memory").lower()
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+
+    if kind == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_STORE_PATH", "sessions.db"), ttl_seconds=ttl_seconds)
+    if kind == "memory":
+        return InMemorySessionStore(int(os.getenv("SESSION_MAX_ENTRIES", "10000")), ttl_seconds=ttl_seconds)
+
+    raise ValueError(f"Unknown SESSION_STORE '{kind}' (expected 'memory' or 'sqlite')")
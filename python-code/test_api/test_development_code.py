@@ -3,8 +3,10 @@ from agents import (GuardAgent,
                     DetailsAgent,
                     RecommendationAgent,
                     OrderTakingAgent,
-                    AgentProtocol
+                    AgentProtocol,
+                    MessageHistory
                     )
+from agents.log import configure_logging
 import os
 from typing import Dict
 import pathlib
@@ -13,6 +15,7 @@ import re
 folder_path = pathlib.Path(__file__).parent.resolve()
 
 def main():
+    configure_logging()
 
     guard_agent = GuardAgent()
     classification_agent = ClassificationAgent()
@@ -27,7 +30,7 @@ def main():
         "order_taking_agent": OrderTakingAgent(recommendation_agent)
     }
 
-    messages = []
+    messages = MessageHistory()
 
     while True:
         # clear previous inputs
@@ -44,21 +47,21 @@ def main():
             print("\nExiting conversation. Goodbye!")
             break   # exit the while loop
 
-        messages.append({"role": "user", "content": user_prompt})
+        messages = messages.append({"role": "user", "content": user_prompt})
 
         # get guard agent's response
         guard_agent_response = guard_agent.get_response(messages)
         print("\nGuard Agent's Response: ", guard_agent_response)
 
         if guard_agent_response["memory"]["guard_decision"] == "not allowed":
-            messages.append(guard_agent_response)
+            messages = messages.append(guard_agent_response)
             continue
 
         # get classification agent's response
         classification_agent_response = classification_agent.get_response(messages)
 
         if classification_agent_response["memory"]["classification_decision"] == "unsure":
-            messages.append(classification_agent_response)
+            messages = messages.append(classification_agent_response)
             continue
 
         chosen_agent = classification_agent_response["memory"]["classification_decision"]
@@ -69,7 +72,7 @@ def main():
         agent_response = agent.get_response(messages)
         print("\nAgent's Response: ", agent_response)
 
-        messages.append(agent_response)
+        messages = messages.append(agent_response)
     
 
 
@@ -0,0 +1,545 @@
+"""Train the recommendation objects from the sales receipts.
+
+Replaces recommandation_engine_training.ipynb. Needs pandas, scipy and mlxtend,
+which the API itself doesn't (they aren't in requirement.txt).
+
+Run from the test_api folder:
+    python train_recommendations.py                    # train, write a version, make it current
+    python train_recommendations.py --no-promote       # only write the version
+    python train_recommendations.py --receipts ../Dataset/2019*.csv --workers 8   # a year, every outlet
+
+Same steps as the notebook: receipts joined with product.csv, size suffixes
+(" Rg", " Sm", " Lg") stripped, only the menu products kept, a transaction is
+a transaction_id + customer_id with more than one line, popularity is the
+number of lines per product, and apriori (support 0.05) + association rules
+(lift >= 1) give every product the products bought with it, best confidence
+first.
+
+The receipts are streamed in chunks and encoded to integer codes straight
+away; the baskets go into a sparse boolean transactions x products matrix
+instead of a dense pivot table. The rules are mined by bitset_miner.py (packed
+bitsets, pairs and triples, a process pool over transaction shards) or, with
+--engine mlxtend, by mlxtend's apriori on that matrix; both give the same
+rules. Every run writes
+
+    recommendation_objects/versions/<version>/
+        apriori_recommendations.json
+        popularity_recommendation.csv
+        customer_affinity.npz
+        popularity_cube.npz
+        manifest.json       inputs (sha256), parameters, counts, timings, peak memory, library versions
+
+where <version> is a hash of the inputs and parameters, so the same data
+always gives the same version. Promoting copies the artifacts over the ones
+the API loads (recommendation_objects/*.json, *.csv).
+
+customer_affinity.npz is for personalized recommendations: the share of each
+loyalty customer's (customer.csv) receipt lines that went to each product, as
+sparse rows, and the products x products co-occurrence matrix P(j in basket |
+i in basket) of the baskets above. The agent scores a customer's row against
+that matrix (agents/recommendation_index.CustomerIndex).
+
+popularity_cube.npz is popularity_recommendation.csv broken down by outlet
+(sales_outlet.csv) x hour bucket x customer segment (generation and gender
+from customer.csv + generations.csv, or anonymous) x product, with an "all"
+slot on every axis holding the roll-up, and the ranking of every cell
+(overall and per category) precomputed (agents/recommendation_index.PopularityCube).
+
+benchmarks/bench_recommendation_training.py compares time and memory with the
+notebook's dense method on the receipts and on scaled-up copies of them;
+benchmarks/bench_rule_mining.py compares the two rule engines up to 10M lines.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pathlib
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+FOLDER = pathlib.Path(__file__).resolve().parent
+DEFAULT_DATA_DIR = FOLDER.parent / "Dataset"
+DEFAULT_OUT_DIR = FOLDER / "recommendation_objects"
+RECEIPTS_FILE = "201904 sales reciepts.csv"
+PRODUCTS_FILE = "product.csv"
+APRIORI_FILE = "apriori_recommendations.json"
+POPULARITY_FILE = "popularity_recommendation.csv"
+CUSTOMERS_FILE = "customer.csv"
+GENERATIONS_FILE = "generations.csv"
+OUTLETS_FILE = "sales_outlet.csv"
+CUSTOMER_FILE = "customer_affinity.npz"
+CUBE_FILE = "popularity_cube.npz"
+ARTIFACTS = (APRIORI_FILE, POPULARITY_FILE, CUSTOMER_FILE, CUBE_FILE)
+
+# The menu, as named after stripping the size suffix
+PRODUCTS_TO_TAKE = [
+    "Cappuccino", "Latte", "Espresso shot", "Dark chocolate", "Sugar Free Vanilla syrup", "Chocolate syrup",
+    "Carmel syrup", "Hazelnut syrup", "Ginger Scone", "Chocolate Croissant", "Jumbo Savory Scone",
+    "Cranberry Scone", "Hazelnut Biscotti", "Croissant", "Almond Croissant", "Oatmeal Scone",
+    "Chocolate Chip Biscotti", "Ginger Biscotti",
+]
+SIZE_SUFFIX = r" (?:Rg|Sm|Lg)$"
+# The categories the recommendation agent works with (its prompt lists Bakery, Coffee, Flavours, Chocolate)
+SERVED_CATEGORIES = {"Drinking Chocolate": "Chocolate", "Packaged Chocolate": "Chocolate"}
+# Hour buckets of the popularity cube: (first hour, name)
+HOUR_BUCKETS = [(0, "morning"), (11, "midday"), (14, "afternoon"), (17, "evening")]
+
+
+# ---------------------------
+# Measuring
+# ---------------------------
+class Stages:
+    """Wall time and tracemalloc peak of every stage (numpy and pandas report their buffers to tracemalloc)."""
+
+    def __init__(self):
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        self.results[name] = {"seconds": round(seconds, 4), "peak_mib": round(peak / 2**20, 2)}
+
+    def report(self, title):
+        print(title)
+        for name, result in self.results.items():
+            print(f"  {name:<22} {result['seconds'] * 1000:9.1f} ms  {result['peak_mib']:8.2f} MiB peak")
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---------------------------
+# Loading
+# ---------------------------
+def load_products(path):
+    """(products table restricted to the menu, array mapping product_id -> column, -1 off the menu)."""
+    import pandas as pd
+
+    products = pd.read_csv(path, usecols=["product_id", "product_category", "product"])
+    products["product"] = products["product"].str.replace(SIZE_SUFFIX, "", regex=True)
+    products = products[products["product"].isin(PRODUCTS_TO_TAKE)]
+
+    columns = {name: column for column, name in enumerate(PRODUCTS_TO_TAKE)}
+    product_columns = np.full(int(products["product_id"].max()) + 1 if len(products) else 0, -1, dtype=np.int64)
+    product_columns[products["product_id"].to_numpy()] = products["product"].map(columns).to_numpy()
+    return products, product_columns
+
+
+def transaction_keys(files, transaction_ids, customer_ids):
+    """One int64 per (file, transaction_id, customer_id): mixed radix over the ranges the ids actually
+    span, so equal keys are the same transaction. Raises ValueError if the ranges don't fit in 63 bits."""
+    if not len(files):
+        return np.zeros(0, dtype=np.int64)
+    transaction_low, customer_low = int(transaction_ids.min()), int(customer_ids.min())
+    transaction_span = int(transaction_ids.max()) - transaction_low + 1
+    customer_span = int(customer_ids.max()) - customer_low + 1
+    if (int(files.max()) + 1) * transaction_span * customer_span >= 2 ** 63:
+        raise ValueError(f"transaction ids ({transaction_span:,}) x customer ids ({customer_span:,}) "
+                         f"x {int(files.max()) + 1} files don't fit in an int64 key")
+    return ((files.astype(np.int64) * transaction_span + (transaction_ids - transaction_low)) * customer_span
+            + (customer_ids - customer_low))
+
+
+def read_lines(receipts_paths, product_columns, chunksize=100_000):
+    """(transaction keys, customer ids, product ids, outlet ids, hours) of every receipt line with a menu
+    product, read file by file, chunk by chunk.
+
+    A transaction is a transaction_id + customer_id within one file (the files number their
+    transactions separately); see transaction_keys."""
+    import pandas as pd
+
+    files, transaction_ids, customer_ids, product_ids, outlets, hours = [], [], [], [], [], []
+    columns = ["transaction_id", "customer_id", "product_id", "sales_outlet_id", "transaction_time"]
+    dtypes = {"transaction_id": "int64", "customer_id": "int64", "product_id": "int64", "sales_outlet_id": "int64",
+              "transaction_time": "str"}
+    chunks = itertools.chain.from_iterable(
+        ((n, chunk) for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize))
+        for n, path in enumerate(receipts_paths)
+    )
+    for n, chunk in chunks:
+        ids = chunk["product_id"].to_numpy()
+        known = (ids >= 0) & (ids < len(product_columns))
+        on_menu = known.copy()
+        on_menu[known] = product_columns[ids[known]] >= 0
+        files.append(np.full(int(on_menu.sum()), n, dtype=np.int16))
+        transaction_ids.append(chunk["transaction_id"].to_numpy()[on_menu])
+        customer_ids.append(chunk["customer_id"].to_numpy()[on_menu])
+        product_ids.append(ids[on_menu])
+        outlets.append(chunk["sales_outlet_id"].to_numpy()[on_menu].astype(np.int16))
+        # "07:06:11" -> 7
+        hours.append(chunk["transaction_time"].str.slice(0, 2).to_numpy()[on_menu].astype(np.int8))
+    if not files:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int16), np.zeros(0, dtype=np.int8))
+    customer_ids = np.concatenate(customer_ids)
+    keys = transaction_keys(np.concatenate(files), np.concatenate(transaction_ids), customer_ids)
+    return keys, customer_ids, np.concatenate(product_ids), np.concatenate(outlets), np.concatenate(hours)
+
+
+# ---------------------------
+# Training
+# ---------------------------
+def basket_matrix(keys, product_ids, product_columns, min_lines=2):
+    """(sparse bool transactions x products matrix, mask of the lines that count) for the
+    transactions with at least `min_lines` lines."""
+    from scipy import sparse
+
+    _, rows, lines = np.unique(keys, return_inverse=True, return_counts=True)
+    valid = lines[rows] >= min_lines
+    rows = np.unique(rows[valid], return_inverse=True)[1]
+    columns = product_columns[product_ids[valid]]
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, columns)),
+        shape=(int(rows.max()) + 1 if len(rows) else 0, len(PRODUCTS_TO_TAKE)), dtype=bool
+    )
+    return matrix, valid
+
+
+def served_products(products):
+    """The products table with the names and categories the agent serves."""
+    table = products.copy()
+    # A product sold under two categories ("Dark chocolate") gets the category in its name
+    shared = table.groupby("product")["product_category"].transform("nunique") > 1
+    table.loc[shared, "product"] = table["product"] + " (" + table["product_category"].str.split().str[0] + ")"
+    table["product_category"] = table["product_category"].replace(SERVED_CATEGORIES)
+    return table
+
+
+def popularity(product_ids, products):
+    """Lines per (product, category), named and categorised the way the agent serves them."""
+    import pandas as pd
+
+    lines = pd.Series(product_ids, name="product_id").value_counts().rename("number_of_transactions")
+    table = served_products(products).join(lines, on="product_id", how="inner")
+    table = table.groupby(["product", "product_category"], as_index=False)["number_of_transactions"].sum()
+    return table.sort_values("product", kind="stable").reset_index(drop=True)[["product", "product_category", "number_of_transactions"]]
+
+
+def rule_categories(product_ids, products):
+    """product -> category as the notebook had it: of the (product, category) pairs in order of first
+    appearance in the receipts, the last one wins (it matters for "Dark chocolate")."""
+    ids, first = np.unique(product_ids, return_index=True)
+    table = products.set_index("product_id").loc[ids].assign(first=first).sort_values("first", kind="stable")
+    return dict(zip(table["product"], table["product_category"]))
+
+
+def load_customers(path):
+    """Sorted customer ids of the loyalty customers."""
+    import pandas as pd
+
+    return np.unique(pd.read_csv(path, usecols=["customer_id"])["customer_id"].to_numpy(dtype=np.int64))
+
+
+def customer_affinity(line_customers, product_ids, product_columns, matrix, customers, categories):
+    """Arrays of customer_affinity.npz: every loyalty customer's share of lines per product (CSR rows,
+    only the products they bought) and the co-occurrence matrix of the baskets."""
+    from scipy import sparse
+
+    # P(j | i): of the baskets with i, the share that also have j
+    together = (matrix.T.astype(np.int64) @ matrix.astype(np.int64)).toarray().astype(np.float64)
+    bought = np.diag(together).copy()
+    cooccurrence = np.divide(together, bought[:, None], out=np.zeros_like(together), where=bought[:, None] > 0)
+    np.fill_diagonal(cooccurrence, 0)
+
+    # Every line counts here, single-line transactions too: a customer's usual is often one coffee
+    rows = np.searchsorted(customers, line_customers)
+    known = (rows < len(customers)) & (customers[np.minimum(rows, len(customers) - 1)] == line_customers)
+    lines = sparse.csr_matrix(
+        (np.ones(int(known.sum()), dtype=np.float64), (rows[known], product_columns[product_ids[known]])),
+        shape=(len(customers), len(PRODUCTS_TO_TAKE))
+    )
+    lines.sum_duplicates()
+    totals = np.asarray(lines.sum(axis=1)).ravel()
+    has_history = totals > 0
+    affinity = sparse.diags(1 / totals[has_history]) @ lines[has_history]
+    affinity = affinity.tocsr()
+    affinity.sort_indices()
+
+    return {
+        "products": np.array(PRODUCTS_TO_TAKE),
+        "categories": np.array([SERVED_CATEGORIES.get(categories.get(name, ""), categories.get(name, ""))
+                                for name in PRODUCTS_TO_TAKE]),
+        "cooccurrence": cooccurrence.astype(np.float32),
+        "customer_ids": customers[has_history],
+        "indptr": affinity.indptr.astype(np.int64),
+        "indices": affinity.indices.astype(np.int16),
+        "affinity": affinity.data.astype(np.float32),
+    }
+
+
+def load_segments(customers_path, generations_path):
+    """(segment names, customer ids, segment of each customer). Segments: "all", "anonymous", every
+    generation, every gender and every generation/gender pair; customers get their pair."""
+    import pandas as pd
+
+    customers = pd.read_csv(customers_path, usecols=["customer_id", "gender", "birth_year"])
+    generations = pd.read_csv(generations_path)
+    customers = customers.merge(generations, on="birth_year", how="left").sort_values("customer_id")
+    customers["generation"] = customers["generation"].fillna("Unknown")
+    customers["gender"] = customers["gender"].fillna("N")
+
+    names = list(dict.fromkeys(generations["generation"]))
+    names += [name for name in customers["generation"].unique() if name not in names]
+    genders = sorted(customers["gender"].unique())
+    segments = ["all", "anonymous", *names, *genders] + [f"{name}/{gender}" for name in names for gender in genders]
+    slots = {segment: i for i, segment in enumerate(segments)}
+    pairs = (customers["generation"] + "/" + customers["gender"]).map(slots)
+    return segments, customers["customer_id"].to_numpy(dtype=np.int64), pairs.to_numpy(dtype=np.int16)
+
+
+def popularity_cube(product_ids, outlets, hours, line_customers, products, outlet_ids, segments,
+                    customer_ids, customer_segments):
+    """Arrays of popularity_cube.npz: lines per (outlet, hour bucket, segment, product), slot 0 of the
+    first three axes being the roll-up over that axis, and the ranking of every cell."""
+    served = served_products(products)
+    names = sorted(served["product"].unique())
+    product_slots = np.full(int(served["product_id"].max()) + 1, -1, dtype=np.int64)
+    product_slots[served["product_id"].to_numpy()] = served["product"].map({n: i for i, n in enumerate(names)})
+    categories = dict(zip(served["product"], served["product_category"]))
+    category_names = sorted(set(categories.values()))
+
+    outlet_ids = np.sort(np.asarray(outlet_ids, dtype=np.int64))
+    shape = (len(outlet_ids) + 1, len(HOUR_BUCKETS) + 1, len(segments), len(names))
+
+    # Slot of every line on every axis (0 = "all"; a line outside the known outlets only counts there)
+    product = product_slots[product_ids]
+    outlet = np.searchsorted(outlet_ids, outlets) + 1
+    outlet[(outlet > len(outlet_ids)) | (outlet_ids[np.minimum(outlet, len(outlet_ids)) - 1] != outlets)] = 0
+    hour = np.searchsorted([start for start, _ in HOUR_BUCKETS], hours, side="right")
+    row = np.searchsorted(customer_ids, line_customers)
+    known = (row < len(customer_ids)) & (customer_ids[np.minimum(row, len(customer_ids) - 1)] == line_customers)
+    pair = np.where(known, customer_segments[np.minimum(row, len(customer_ids) - 1)], segments.index("anonymous"))
+    generation, gender = (np.array([segments.index(segment.split("/")[part]) if "/" in segment else -1
+                                    for segment in segments])[pair] for part in (0, 1))
+
+    # Every line counts in its own cell and in every roll-up of it
+    counts = np.zeros(int(np.prod(shape)), dtype=np.int64)
+    for o in (outlet, np.zeros_like(outlet)):
+        for h in (hour, np.zeros_like(hour)):
+            for s in (pair, generation, gender, np.zeros_like(pair)):
+                lines = s >= 0
+                cells = np.ravel_multi_index((o[lines], h[lines], s[lines], product[lines]), shape)
+                counts += np.bincount(cells, minlength=counts.size)
+    counts = counts.reshape(shape)
+
+    # Rankings: most lines first, equal counts in name order (as the csv); per category, slot 0 = all
+    product_categories = np.array([category_names.index(categories[name]) + 1 for name in names])
+    ranking = np.full((len(category_names) + 1, *shape), -1, dtype=np.int16)
+    order = np.argsort(-counts, axis=-1, kind="stable")
+    ranking[0] = order
+    for c in range(1, len(category_names) + 1):
+        members = order[np.isin(order, np.flatnonzero(product_categories == c))].reshape(*shape[:-1], -1)
+        ranking[c, ..., :members.shape[-1]] = members
+
+    return {
+        "products": np.array(names),
+        "categories": np.array([categories[name] for name in names]),
+        "category_names": np.array(category_names),
+        "outlet_ids": outlet_ids,
+        "hour_starts": np.array([start for start, _ in HOUR_BUCKETS], dtype=np.int64),
+        "hour_names": np.array([name for _, name in HOUR_BUCKETS]),
+        "segments": np.array(segments),
+        "counts": counts.astype(np.int32),
+        "ranking": ranking,
+        "customer_ids": customer_ids,
+        "customer_segments": customer_segments,
+    }
+
+
+def mine_rules(matrix, min_support=0.05, min_lift=1.0, engine="bitset", workers=None):
+    if engine == "bitset":
+        import bitset_miner
+
+        return bitset_miner.mine_rules(matrix, PRODUCTS_TO_TAKE, min_support, min_lift, workers)
+    if engine != "mlxtend":
+        raise ValueError(f"Unknown rule mining engine '{engine}' (expected 'bitset' or 'mlxtend')")
+
+    import pandas as pd
+    from mlxtend.frequent_patterns import apriori, association_rules
+
+    baskets = pd.DataFrame.sparse.from_spmatrix(matrix, columns=PRODUCTS_TO_TAKE)
+    frequent = apriori(baskets, min_support=min_support, use_colnames=True)
+    if frequent.empty:
+        return frequent
+    return association_rules(frequent, num_itemsets=matrix.shape[0], metric="lift", min_threshold=min_lift)
+
+
+def recommendations_json(rules, categories):
+    """{antecedent: [{"product", "product_category", "confidence"}, ...]}, best confidence first, each product once."""
+    recommendations = {}
+    if rules.empty:
+        return recommendations
+    rules = rules.assign(
+        key=rules["antecedents"].map(lambda items: "_".join(sorted(items))),
+        names=rules["consequents"].map(lambda items: "_".join(sorted(items))),
+    )
+    # Equal confidences in name order, so the same data always gives the same file
+    rules = rules.sort_values(["key", "confidence", "names"], ascending=[True, False, True], kind="stable")
+    for key, group in rules.groupby("key", sort=False):
+        seen = {}
+        for consequents, confidence in zip(group["consequents"], group["confidence"]):
+            for product in sorted(consequents):
+                seen.setdefault(product, float(confidence))
+        recommendations[key] = [
+            {"product": product, "product_category": categories[product], "confidence": confidence}
+            for product, confidence in seen.items()
+        ]
+    return recommendations
+
+
+def receipts_files(data_dir, receipts=None):
+    return [pathlib.Path(path) for path in receipts] if receipts else [pathlib.Path(data_dir) / RECEIPTS_FILE]
+
+
+def train(data_dir, min_support=0.05, min_lift=1.0, chunksize=100_000, stages=None,
+          receipts=None, engine="bitset", workers=None):
+    stages = stages or Stages()
+    data_dir = pathlib.Path(data_dir)
+
+    with stages.stage("load products"):
+        products, product_columns = load_products(data_dir / PRODUCTS_FILE)
+    with stages.stage("stream receipts"):
+        keys, line_customers, product_ids, outlets, hours = read_lines(
+            receipts_files(data_dir, receipts), product_columns, chunksize
+        )
+    with stages.stage("basket matrix"):
+        matrix, valid = basket_matrix(keys, product_ids, product_columns)
+        counted = product_ids[valid]
+    with stages.stage("popularity"):
+        popular = popularity(counted, products)
+    with stages.stage("popularity cube"):
+        import pandas as pd
+
+        cube = popularity_cube(
+            counted, outlets[valid], hours[valid], line_customers[valid], products,
+            pd.read_csv(data_dir / OUTLETS_FILE, usecols=["sales_outlet_id"])["sales_outlet_id"].to_numpy(),
+            *load_segments(data_dir / CUSTOMERS_FILE, data_dir / GENERATIONS_FILE)
+        )
+    with stages.stage(f"rules ({engine})"):
+        rules = mine_rules(matrix, min_support, min_lift, engine, workers)
+    with stages.stage("recommendations"):
+        categories = rule_categories(counted, products)
+        apriori_json = recommendations_json(rules, categories)
+    with stages.stage("customer affinity"):
+        customers = customer_affinity(line_customers, product_ids, product_columns, matrix,
+                                      load_customers(data_dir / CUSTOMERS_FILE), categories)
+
+    counts = {"lines": int(len(keys)), "transactions": int(matrix.shape[0]), "rules": int(len(rules)),
+              "products": len(popular), "basket_nonzeros": int(matrix.nnz),
+              "customers": int(len(customers["customer_ids"])), "customer_nonzeros": int(len(customers["indices"])),
+              "cube_cells": int(np.prod(cube["counts"].shape[:-1]))}
+    return apriori_json, popular, customers, cube, counts, stages
+
+
+# ---------------------------
+# Artifacts
+# ---------------------------
+def version_of(data_dir, params, receipts=None):
+    paths = receipts_files(data_dir, receipts) + [
+        pathlib.Path(data_dir) / name for name in (PRODUCTS_FILE, CUSTOMERS_FILE, GENERATIONS_FILE, OUTLETS_FILE)
+    ]
+    inputs = {path.name: sha256_file(path) for path in paths}
+    digest = hashlib.sha256(json.dumps({"inputs": inputs, "params": params}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12], inputs
+
+
+def write_version(out_dir, version, apriori_json, popular, customers, cube, manifest):
+    """Write into a temporary folder and rename it into place, so a version is complete or absent."""
+    target = pathlib.Path(out_dir) / "versions" / version
+    tmp = target.with_name(f"{version}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    with open(tmp / APRIORI_FILE, "w") as f:
+        json.dump(apriori_json, f)
+    popular.to_csv(tmp / POPULARITY_FILE, index=False)
+    np.savez(tmp / CUSTOMER_FILE, **customers)
+    np.savez(tmp / CUBE_FILE, **cube)
+    manifest["artifacts"] = {name: sha256_file(tmp / name) for name in ARTIFACTS}
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def promote(version_dir, out_dir):
+    for name in ARTIFACTS:
+        tmp = pathlib.Path(out_dir) / f"{name}.{os.getpid()}.tmp"
+        shutil.copyfile(pathlib.Path(version_dir) / name, tmp)
+        os.replace(tmp, pathlib.Path(out_dir) / name)
+    (pathlib.Path(out_dir) / "versions" / "CURRENT").write_text(pathlib.Path(version_dir).name + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="product.csv (and the April receipts)")
+    parser.add_argument("--receipts", nargs="+", help="receipt files to train on (default: the April receipts)")
+    parser.add_argument("--engine", choices=("bitset", "mlxtend"), default="bitset")
+    parser.add_argument("--workers", type=int, help="processes for the bitset engine (default: one per shard, up to the CPUs)")
+    parser.add_argument("--out", default=str(DEFAULT_OUT_DIR))
+    parser.add_argument("--min-support", type=float, default=0.05)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--chunksize", type=int, default=100_000, help="receipt lines per chunk")
+    parser.add_argument("--no-promote", action="store_true", help="don't replace the artifacts the API loads")
+    args = parser.parse_args()
+
+    # Imported up front so the stage timings don't include them
+    import mlxtend
+    import mlxtend.frequent_patterns
+    import pandas as pd
+    import scipy
+    import scipy.sparse
+
+    params = {"min_support": args.min_support, "min_lift": args.min_lift, "min_lines": 2, "products": PRODUCTS_TO_TAKE,
+              "engine": args.engine, "max_itemset": 3 if args.engine == "bitset" else None}
+    version, inputs = version_of(args.data_dir, params, args.receipts)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    apriori_json, popular, customers, cube, counts, stages = train(
+        args.data_dir, args.min_support, args.min_lift, args.chunksize,
+        receipts=args.receipts, engine=args.engine, workers=args.workers
+    )
+    seconds = time.perf_counter() - start
+    stages.report(f"Trained in {seconds:.2f}s: {counts['lines']} lines, {counts['transactions']} transactions, "
+                  f"{counts['rules']} rules, {counts['customers']} customers")
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "inputs": inputs,
+        "params": params,
+        "counts": counts,
+        "timings": stages.results,
+        "total_seconds": round(seconds, 4),
+        "libraries": {"numpy": np.__version__, "pandas": pd.__version__, "scipy": scipy.__version__,
+                      "mlxtend": mlxtend.__version__},
+    }
+
+    tracemalloc.stop()
+
+    target = write_version(args.out, version, apriori_json, popular, customers, cube, manifest)
+    print(f"Version {version} in {target}")
+    if not args.no_promote:
+        promote(target, args.out)
+        print(f"Promoted to {args.out}")
+
+
+if __name__ == "__main__":
+    main()